@@ -0,0 +1,250 @@
+##
+#  This module checks the chore log updates as they are made.
+#
+#  An AnomalyDetector installed as Household.log_validator sees every
+#  update_log call before it is applied and finds the updates which look
+#  wrong:
+#    - a number of chores outside MINIMUM_CHORES_DONE..MAXIMUM_CHORES_DONE,
+#      such as a negative number;
+#    - more completions of a chore in the last week than FREQUENCY_FACTOR
+#      times its weekly frequency;
+#    - more than BURST_LIMIT submissions by a participant within
+#      BURST_WINDOW seconds;
+#    - a number far from the numbers the participant usually logs, measured
+#      in standard deviations of an exponentially weighted average.
+#
+#  In QUARANTINE mode the updates which look wrong are not applied but kept
+#  in the quarantine queue, from which they can be released or discarded;
+#  in FLAG mode they are applied and recorded in flags.  Each queue keeps
+#  at most queue_size anomalies: a quarantined update pushed out of a full
+#  queue is counted in overflowed, the flags only keep the latest ones
+#  since their updates were applied anyway.  The statistics are kept in a
+#  fixed number of time buckets per participant and chore, for at most
+#  MAXIMUM_TRACKED participants, so each check costs O(1) and the memory
+#  used is bounded.
+
+import math
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from household_module import Household
+
+
+FLAG = "flag"
+QUARANTINE = "quarantine"
+
+OUT_OF_RANGE = "out of range"
+ABOVE_FREQUENCY = "above frequency"
+BURST = "burst"
+OUTLIER = "outlier"
+
+## An update which looked wrong.
+#  reasons is a tuple of the reasons above, when the time it was made.
+Anomaly = namedtuple("Anomaly", ["household", "household_name", "participant", "chore",
+                                 "number_completed", "reasons", "when"])
+
+
+class SlidingWindowCounter() :
+
+    __slots__ = ("span", "counts", "periods")
+
+    ## Constructor for a counter of what happened in the last `window`
+    #  seconds, kept in `buckets` buckets.
+    #
+    def __init__(self, window, buckets) :
+        self.span = window / buckets
+        self.counts = [0] * buckets
+        self.periods = [-1] * buckets
+
+    def add(self, now, amount=1) :
+        period = int(now // self.span)
+        i = period % len(self.counts)
+        if self.periods[i] != period :
+            self.periods[i] = period
+            self.counts[i] = 0
+        self.counts[i] += amount
+
+    def total(self, now) :
+        oldest = int(now // self.span) - len(self.counts)
+        return sum(count for (count, period) in zip(self.counts, self.periods)
+                   if period > oldest)
+
+
+class ParticipantStatistics() :
+
+    __slots__ = ("submissions", "chores", "mean", "variance", "samples")
+
+    def __init__(self, burst_window, burst_buckets) :
+        self.submissions = SlidingWindowCounter(burst_window, burst_buckets)
+        self.chores = {}        # chore name -> SlidingWindowCounter of completions
+        self.mean = 0.0         # Exponentially weighted mean of the numbers logged
+        self.variance = 0.0
+        self.samples = 0
+
+
+class AnomalyDetector() :
+
+    WEEK = 7 * 24 * 3600
+    FREQUENCY_FACTOR = 3        # Completions per week allowed, times the frequency
+    BURST_WINDOW = 60           # Seconds
+    BURST_LIMIT = 20            # Submissions allowed per BURST_WINDOW
+    OUTLIER_DEVIATIONS = 4      # Standard deviations from the mean allowed
+    WARM_UP = 10                # Numbers logged before outliers are looked for
+    SMOOTHING = 0.1             # Weight of a new number in the average
+    MAXIMUM_TRACKED = 100000    # Participants whose statistics are kept
+    QUARANTINE_SIZE = 10000     # Anomalies kept
+
+    ## Constructor for the detector.
+    #  @param mode QUARANTINE or FLAG
+    #  @param clock a function returning the time in seconds
+    #
+    def __init__(self, mode=QUARANTINE, clock=time.time, max_tracked=MAXIMUM_TRACKED,
+                 queue_size=QUARANTINE_SIZE) :
+        if mode not in (FLAG, QUARANTINE) :
+            raise ValueError("mode must be {!r} or {!r}".format(FLAG, QUARANTINE))
+        self.mode = mode
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._statistics = OrderedDict()    # (household, participant) -> ParticipantStatistics
+        self.quarantine = deque(maxlen=queue_size)  # Anomaly held back, not applied
+        self.flags = deque(maxlen=queue_size)       # Anomaly applied
+        self.checked = 0
+        self.flagged = 0
+        self.quarantined = 0
+        self.overflowed = 0     # Quarantined updates pushed out of a full queue
+
+    ## Check an update before it is applied. Called by Household.update_log
+    #  for a participant and chore of the household, and by
+    #  CoalescingLogBuffer for each increment it takes.
+    #  @return True to apply the update, False if it is quarantined
+    #
+    def admit(self, household, name, chore, number_completed) :
+        self.checked += 1
+        now = self._clock()
+        statistics = self._participant(household, name)
+        statistics.submissions.add(now)
+        reasons = self._reasons(household, statistics, chore, number_completed, now)
+        if not reasons :
+            self._learn(statistics, chore, number_completed, now)
+            return True
+
+        anomaly = Anomaly(household, household.household_name, name, chore,
+                          number_completed, tuple(reasons), now)
+        if self.mode == FLAG :
+            self.flags.append(anomaly)
+            self.flagged += 1
+            self._learn(statistics, chore, number_completed, now)
+            return True
+        if len(self.quarantine) == self.quarantine.maxlen :
+            self.overflowed += 1
+        self.quarantine.append(anomaly)
+        self.quarantined += 1
+        return False
+
+    ## Apply a quarantined update after all and remove it from the queue.
+    #
+    def release(self, anomaly) :
+        self.quarantine.remove(anomaly)
+        anomaly.household.update_log(anomaly.participant, anomaly.chore,
+                                     anomaly.number_completed, validate=False)
+
+    ## Remove a quarantined update from the queue without applying it.
+    #
+    def discard(self, anomaly) :
+        self.quarantine.remove(anomaly)
+
+    def _reasons(self, household, statistics, chore, number_completed, now) :
+        reasons = []
+        if not Household.MINIMUM_CHORES_DONE <= number_completed <= Household.MAXIMUM_CHORES_DONE :
+            reasons.append(OUT_OF_RANGE)
+        frequency = self._frequency(household, chore)
+        done = statistics.chores.get(chore)
+        if frequency is not None and number_completed > 0 and \
+                (0 if done is None else done.total(now)) + number_completed \
+                > self.FREQUENCY_FACTOR * frequency :
+            reasons.append(ABOVE_FREQUENCY)
+        if statistics.submissions.total(now) > self.BURST_LIMIT :
+            reasons.append(BURST)
+        if statistics.samples >= self.WARM_UP :
+            deviation = math.sqrt(statistics.variance)
+            if abs(number_completed - statistics.mean) > \
+                    self.OUTLIER_DEVIATIONS * max(deviation, 1.0) :
+                reasons.append(OUTLIER)
+        return reasons
+
+    def _learn(self, statistics, chore, number_completed, now) :
+        done = statistics.chores.get(chore)
+        if done is None :
+            done = statistics.chores[chore] = SlidingWindowCounter(self.WEEK, 7)
+        done.add(now, number_completed)
+        if statistics.samples == 0 :
+            statistics.mean = float(number_completed)
+        else :
+            difference = number_completed - statistics.mean
+            statistics.mean += self.SMOOTHING * difference
+            statistics.variance = (1 - self.SMOOTHING) * \
+                (statistics.variance + self.SMOOTHING * difference * difference)
+        statistics.samples += 1
+
+    def _participant(self, household, name) :
+        key = (household.household_name, name)
+        statistics = self._statistics.get(key)
+        if statistics is None :
+            statistics = ParticipantStatistics(self.BURST_WINDOW, 6)
+            self._statistics[key] = statistics
+            if len(self._statistics) > self.max_tracked :
+                self._statistics.popitem(last=False)
+        else :
+            self._statistics.move_to_end(key)
+        return statistics
+
+    def _frequency(self, household, chore) :
+        for the_chore in household.chores.chores :
+            if the_chore.chore_name == chore :
+                return the_chore.frequency
+        return None
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    from chore_list_module import Chore
+
+    now = [0.0]
+    detector = AnomalyDetector(clock=lambda: now[0])
+    Household.log_validator = detector
+    h = Household("House1", {"personA","personB"}, {Chore("wash up", 7), Chore("dusting",1)})
+
+    print("Test 1: Log a negative number and too many dustings")
+    h.update_log("personA", "wash up", -5)
+    h.update_log("personA", "dusting", 2)
+    h.update_log("personA", "dusting", 2)
+    print("\tVALID: ", h.chore_log_string())
+    print("\tVALID: ", [(a.participant, a.chore, a.number_completed, a.reasons)
+                        for a in detector.quarantine])
+
+    print("\nTest 2: A burst of submissions")
+    for i in range(25) :
+        now[0] += 1
+        h.update_log("personB", "wash up", 1)
+    print("\tVALID: ", h.chore_log_string(), detector.quarantined)
+
+    print("\nTest 3: Release a quarantined update")
+    detector.release(detector.quarantine[0])
+    detector.discard(detector.quarantine[0])
+    print("\tVALID: ", h.chore_log_string(), len(detector.quarantine))
+
+    print("\nTest 4: Flag the updates instead, with a queue of 2")
+    detector = AnomalyDetector(mode=FLAG, clock=lambda: now[0], queue_size=2)
+    Household.log_validator = detector
+    for i in range(5) :
+        h.update_log("personA", "dusting", 2)
+    print("\tVALID: ", h.chore_log_string(), detector.flagged, len(detector.flags),
+          len(detector.quarantine))
+
+    Household.log_validator = None
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,52 @@
 #
 #  Author: zhikangChen
 #  Date: March 2019
+#
+#  Set CHORECHART_DB to the name of an SQLite database file to keep the
+#  households in it between runs; they are then loaded when they are used
+#  and the leaderboard is computed by the database.
+#  Set CHORECHART_CACHE to the name of a dbm file to keep only the
+#  CHORECHART_CACHE_SIZE most recently used households in memory.
+#  Set CHORECHART_REPLICATION_PORT to replicate the households to followers
+#  (see replication_module).
+
+import os
 
 from household_module import Household
 from chore_list_module import ChoresList, Chore
 from participants_list_module import Participants
+from household_events_module import ChangeFeed, household_created
+import instrumentation_module
+import report_module
+from sqlite_store_module import SQLiteHouseholdStore, StoredHouseholds
+from search_module import SearchIndex
+from tiered_store_module import TieredHouseholdStore
+from anomaly_module import AnomalyDetector, FLAG
+from replication_module import ReplicationLeader
+from instrumentation_module import instrument
 
 ## Constants used for validation
 
 MENU_CHOICES = ['A', 'C', 'V', 'L', 'S', 'Q']
 
+LISTING_LIMIT = 20  # Above this many households, they are found by name
+                    # instead of being listed
+
+## Change feed shared by all the households of the application.
+# Subscribe to it to be told about new households, logged chores and
+# membership changes.
+change_feed = ChangeFeed()
+Household.change_feed = change_feed
+
+## Search index of the household, participant and chore names.
+search_index = SearchIndex()
+search_index.attach(change_feed)
+
+## Flags the chore log updates which look wrong (see anomaly_module).  They
+#  are still applied: the menus have no way to review held back updates.
+anomaly_detector = AnomalyDetector(mode=FLAG)
+Household.log_validator = anomaly_detector
+
 ## Prints the menu for the application. 
 #
 def print_menu():
@@ -29,6 +66,7 @@ def print_menu():
 ## Prints a description of the application. 
 #
 #
+@instrument("about")
 def about() :
     about_string = ("\n\nWelcome to Chore Chart. "
                    "Chore Chart helps housemates (people sharing a house) "
@@ -42,6 +80,7 @@ def about() :
 #   @param all_households a list of household objects
 #
 #
+@instrument("create_household")
 def create_household(all_households) :
     new_household_name = get_household_name()
     found = False
@@ -52,6 +91,8 @@ def create_household(all_households) :
         chores_set = get_chores()
         household_obj = Household(new_household_name, members_set, chores_set)
         all_households.append(household_obj)
+        change_feed.publish(household_created(household_obj))
+        change_feed.flush()
 
         # print(all_households)
     else:
@@ -67,7 +108,11 @@ def create_household(all_households) :
 #   @return the household object if the household exists and None if it does not.
 #
 #
+@instrument("household_exists")
 def household_exists(new_household_name, all_households) :
+    if isinstance(all_households, (TieredHouseholdStore, StoredHouseholds)) :
+        return all_households.get(new_household_name)
+
     h_obj = None
 
     for household in all_households :
@@ -282,40 +327,28 @@ def is_blank(any_string):
 ##  View household.
 # @param all_households, a list of household objects
 #
+@instrument("view_household")
 def view_household(all_households):
-
-    # print("Not implemented yet")
-    for household in all_households:
-        print('View Household:')
-        print(household.household_name)
-        print('Participants:')
-        # print('\t',household.participants)
-        for par in household.participants.participants:
-            print('\t',par)
-        print('weekly chroes:')
-
-        print('\t',household.chores)
-        # participants = household.participants
-        # print(type(participants))
-        # for participant in participants:
-        #     print(participant)
-        # chores = household.chores
-        # for chore in chores:
-        #     print(chore.chore_name,chore.frequency)
+    report_module.write_view(all_households)
     return
 def view_participants(participants):
-    for participant in participants:
-        print(participants.index(participant),participant)
+    for (index, participant) in enumerate(participants):
+        print(index,participant)
 
 def view_chores(chores):
-    for chore in chores:
-        print(chores.index(chore),chore)
+    for (index, chore) in enumerate(chores):
+        print(index,chore)
 def view_all_household(all_households):
-    for household in all_households:
-        print(all_households.index(household),household.household_name,'\n')
+    if len(all_households) > LISTING_LIMIT:
+        print("There are {} households, type the start of a household name to find it."
+              .format(len(all_households)))
+        return
+    for (index, household) in enumerate(all_households):
+        print(index,household.household_name,'\n')
 ##  Log chores.
 # @param all_households, a list of household objects
 #
+@instrument("log_chores")
 def log_chores(all_households):
     view_all_household(all_households)
     index_of_household = choose_household(all_households)
@@ -337,7 +370,13 @@ def log_chores(all_households):
 
     number_completed = get_number_completed()
 
-    the_household.update_log(the_participant,the_chore,number_completed)
+    flagged = anomaly_detector.flagged
+    if not the_household.update_log(the_participant,the_chore,number_completed):
+        print("This update looks wrong ({}), it has been held back for review."
+              .format(", ".join(anomaly_detector.quarantine[-1].reasons)))
+    elif anomaly_detector.flagged > flagged:
+        print("This update looks unusual ({}), it has been logged and flagged."
+              .format(", ".join(anomaly_detector.flags[-1].reasons)))
 
 
     # print("Not implemented yet.")
@@ -386,30 +425,51 @@ def choose_household(all_households):
     valid = False
     index = -1
     while not valid:
-        index_str = input("input the index of household: ")
+        index_str = input("input the index or the name of household: ")
         try:
             index = int(index_str)
-        except Exception as err:
-            print(err)
+        except ValueError:
+            index = find_household(index_str, all_households)
         if index < len(all_households) and index >=0:
             valid = True
         else:
             print('you choose nothing ,repeat ')
     return index
 
-##  Show the leaderboard for a house.
-# @param all_households, a list of household objects
+##  Finds a household by name using the search index, which also gives its
+#   position, so the cost depends on the length of the query and not on the
+#   number of households.
+#   Prints the closest names if the name does not match exactly one household.
 #
-def show_leaderboard(all_households):
-    print("Leaderboard:\n")
-    for household in all_households:
-        print(household.household_name,": \n")
-        log = household.chore_log
-        for (per, dic) in log.items():
-            print('\t',per, " :")
-            for (chr, num) in dic.items():
-                print('\t\t',chr, '   (',str(num),')')
+#   @param query the name, or the start of the name, typed by the user
+#   @param all_households a list of household objects
+#   @return the index of the household in all_households, -1 if not found.
+#
+def find_household(query, all_households):
+    matches = search_index.search(SearchIndex.HOUSEHOLDS, query.strip(), LISTING_LIMIT)
+    names = [name for (name, households) in matches]
+    if query.strip() in names:
+        names = [query.strip()]
+    if len(names) == 1:
+        position = search_index.position(names[0])
+        if position is not None:
+            return position
+    elif len(names) > 1:
+        print("Matching households: " + ", ".join(names))
+    return -1
 
+##  Show the leaderboard for a house.
+# @param all_households, a list of household objects
+# @param store the SQLiteHouseholdStore which ranks the participants, None
+#        to list the chore log of every household
+#
+@instrument("show_leaderboard")
+def show_leaderboard(all_households, store=None):
+    if store is not None:
+        store.sync()
+        report_module.write_ranking(store.leaderboard())
+        return
+    report_module.write_leaderboard(all_households)
     return 
 
 
@@ -434,6 +494,35 @@ def main() :
     
     all_households = []   
     option = '*'
+
+    store = None
+    if os.environ.get("CHORECHART_DB") :
+        store = SQLiteHouseholdStore(os.environ["CHORECHART_DB"])
+        store.attach(change_feed)
+        all_households = StoredHouseholds(store)
+
+    cache = None
+    if os.environ.get("CHORECHART_CACHE") :
+        cache = TieredHouseholdStore(os.environ["CHORECHART_CACHE"],
+                                     int(os.environ.get("CHORECHART_CACHE_SIZE",
+                                                        TieredHouseholdStore.CAPACITY)))
+        if len(cache) == 0 :
+            for household in all_households :
+                cache.append(household)
+        cache.attach(change_feed)
+        all_households = cache
+
+    for household in all_households :
+        search_index.add_household(household)
+
+    leader = None
+    if os.environ.get("CHORECHART_REPLICATION_PORT") :
+        leader = ReplicationLeader("127.0.0.1", int(os.environ["CHORECHART_REPLICATION_PORT"]))
+        # The leader keeps its own copy of every household, so replicating
+        # costs the memory CHORECHART_DB and CHORECHART_CACHE save.
+        for household in all_households :
+            leader.add_household(household)
+        leader.attach(change_feed)
     
     while option != 'Q':
         option = get_option()        
@@ -446,9 +535,17 @@ def main() :
         elif option == 'L':
             log_chores(all_households)
         elif option == 'S':
-            show_leaderboard(all_households)
+            show_leaderboard(all_households, store)
             # print("\n\tNot implemented yet.\n")
-
+        change_feed.flush()
+
+    if store is not None :
+        store.close()
+    if cache is not None :
+        cache.close()
+    if leader is not None :
+        leader.close()
+    instrumentation_module.export_snapshot()
     print("\n\nBye, bye.")
 
         
@@ -1,9 +1,15 @@
+import weakref
+
+from instrumentation_module import instrument
+
 class ChoresList() :
     
     MINIMUM_NUMBER_OF_CHORES = 2
     MAXIMUM_NUMBER_OF_CHORES = 5
 
     def __init__(self, the_chores) :
+        self._owners = weakref.WeakSet()    # Objects whose string includes this one
+        self._string = None                 # Cached string, None when out of date
         self.chores = the_chores
 
     ## Return the chores attribute.
@@ -21,21 +27,26 @@ class ChoresList() :
     def chores(self, the_chores) :
         try :
             self.valid_chores(the_chores)
-            self._chores = the_chores
         except ValueError as err :
             raise
+        for chore in getattr(self, "_chores", ()) :
+            chore._owners.discard(self)
+        for chore in the_chores :
+            chore._owners.add(self)
+        self._chores = the_chores
+        self._changed()
 
     def __str__(self):
-        length = len(self.chores)
-        i = 1
-        chore_string = ""
-        for chore in self.chores :
-            chore_string = chore_string + str(chore)
-            if i < length :
-                chore_string = chore_string + ", "
-            i = i + 1
-            
-        return chore_string
+        if self._string is None :
+            self._string = ", ".join([str(chore) for chore in self.chores])
+        return self._string
+
+    ## Forget the cached string of this object and of its owners.
+    #
+    def _changed(self) :
+        self._string = None
+        for owner in list(self._owners) :
+            owner._changed()
 
     ## Check whether a chore name exists in the set of chores.
     #
@@ -58,6 +69,7 @@ class ChoresList() :
     #         and raise exception if it does not.
     #
     @staticmethod
+    @instrument("ChoresList.valid_chores")
     def valid_chores(the_chores) :
         # check that the_chores is a set
         if not isinstance(the_chores, set) :
@@ -127,6 +139,8 @@ class Chore():
     MAXIMUM_CHORE_FREQUENCY = 20
 
     def __init__(self, the_chore_name, the_frequency) :
+        self._owners = weakref.WeakSet()    # ChoresList objects containing this chore
+        self._string = None                 # Cached string, None when out of date
         self.chore_name = the_chore_name
         self.frequency = the_frequency
 
@@ -146,6 +160,7 @@ class Chore():
             self._chore_name = the_chore_name
         except ValueError as err :
             raise 
+        self._changed()
 
     ## Return the chore frequency.
     #          
@@ -163,6 +178,7 @@ class Chore():
             self._frequency = the_frequency
         except ValueError as err :
             raise 
+        self._changed()
 
 
     def __eq__(self, otherChore):
@@ -177,7 +193,17 @@ class Chore():
 
 
     def __str__(self):          
-        return self.chore_name +  " (" + str(self.frequency) + ")"
+        if self._string is None :
+            self._string = self.chore_name +  " (" + str(self.frequency) + ")"
+        return self._string
+
+
+    ## Forget the cached string of this chore and of the lists containing it.
+    #
+    def _changed(self) :
+        self._string = None
+        for owner in list(self._owners) :
+            owner._changed()
 
 
     ## Check the name contains only alphanumeric characters and check that it is the right length.
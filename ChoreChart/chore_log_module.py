@@ -0,0 +1,97 @@
+##
+#  Read-only views used by a Household when its chore log is kept sparse.
+#
+#  A sparse chore log only stores the (participant, chore) pairs that have
+#  been logged at least once.  The views below present that storage with the
+#  same interface as the dense log, reporting zero for the missing pairs:
+#
+#  {"fred" : {"chore1": 0, "chore2": 3}, walt : {"chore1": 0, "chore2": 0}}
+#
+#  It also defines the snapshot returned by Household.snapshot().
+
+from collections.abc import Mapping
+from types import MappingProxyType
+
+
+class SparseChoreLog(Mapping) :
+
+    ## Constructor for the view over the whole log.
+    #  @param the_rows a dictionary participant -> {chore name: count}
+    #         containing only the pairs that have been logged
+    #  @param the_participants a list of the participants' names
+    #  @param the_chore_names a list of the chore names
+    #
+    def __init__(self, the_rows, the_participants, the_chore_names) :
+        self._rows = the_rows
+        self._participants = the_participants
+        self._chore_names = the_chore_names
+
+    def __getitem__(self, name) :
+        if name not in self._participants :
+            raise KeyError(name)
+        return SparseChoreRow(self._rows.get(name, {}), self._chore_names)
+
+    def __iter__(self) :
+        return iter(self._participants)
+
+    def __len__(self) :
+        return len(self._participants)
+
+    def __str__(self) :
+        return str({name: dict(row) for (name, row) in self.items()})
+
+
+class SparseChoreRow(Mapping) :
+
+    ## Constructor for the view over one participant's counts.
+    #  @param the_row a dictionary chore name -> count for the logged chores
+    #  @param the_chore_names a list of the chore names
+    #
+    def __init__(self, the_row, the_chore_names) :
+        self._row = the_row
+        self._chore_names = the_chore_names
+
+    def __getitem__(self, chore) :
+        if chore not in self._chore_names :
+            raise KeyError(chore)
+        return self._row.get(chore, 0)
+
+    def __iter__(self) :
+        return iter(self._chore_names)
+
+    def __len__(self) :
+        return len(self._chore_names)
+
+    def __str__(self) :
+        return str(dict(self))
+
+
+class ChoreLogSnapshot(Mapping) :
+
+    ## Constructor for a point-in-time view of a household's chore log.
+    #  The household copies the parts of the log it changes after the
+    #  snapshot is taken, so the log passed in here is never modified.
+    #
+    #  @param the_household_name a string containing the household name
+    #  @param the_version the version of the chore log
+    #  @param the_log the chore log (a dictionary or a SparseChoreLog)
+    #
+    def __init__(self, the_household_name, the_version, the_log) :
+        self.household_name = the_household_name
+        self.version = the_version
+        self._log = the_log
+
+    def __getitem__(self, name) :
+        chores = self._log[name]
+        if isinstance(chores, dict) :
+            chores = MappingProxyType(chores)
+        return chores
+
+    def __iter__(self) :
+        return iter(self._log)
+
+    def __len__(self) :
+        return len(self._log)
+
+    def __str__(self) :
+        return str({name: dict(chores) for (name, chores) in self.items()})
@@ -0,0 +1,239 @@
+##
+#  This module keeps time-decayed scores of the participants and households.
+#
+#  A chore done now counts fully and its points halve every half-life, so
+#  the leaderboard shows who has been doing the chores lately instead of
+#  who did the most since the household was created.  Each completion of a
+#  chore is worth 1 / frequency points, so doing every chore as often as it
+#  is due earns the same points for every chore.
+#
+#  Decaying every score at every tick would touch all the scores.  Instead
+#  the scores are kept decayed to a fixed origin: a completion at time t
+#  adds weight * e^(rate * (t - origin)), and the score at time now is that
+#  sum times e^(-rate * (now - origin)).  The factor is the same for every
+#  score, so an update touches one score and the order of the scores never
+#  changes as time passes.  The sums grow exponentially, so they are kept
+#  as logarithms.
+#
+#  The scores are ranked with a heap.  Scores only grow, so an update pushes
+#  the new score and leaves the old entry in the heap, where it is skipped
+#  and dropped when found.
+
+import heapq
+import math
+import time
+
+import household_events_module as events
+
+
+## Return log(e^a + e^b) without overflowing.
+#
+def log_add(a, b) :
+    if a == -math.inf :
+        return b
+    if b == -math.inf :
+        return a
+    if a < b :
+        (a, b) = (b, a)
+    return a + math.log1p(math.exp(b - a))
+
+
+class DecayedRanking() :
+
+    ## Constructor for an empty ranking.
+    #  Scores are the logarithms of the sums decayed to the origin.
+    #
+    def __init__(self) :
+        self._scores = {}   # key -> log score
+        self._heap = []     # (-log score, key), including outdated entries
+
+    def __len__(self) :
+        return len(self._scores)
+
+    def __contains__(self, key) :
+        return key in self._scores
+
+    ## Return the log score of a key, -inf if it has none.
+    #
+    def get(self, key) :
+        return self._scores.get(key, -math.inf)
+
+    ## Add to the score of a key.
+    #  @param log_weight the logarithm of the points added
+    #
+    def add(self, key, log_weight) :
+        score = log_add(self._scores.get(key, -math.inf), log_weight)
+        self._set(key, score)
+
+    ## Remove a key.
+    #  @return the log score of the key, -inf if it had none
+    #
+    def remove(self, key) :
+        return self._scores.pop(key, -math.inf)
+
+    ## Return the keys with the highest scores.
+    #  @return a list of (log score, key), highest first
+    #
+    def top(self, limit=10) :
+        found = []
+        while self._heap and len(found) < limit :
+            (negative_score, key) = heapq.heappop(self._heap)
+            if self._scores.get(key) == -negative_score and \
+                    (not found or found[-1][1] != key) :
+                found.append((-negative_score, key))
+        for (score, key) in found :
+            heapq.heappush(self._heap, (-score, key))
+        return found
+
+    def _set(self, key, score) :
+        self._scores[key] = score
+        heapq.heappush(self._heap, (-score, key))
+        if len(self._heap) > 2 * len(self._scores) + 16 :
+            self._heap = [(-score, key) for (key, score) in self._scores.items()]
+            heapq.heapify(self._heap)
+
+
+class DecayedScores() :
+
+    HALF_LIFE = 7 * 24 * 3600   # Seconds after which points are worth half
+
+    ## Constructor for empty scores.
+    #  @param half_life the number of seconds after which points are worth half
+    #  @param clock a function returning the time in seconds
+    #
+    def __init__(self, half_life=HALF_LIFE, clock=time.time) :
+        if half_life <= 0 :
+            raise ValueError("half_life must be positive")
+        self.rate = math.log(2) / half_life
+        self._clock = clock
+        self._origin = clock()
+        self.participants = DecayedRanking()    # (household name, participant) -> log score
+        self.households = DecayedRanking()      # household name -> log score
+        self._members = {}                      # household name -> set of participants
+
+    ## Follow a change feed.
+    #  @param the_feed a ChangeFeed
+    #
+    def attach(self, the_feed) :
+        return the_feed.subscribe(self.apply_events, (events.LogIncremented,
+                                                      events.HouseholdRenamed,
+                                                      events.MembershipChanged))
+
+    ## Apply a batch of events from a change feed. The chores are taken to be
+    #  done when the batch is applied.
+    #
+    def apply_events(self, batch) :
+        for event in batch :
+            if isinstance(event, events.LogIncremented) :
+                frequencies = {chore.chore_name: chore.frequency
+                               for chore in event.household.chores.chores}
+                frequency = frequencies.get(event.chore, 1)
+                self.record(event.household_name, event.participant,
+                            event.number_completed / frequency)
+            elif isinstance(event, events.HouseholdRenamed) :
+                self.rename_household(event.old_name, event.household_name)
+            elif isinstance(event, events.MembershipChanged) and \
+                    event.kind == events.MEMBERSHIP_PARTICIPANT_REMOVED :
+                self.remove_participant(event.household_name, event.name)
+
+    ## Add points to a participant.
+    #  @param points the points earned, ignored unless positive
+    #  @param when the time the points were earned, now by default
+    #
+    def record(self, household_name, participant, points, when=None) :
+        if points <= 0 :
+            return
+        if when is None :
+            when = self._clock()
+        log_weight = math.log(points) + self.rate * (when - self._origin)
+        self.participants.add((household_name, participant), log_weight)
+        self.households.add(household_name, log_weight)
+        self._members.setdefault(household_name, set()).add(participant)
+
+    ## Return the current score of a participant, or of a household if the
+    #  participant is None.
+    #
+    def score(self, household_name, participant=None) :
+        if participant is None :
+            return self._decay(self.households.get(household_name))
+        return self._decay(self.participants.get((household_name, participant)))
+
+    ## Return the participants with the highest scores in all the households.
+    #  @return a list of (score, household name, participant)
+    #
+    def top_participants(self, limit=10) :
+        return [(self._decay(score), household_name, participant)
+                for (score, (household_name, participant)) in self.participants.top(limit)]
+
+    ## Return the households with the highest scores.
+    #  @return a list of (score, household name)
+    #
+    def top_households(self, limit=10) :
+        return [(self._decay(score), household_name)
+                for (score, household_name) in self.households.top(limit)]
+
+    ## Return the scores of the participants of a household, highest first.
+    #  @return a list of (score, participant)
+    #
+    def household_leaderboard(self, household_name) :
+        scores = [(self.participants.get((household_name, participant)), participant)
+                  for participant in self._members.get(household_name, ())]
+        return [(self._decay(score), participant)
+                for (score, participant) in sorted(scores, reverse=True)]
+
+    def rename_household(self, old_name, new_name) :
+        participants = self._members.pop(old_name, set())
+        for participant in participants :
+            score = self.participants.remove((old_name, participant))
+            self.participants.add((new_name, participant), score)
+        score = self.households.remove(old_name)
+        if score != -math.inf :
+            self.households.add(new_name, score)
+        if participants :
+            self._members[new_name] = participants
+
+    ## Forget a participant. The household keeps the points they earned.
+    #
+    def remove_participant(self, household_name, participant) :
+        self.participants.remove((household_name, participant))
+        self._members.get(household_name, set()).discard(participant)
+
+    def _decay(self, log_score) :
+        return math.exp(log_score - self.rate * (self._clock() - self._origin))
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    day = 24 * 3600
+    now = [0.0]
+    scores = DecayedScores(half_life=7 * day, clock=lambda: now[0])
+
+    print("Test 1: Points halve every half-life")
+    scores.record("House1", "personA", 10)
+    now[0] = 7 * day
+    print("\tVALID: ", round(scores.score("House1", "personA"), 6))
+
+    print("\nTest 2: Recent chores rank above older, larger ones")
+    scores.record("House1", "personB", 6)
+    scores.record("House2", "personC", 1)
+    now[0] = 30 * day
+    scores.record("House2", "personD", 1)
+    print("\tVALID: ", scores.top_participants(2))
+    print("\tVALID: ", scores.top_households(), scores.household_leaderboard("House1"))
+
+    print("\nTest 3: Rename a household")
+    scores.rename_household("House1", "Flat1")
+    print("\tVALID: ", scores.household_leaderboard("Flat1"), scores.score("House1"))
+
+    print("\nTest 4: Create scores with no half-life")
+    try:
+        DecayedScores(half_life=0)
+        print("\tVALID")
+    except Exception as err:
+        print("\tERROR: ", err)
+
+if __name__ == "__main__":
+    main()
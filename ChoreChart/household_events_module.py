@@ -0,0 +1,251 @@
+##
+#  This module defines the change feed used to observe the households.
+#
+#  A Household publishes an event on its change feed every time its state
+#  changes.  Subscribers receive the events in batches, in the order they
+#  were published, so caches, leaderboards and storage can be updated
+#  incrementally instead of rescanning all the households.
+#
+#  A feed can be published on from several threads.  Only one thread
+#  delivers events at a time: a publisher finding the feed full, or a full
+#  batch with auto_flush, waits for the delivery in progress and then
+#  delivers the waiting events itself.  Events published by a subscriber
+#  during a delivery are queued and delivered by the same flush, even above
+#  max_pending, so publish() never fails after the change it announces.
+#
+#  No event is ever dropped, and a subscriber which raises an exception
+#  does not stop the others from receiving the batch.  Its failed batches
+#  are kept and can be delivered again with redeliver(); only the last
+#  max_failures of them are kept, the older ones are counted in
+#  dropped_failures.
+
+import threading
+from collections import namedtuple, deque
+
+
+## The events published on a change feed.
+#
+#  household          the Household object the event is about
+#  household_name     the name of the household when the event was
+#                     published (its new name for HouseholdRenamed)
+#  snapshot           the ChoreLogSnapshot of the log when it was created
+#  participant, chore the names of the pair that was logged
+#  number_completed   the number added on to the existing total
+#  version            the version of the chore log after the change
+#  kind               one of the MEMBERSHIP_* constants below
+#  name               the participant or chore name, None if the whole
+#                     set was replaced
+#
+HouseholdCreated = namedtuple("HouseholdCreated", ["household", "household_name", "snapshot"])
+HouseholdRenamed = namedtuple("HouseholdRenamed", ["household", "household_name", "old_name"])
+LogIncremented = namedtuple("LogIncremented",
+                            ["household", "household_name", "participant", "chore",
+                             "number_completed", "version"])
+MembershipChanged = namedtuple("MembershipChanged", ["household", "household_name", "kind", "name"])
+
+MEMBERSHIP_PARTICIPANT_ADDED = "participant added"
+MEMBERSHIP_PARTICIPANT_REMOVED = "participant removed"
+MEMBERSHIP_PARTICIPANTS_REPLACED = "participants replaced"
+MEMBERSHIP_CHORE_ADDED = "chore added"
+MEMBERSHIP_CHORE_REMOVED = "chore removed"
+MEMBERSHIP_CHORES_REPLACED = "chores replaced"
+
+
+## Make the event announcing a new household.
+#  The snapshot records the chore log at this point, so subscribers which
+#  receive the event later do not count the logged chores twice.
+#  @param household the new Household object
+#
+def household_created(household) :
+    return HouseholdCreated(household, household.household_name, household.snapshot())
+
+
+class ChangeFeed() :
+
+    BATCH_SIZE = 100        # Number of events delivered to a subscriber at once
+    MAXIMUM_PENDING = 10000 # The events are delivered once this many are waiting
+    MAXIMUM_FAILURES = 100  # Failed batches kept for redeliver()
+
+    ## Constructor for the change feed.
+    #  @param batch_size the maximum number of events in a batch
+    #  @param max_pending the maximum number of events waiting for delivery
+    #  @param auto_flush True to deliver the events as soon as a batch is
+    #         full, False to wait for flush() to be called
+    #  @param max_failures the maximum number of failed batches kept
+    #
+    def __init__(self, batch_size=BATCH_SIZE, max_pending=MAXIMUM_PENDING, auto_flush=True,
+                 max_failures=MAXIMUM_FAILURES) :
+        if batch_size < 1 or max_pending < batch_size or max_failures < 0 :
+            raise ValueError("batch_size must be positive and no more than max_pending, "
+                             "max_failures not negative")
+        self.batch_size = batch_size
+        self.auto_flush = auto_flush
+        self.max_pending = max_pending
+        self.failures = deque(maxlen=max_failures)  # (subscription, batch, exception)
+        self.dropped_failures = 0   # Failed batches dropped to keep max_failures
+        self._pending = deque()
+        self._subscribers = []
+        self._lock = threading.Lock()           # guards _pending, _subscribers and failures
+        self._delivering = threading.RLock()    # held by the thread delivering events
+        self._flushing = False
+
+    ## Register a subscriber.
+    #  @param callback a function called with a list of events
+    #  @param event_types a tuple of event classes the subscriber wants,
+    #         None for all the events
+    #  @return the subscription, to be passed to unsubscribe()
+    #
+    def subscribe(self, callback, event_types=None) :
+        subscription = (callback, event_types)
+        with self._lock :
+            self._subscribers.append(subscription)
+        return subscription
+
+    ## Remove a subscriber.
+    #  @param subscription the value returned by subscribe()
+    #
+    def unsubscribe(self, subscription) :
+        with self._lock :
+            self._subscribers.remove(subscription)
+
+    ## Queue an event for delivery. A full feed is flushed, even when
+    #  auto_flush is False.
+    #  @param event one of the event tuples defined in this module
+    #
+    def publish(self, event) :
+        with self._lock :
+            self._pending.append(event)
+            waiting = len(self._pending)
+        if waiting >= self.max_pending or (self.auto_flush and waiting >= self.batch_size) :
+            self.flush()
+
+    ## Return the number of events waiting for delivery.
+    #
+    def pending(self) :
+        return len(self._pending)
+
+    ## Deliver all the waiting events in batches of at most batch_size,
+    #  waiting for a delivery in progress on another thread to finish.
+    #  Events published by a subscriber while the feed is being flushed are
+    #  delivered by the same flush.
+    #
+    def flush(self) :
+        with self._delivering :
+            if self._flushing :
+                return
+            self._flushing = True
+            try :
+                self._deliver_pending()
+            finally :
+                self._flushing = False
+
+    def _deliver_pending(self) :
+        while True :
+            with self._lock :
+                if not self._pending :
+                    return
+                batch = [self._pending.popleft()
+                         for i in range(min(self.batch_size, len(self._pending)))]
+                subscribers = list(self._subscribers)
+            for subscription in subscribers :
+                (callback, event_types) = subscription
+                if event_types is not None :
+                    wanted = [event for event in batch if isinstance(event, event_types)]
+                else :
+                    wanted = batch
+                if wanted :
+                    self._deliver(subscription, wanted)
+
+    ## Deliver again the batches whose delivery raised an exception.
+    #  @return the number of batches still failing
+    #
+    def redeliver(self) :
+        with self._delivering :
+            with self._lock :
+                (failures, self.failures) = (self.failures, deque(maxlen=self.failures.maxlen))
+                subscribers = list(self._subscribers)
+            for (subscription, batch, err) in failures :
+                if subscription in subscribers :
+                    self._deliver(subscription, batch)
+            return len(self.failures)
+
+    ## Call a subscriber, keeping the batch if it raises an exception.
+    #
+    def _deliver(self, subscription, batch) :
+        try :
+            subscription[0](batch)
+        except Exception as err :
+            with self._lock :
+                if len(self.failures) == self.failures.maxlen :
+                    self.dropped_failures += 1
+                self.failures.append((subscription, batch, err))
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    print("Test 1: Deliver the events in batches")
+    try:
+        feed = ChangeFeed(batch_size=2)
+        feed.subscribe(lambda batch: print("\tBATCH: ", batch))
+        feed.subscribe(lambda batch: print("\tCREATED: ", batch), (HouseholdCreated,))
+        feed.publish(HouseholdCreated(None, "House1", None))
+        feed.publish(LogIncremented(None, "House1", "personA", "wash up", 2, 1))
+        feed.publish(LogIncremented(None, "House1", "personA", "wash up", 1, 2))
+        feed.flush()
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 2: A failing subscriber does not stop the others")
+    try:
+        feed = ChangeFeed(batch_size=2, max_pending=2, auto_flush=False, max_failures=1)
+        received = []
+        feed.subscribe(lambda batch: 1 / 0)
+        feed.subscribe(received.extend)
+        for version in range(3) :
+            feed.publish(LogIncremented(None, "House1", "personA", "wash up", 1, version))
+        feed.flush()
+        print("\tVALID: ", len(received), len(feed.failures), feed.dropped_failures)
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 3: Publish from four threads to a subscriber which is not re-entrant")
+    try:
+        feed = ChangeFeed(batch_size=10, max_pending=50)
+        received = []
+        delivering = []
+        overlaps = []
+
+        def subscriber(batch) :
+            if delivering :
+                overlaps.append(batch)
+            delivering.append(batch)
+            received.extend(batch)
+            delivering.pop()
+
+        def writer() :
+            for version in range(1000) :
+                feed.publish(LogIncremented(None, "House1", "personA", "wash up", 1, version))
+
+        feed.subscribe(subscriber)
+        threads = [threading.Thread(target=writer) for i in range(4)]
+        for thread in threads :
+            thread.start()
+        for thread in threads :
+            thread.join()
+        feed.flush()
+        print("\tVALID: ", len(received), len(overlaps))
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 4: Create a feed with an invalid batch size")
+    try:
+        feed = ChangeFeed(batch_size=0)
+        print("\tVALID: ", feed)
+    except Exception as err:
+        print("\tERROR: ", err)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
+import threading
+
 from participants_list_module import Participants
 from chore_list_module import ChoresList, Chore
+from chore_log_module import SparseChoreLog, ChoreLogSnapshot
+import household_events_module as events
+from instrumentation_module import instrument
 
 class Household() :
 
@@ -14,6 +19,15 @@ class Household() :
     MINIMUM_CHORES_DONE = 1     # Used to validate the number of chores done
     MAXIMUM_CHORES_DONE = 50
 
+    change_feed = None          # ChangeFeed the households publish their changes on,
+                                # can be set for the class or for one household.
+
+    log_validator = None        # Object whose admit(household, name, chore, number)
+                                # method is asked before update_log applies an update.
+
+    COMPACT_DENSITY = 0.5       # A sparse chore log is made dense once this
+                                # fraction of the pairs has been logged.
+
 
     ## Constructor for the Household class. Initialises all the
     # attributes including the chore log. 
@@ -22,11 +36,23 @@ class Household() :
     # @param the_participants a Participants object containing
     #        a set of the participants' names
     # @param the_chores a ChoresList object containing a set of chores
+    # @param lazy_log True to keep the chore log sparse: a count is only
+    #        stored once the pair has been logged
     #
-    def __init__(self, the_household_name, the_participants, the_chores) :
+    @instrument("Household.__init__")
+    def __init__(self, the_household_name, the_participants, the_chores, lazy_log=False) :
+        self._revision = 0              # Incremented every time the name, the
+                                        # participants or the chores change
+        self._string = None             # Cached string, None when out of date
+        self._log_string = None         # Cached chore log string and the
+        self._log_string_version = None # version of the log it was made from
         self.household_name = the_household_name
         self.participants = the_participants
         self.chores = the_chores
+        self._lazy_log = lazy_log
+        self._log_entries = 0   # Number of pairs stored in a sparse chore log
+        self._log_version = 0   # Incremented every time the chore log changes
+        self._log_lock = threading.RLock()  # Held while the log is written or shared
         self.chore_log = {}   # This will still call the setter for the chore log
 
        
@@ -43,9 +69,13 @@ class Household() :
     def household_name(self, name) :
         try:
             self.is_valid_name(name)
+            old_name = getattr(self, "_household_name", None)
             self._household_name = name
         except Exception as err:
             raise
+        self._changed()
+        if old_name is not None :
+            self._publish(events.HouseholdRenamed(self, self.household_name, old_name))
  
                                
     ## Return the participant names.
@@ -61,7 +91,10 @@ class Household() :
     #  @param names a Participants object which is a set of the team names       
     @participants.setter
     def participants(self, the_participants) :
-        self._participants = Participants(the_participants)
+        self._set_participants(Participants(the_participants))
+        if hasattr(self, "_chore_log") :
+            self._publish(events.MembershipChanged(
+                self, self.household_name, events.MEMBERSHIP_PARTICIPANTS_REPLACED, None))
  
         
     ## Return the chores.
@@ -76,14 +109,22 @@ class Household() :
     @chores.setter
     def chores(self, the_chores) :
         try :
-            self._chores = ChoresList(the_chores)
+            self._set_chores(ChoresList(the_chores))
         except (ValueError, TypeError) as err :
             raise
+        if hasattr(self, "_chore_log") :
+            self._publish(events.MembershipChanged(
+                self, self.household_name, events.MEMBERSHIP_CHORES_REPLACED, None))
 
     ## Return the chore log.
+    # A sparse chore log is returned as a read-only view which reports
+    # zero for the pairs that have not been logged.
     # 
     @property
     def chore_log(self):
+        if self._lazy_log :
+            return SparseChoreLog(self._chore_log, self.participants.participants,
+                                  self.chore_names())
         return self._chore_log
 
 
@@ -93,49 +134,337 @@ class Household() :
     #  @param the_chore_log an empty dictionary       
     @chore_log.setter
     def chore_log(self, the_chore_log) :
-        if len(the_chore_log) == 0:
-            self._chore_log = Household.initialise_log(self.participants.participants, \
-                                                  self.chores.chores)
-        else:
-            self._chore_log = the_chore_log
+        with self._log_lock :
+            self._log_shared = False    # True while a snapshot shares the log dictionary
+            self._owned_rows = None     # Rows copied since the last snapshot, None if all
+            self._log_version += 1
+            if len(the_chore_log) == 0 and self._lazy_log:
+                self._chore_log = {}
+                self._log_entries = 0
+            elif len(the_chore_log) == 0:
+                self._chore_log = Household.initialise_log(self.participants.participants, \
+                                                      self.chores.chores)
+            else:
+                self._chore_log = the_chore_log
+                if self._lazy_log :
+                    self._log_entries = sum(len(chores) for chores in the_chore_log.values())
 
 
     def __str__(self):
+        if self._string is not None :
+            return self._string
         househole_string = (
             self.household_name + '\n'+
             str(self.participants) + '\n' +
             str(self.chores)
         )
+        self._string = househole_string
         return househole_string
+
+
+    ## Forget the cached string. Called by the setters and by the
+    #  Participants and ChoresList objects when they change.
+    #
+    def _changed(self) :
+        self._string = None
+        self._revision += 1
+
+
+    ## Return a number which grows every time the household changes: its
+    #  name, participants, chores or chore log.
+    #
+    def revision(self) :
+        return self._revision + self._log_version
+
+
+    ## Replace the Participants object, following its changes.
+    #
+    def _set_participants(self, the_participants) :
+        the_participants._owners.add(self)
+        self._participants = the_participants
+        self._changed()
+
+
+    ## Replace the ChoresList object, following its changes.
+    #
+    def _set_chores(self, the_chores) :
+        the_chores._owners.add(self)
+        self._chores = the_chores
+        self._changed()
     
 
     ## Generate a string representation of the chore log.
     #
+    #  The string is kept until the chore log changes.
+    #
     #  @return a string containting the information in the chore log
     def chore_log_string(self) :
-        # chore_log_string = "TO BE COMPLETED"
-        chore_log_string = self.chore_log
-        return chore_log_string
+        if self._log_string_version != self._log_version :
+            self._log_string = str(self.chore_log)
+            self._log_string_version = self._log_version
+        return self._log_string
 
 
     ## Update the chore log.
     #   @param name a string containing the name of the participant.
     #   @param chore  a string containing the name of the chore.
     #   @param number_completed the number to add on to the existing total.
+    #   @param validate False to skip the log validator, for an update it has
+    #          already admitted.
+    #   @return False if the log validator held the update back, True otherwise.
+    #   @exception KeyError if there is no such participant or chore; the
+    #              validator is only asked about known pairs.
     #
     # The format of the chore log is:
     # 
     # {"fred" : {"chore1": 0, "chore2": 0}, walt : {"chore1": 0, "chore2": 0}}
     #
-    def update_log(self, name, chore, number_completed) :
+    @instrument("Household.update_log")
+    def update_log(self, name, chore, number_completed, validate=True) :
+
+        if validate and self.log_validator is not None :
+            if name not in self.participants.participants :
+                raise KeyError(name)
+            if not self.chores.chore_exists(chore) :
+                raise KeyError(chore)
+            if not self.log_validator.admit(self, name, chore, number_completed) :
+                return False
+
+        if self._lazy_log :
+            self._update_sparse_log(name, chore, number_completed)
+            return True
+
+        with self._log_lock :
+            chores = self._writable_row(name)
+            chores[chore] += number_completed
+            self._log_version += 1
+            version = self._log_version
+        self._publish(events.LogIncremented(self, self.household_name, name, chore,
+                                            number_completed, version))
+        return True
+
 
-        copy_log = self.chore_log
-        chores = copy_log[name]
-        chores[chore] += number_completed
+    ## Publish an event on the household's change feed, if it has one.
+    #  @param event one of the events of household_events_module
+    #
+    def _publish(self, event) :
+        if self.change_feed is not None :
+            self.change_feed.publish(event)
 
-        self.chore_log = copy_log
-        return
+
+    ## Take a point-in-time, read-only view of the chore log.
+    #  The snapshot shares the log with the household: the writers copy the
+    #  log dictionary and the rows they change the first time they write
+    #  after a snapshot, so taking a snapshot never copies the log.
+    #  A snapshot can be taken from another thread: it waits for a write to
+    #  the log in progress, which copies and changes its row under the same lock.
+    #
+    #  @return a ChoreLogSnapshot
+    def snapshot(self) :
+        with self._log_lock :
+            self._log_shared = True
+            self._owned_rows = set()
+            return ChoreLogSnapshot(self.household_name, self._log_version, self.chore_log)
+
+
+    ## Return the log dictionary, copying it first if a snapshot shares it.
+    #  The caller holds _log_lock until it has finished writing.
+    #
+    def _writable_log(self) :
+        with self._log_lock :
+            if self._log_shared :
+                self._chore_log = dict(self._chore_log)
+                self._log_shared = False
+            return self._chore_log
+
+
+    ## Return a participant's row of the log, copying it first if a snapshot
+    #  shares it.
+    #  @param name a string containing the name of the participant.
+    #  @param create True to add an empty row if there is none (sparse log).
+    #  The caller holds _log_lock until it has finished writing.
+    #
+    def _writable_row(self, name, create=False) :
+        with self._log_lock :
+            household_log = self._writable_log()
+            if create and name not in household_log :
+                household_log[name] = {}
+            elif self._owned_rows is not None and name not in self._owned_rows :
+                household_log[name] = dict(household_log[name])
+            if self._owned_rows is not None :
+                self._owned_rows.add(name)
+            return household_log[name]
+
+
+    ## Add to a count of a sparse chore log, storing the pair on first use.
+    #  The log is made dense once more than COMPACT_DENSITY of the pairs
+    #  are stored.
+    #
+    def _update_sparse_log(self, name, chore, number_completed) :
+        if name not in self.participants.participants :
+            raise KeyError(name)
+        if not self.chores.chore_exists(chore) :
+            raise KeyError(chore)
+
+        with self._log_lock :
+            chores = self._writable_row(name, create=True)
+            if chore not in chores :
+                chores[chore] = 0
+                self._log_entries += 1
+            chores[chore] += number_completed
+            self._log_version += 1
+            version = self._log_version
+        self._publish(events.LogIncremented(self, self.household_name, name, chore,
+                                            number_completed, version))
+
+        if self._log_entries > Household.COMPACT_DENSITY * self.log_size() :
+            self.compact_log()
+
+
+    ## Return the number of (participant, chore) pairs in the chore log.
+    #
+    def log_size(self) :
+        return len(self.participants.participants) * len(self.chores.chores)
+
+
+    ## Return True if the chore log is kept sparse.
+    #
+    def is_lazy_log(self) :
+        return self._lazy_log
+
+
+    ## Convert a sparse chore log into a dense one, keeping the counts.
+    #
+    def compact_log(self) :
+        if not self._lazy_log :
+            return
+        household_log = Household.initialise_log(self.participants.participants,
+                                                 self.chores.chores)
+        for (name, chores) in self._chore_log.items() :
+            household_log[name].update(chores)
+        self._lazy_log = False
+        self.chore_log = household_log
         
+
+    ## Return the household as plain data which can be pickled or written
+    #  as JSON. A sparse log only contains the logged pairs.
+    #
+    #  @return a dictionary
+    def to_record(self) :
+        return {"household_name": self.household_name,
+                "participants": list(self.participants.participants),
+                "chores": [[chore.chore_name, chore.frequency] for chore in self.chores.chores],
+                "lazy_log": self._lazy_log,
+                "log": {name: dict(chores) for (name, chores) in self._chore_log.items()}}
+
+
+    ## Make a household from the data returned by to_record().
+    #
+    #  @param record a dictionary
+    #  @return a Household object
+    @staticmethod
+    def from_record(record) :
+        household = Household(record["household_name"], list(record["participants"]),
+                              {Chore(name, frequency) for (name, frequency) in record["chores"]},
+                              lazy_log=record["lazy_log"])
+        household_log = {name: dict(chores) for (name, chores) in record["log"].items()}
+        if household_log :
+            household.chore_log = household_log
+        return household
+
+
+    ## Return the names of the household's chores.
+    #
+    #  @return a list containing the chore names
+    def chore_names(self) :
+        return [chore.chore_name for chore in self.chores.chores]
+
+
+    ## Add a participant to the household.
+    #  The new participant starts with a zero count for every chore, the
+    #  counts already in the chore log are kept.
+    #
+    #  @param name a string containing the name of the participant
+    #  @exception ValueError raised if the name is invalid, is already used
+    #             or the household would become too big.
+    #
+    def add_participant(self, name) :
+        names = self.participants.participants
+        if name in names :
+            raise ValueError("Participant: {} already exists in the household".format(name))
+        self._set_participants(Participants(names + [name]))
+        with self._log_lock :
+            if not self._lazy_log :
+                self._writable_row(name, create=True).update(dict.fromkeys(self.chore_names(), 0))
+            self._log_version += 1
+        self._publish(events.MembershipChanged(self, self.household_name,
+                                               events.MEMBERSHIP_PARTICIPANT_ADDED, name))
+
+
+    ## Remove a participant and their row of the chore log.
+    #
+    #  @param name a string containing the name of the participant
+    #  @exception ValueError raised if there is no such participant or
+    #             the household would become too small.
+    #
+    def remove_participant(self, name) :
+        names = self.participants.participants
+        if name not in names :
+            raise ValueError("Participant: {} is not in the household".format(name))
+        self._set_participants(Participants([participant for participant in names
+                                             if participant != name]))
+        with self._log_lock :
+            chores = self._writable_log().pop(name, {})
+            if self._lazy_log :
+                self._log_entries -= len(chores)
+            self._log_version += 1
+        self._publish(events.MembershipChanged(self, self.household_name,
+                                               events.MEMBERSHIP_PARTICIPANT_REMOVED, name))
+
+
+    ## Add a chore to the household.
+    #  Every participant starts with a zero count for the new chore.
+    #
+    #  @param the_chore a Chore object
+    #  @exception ValueError raised if a chore with the same name exists or
+    #             there would be too many chores.
+    #
+    def add_chore(self, the_chore) :
+        if not isinstance(the_chore, Chore) :
+            raise TypeError("Argument must be a Chore object.")
+        ChoresList.is_unique(the_chore.chore_name, self.chores.chores)
+        self._set_chores(ChoresList(self.chores.chores | {the_chore}))
+        with self._log_lock :
+            if not self._lazy_log :
+                for name in list(self._chore_log) :
+                    self._writable_row(name)[the_chore.chore_name] = 0
+            self._log_version += 1
+        self._publish(events.MembershipChanged(self, self.household_name,
+                                               events.MEMBERSHIP_CHORE_ADDED, the_chore.chore_name))
+
+
+    ## Remove a chore and its counts from the chore log.
+    #
+    #  @param chore_name a string containing the name of the chore
+    #  @exception ValueError raised if there is no such chore or there
+    #             would be too few chores.
+    #
+    def remove_chore(self, chore_name) :
+        if not self.chores.chore_exists(chore_name) :
+            raise ValueError("Chore: {} is not in the household".format(chore_name))
+        self._set_chores(ChoresList({chore for chore in self.chores.chores
+                                     if chore.chore_name != chore_name}))
+        with self._log_lock :
+            for name in list(self._chore_log) :
+                if chore_name in self._chore_log[name] :
+                    del self._writable_row(name)[chore_name]
+                    if self._lazy_log :
+                        self._log_entries -= 1
+            self._log_version += 1
+        self._publish(events.MembershipChanged(self, self.household_name,
+                                               events.MEMBERSHIP_CHORE_REMOVED, chore_name))
+
+
     ## Check the name contains only characters from the alphabet and check that it is the right length.
     # 
     # @param name the string to be validated
@@ -151,6 +480,7 @@ class Household() :
 
 
     @staticmethod
+    @instrument("Household.initialise_log")
     def initialise_log(the_participants, the_chores) :
  
         # Create a dictionary where the keys are the participant names
@@ -226,6 +556,36 @@ def main():
     except Exception as err:
         print("\tERROR: ", err)
 
+    print("\nTest 7: Add and remove participants and chores (valid)")
+    try:
+        h.add_participant("personD")
+        h.add_chore(Chore("cooking", 7))
+        h.remove_participant("personB")
+        h.remove_chore("dusting")
+        print("\n\tVALID: ", h.chore_log)
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 8: Update a sparse log until it is compacted (valid)")
+    try:
+        h = Household("House2", {"personA","personB"},
+                      {Chore("wash up", 4), Chore("dusting",1)}, lazy_log=True)
+        h.update_log("personA", "wash up", 3)
+        print("\n\tVALID: ", h.chore_log, h.is_lazy_log())
+        h.update_log("personB", "dusting", 2)
+        h.update_log("personB", "wash up", 1)
+        print("\n\tVALID: ", h.chore_log, h.is_lazy_log())
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 9: A snapshot does not see later updates (valid)")
+    try:
+        snapshot = h.snapshot()
+        h.update_log("personA", "dusting", 5)
+        print("\n\tVALID: ", snapshot, snapshot.version, h.snapshot().version)
+    except Exception as err:
+        print("\tERROR: ", err)
+
     print("---------------------------------------")
     log = h.chore_log
     print(type(log))
@@ -0,0 +1,218 @@
+##
+#  This module makes the logging of chores idempotent.
+#
+#  Every submission carries an event ID chosen by the client, and a retried
+#  submission or a replayed batch reuses the IDs of the original.  The
+#  ingester remembers the IDs it has seen and applies each event once.
+#
+#  The IDs are remembered in two bounded structures, so the memory used does
+#  not grow with the number of events:
+#    - an exact set of the most recent IDs, which catches the common case of
+#      an immediate retry without any false positive;
+#    - a time-windowed Bloom filter covering a longer window.  It is made of
+#      a few generations; new IDs go in the newest and the oldest is cleared
+#      and reused when the window moves on.  An ID it has seen is always
+#      found, and an ID it has not seen is taken for a duplicate with the
+#      probability error_rate.
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+
+class BloomFilter() :
+
+    ## Constructor for an empty filter.
+    #  @param capacity the number of keys it is sized for
+    #  @param error_rate the false positive rate with that many keys
+    #
+    def __init__(self, capacity, error_rate) :
+        if capacity < 1 or not 0 < error_rate < 1 :
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    ## Return the bit positions of a key, by double hashing.
+    #
+    def _positions(self, key) :
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key) :
+        for position in self._positions(key) :
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key) :
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+    def clear(self) :
+        self._bits = bytearray(len(self._bits))
+        self.count = 0
+
+
+class WindowedBloomFilter() :
+
+    GENERATIONS = 4
+
+    ## Constructor for an empty filter.
+    #  @param window the number of seconds an ID is remembered for, at least
+    #  @param capacity the number of IDs expected in one window
+    #  @param error_rate the false positive rate with that many IDs
+    #  @param generations the number of Bloom filters the window is split into
+    #  @param clock a function returning the time in seconds
+    #
+    def __init__(self, window, capacity, error_rate, generations=GENERATIONS,
+                 clock=time.monotonic) :
+        if window <= 0 or generations < 1 :
+            raise ValueError("window and generations must be positive")
+        self.span = window / generations
+        self._clock = clock
+        # Each generation is sized for a whole window, so a burst does not
+        # overfill it, and the false positives of the generations add up.
+        self._generations = [BloomFilter(capacity, error_rate / (generations + 1))
+                             for i in range(generations + 1)]
+        self._started = clock()
+
+    ## Clear the generations which have left the window.
+    #
+    def _rotate(self) :
+        now = self._clock()
+        expired = min(int((now - self._started) / self.span), len(self._generations))
+        for i in range(expired) :
+            oldest = self._generations.pop()
+            oldest.clear()
+            self._generations.insert(0, oldest)
+        if expired :
+            self._started = now if expired == len(self._generations) \
+                else self._started + expired * self.span
+
+    def add(self, key) :
+        self._rotate()
+        self._generations[0].add(key)
+
+    def __contains__(self, key) :
+        self._rotate()
+        return any(key in generation for generation in self._generations)
+
+
+class IdempotentIngester() :
+
+    WINDOW = 24 * 3600          # Seconds a retried event is recognised for
+    CAPACITY = 1000000          # Events expected in one window
+    ERROR_RATE = 1e-6           # Chance of taking a new event for a duplicate
+    RECENT_IDS = 100000         # IDs remembered exactly
+
+    ## Constructor for the ingester.
+    #  @param window the number of seconds the IDs are remembered for
+    #  @param capacity the number of events expected in one window
+    #  @param error_rate the false positive rate of the Bloom filter
+    #  @param recent_ids the number of most recent IDs kept exactly
+    #  @param clock a function returning the time in seconds
+    #
+    def __init__(self, window=WINDOW, capacity=CAPACITY, error_rate=ERROR_RATE,
+                 recent_ids=RECENT_IDS, clock=time.monotonic) :
+        if recent_ids < 1 :
+            raise ValueError("recent_ids must be positive")
+        self.recent_ids = recent_ids
+        self._recent = OrderedDict()
+        self._seen = WindowedBloomFilter(window, capacity, error_rate, clock=clock)
+        self.applied = 0        # Number of events applied
+        self.held_back = 0      # Number of events the log validator held back
+        self.duplicates = 0     # Number of events found in the recent IDs
+        self.suspected = 0      # Number of events only found by the Bloom filter
+
+    ## Check whether an event ID was seen recently.
+    #
+    def is_duplicate(self, event_id) :
+        return event_id in self._recent or event_id in self._seen
+
+    ## Apply a chore log update once per event ID.
+    #  @param event_id a string identifying the submission
+    #  @param household the Household object
+    #  @param name a string containing the name of the participant.
+    #  @param chore  a string containing the name of the chore.
+    #  @param number_completed the number to add on to the existing total.
+    #  @return True if the update was applied, False if it was a duplicate
+    #          or the log validator held it back.  A held back event is
+    #          remembered, so a retry of it is taken for a duplicate.
+    #  @exception KeyError if the household has no such participant or chore;
+    #             the event ID is not recorded, so the event can be retried.
+    #
+    def update_log(self, event_id, household, name, chore, number_completed) :
+        if event_id in self._recent :
+            self.duplicates += 1
+            return False
+        if event_id in self._seen :
+            self.suspected += 1
+            return False
+
+        applied = household.update_log(name, chore, number_completed)
+        self._remember(event_id)
+        if not applied :
+            self.held_back += 1
+            return False
+        self.applied += 1
+        return True
+
+    ## Apply a batch of updates, skipping the duplicates.
+    #  @param updates a list of (event ID, household, participant, chore, number)
+    #  @return the number of updates applied
+    #
+    def update_logs(self, updates) :
+        applied = 0
+        for update in updates :
+            if self.update_log(*update) :
+                applied += 1
+        return applied
+
+    def _remember(self, event_id) :
+        self._recent[event_id] = None
+        if len(self._recent) > self.recent_ids :
+            self._recent.popitem(last=False)
+        self._seen.add(event_id)
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    from household_module import Household
+    from chore_list_module import Chore
+
+    print("Test 1: Replay a batch of submissions")
+    try:
+        h = Household("House1", {"personA","personB"}, {Chore("wash up", 4), Chore("dusting",1)})
+        ingester = IdempotentIngester(capacity=1000, recent_ids=10)
+        batch = [("event{}".format(i), h, "personA", "wash up", 1) for i in range(100)]
+        print("\tVALID: ", ingester.update_logs(batch), ingester.update_logs(batch),
+              h.chore_log_string())
+        print("\tVALID: ", ingester.applied, ingester.duplicates, ingester.suspected)
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 2: Retry a submission for an unknown chore")
+    try:
+        ingester.update_log("event100", h, "personA", "hoovering", 1)
+        print("\tVALID")
+    except Exception as err:
+        print("\tERROR: ", repr(err), ingester.is_duplicate("event100"))
+
+    print("\nTest 3: Forget the IDs once the window has passed")
+    now = [0.0]
+    ingester = IdempotentIngester(window=60, capacity=1000, recent_ids=1, clock=lambda: now[0])
+    ingester.update_log("event1", h, "personB", "dusting", 1)
+    ingester.update_log("event2", h, "personB", "dusting", 1)
+    print("\tVALID: ", ingester.is_duplicate("event1"), end=" ")
+    now[0] = 120.0
+    print(ingester.is_duplicate("event1"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+##
+#  This module measures where the time goes in the Chore Chart application.
+#
+#  Functions decorated with @instrument("name") count their calls and errors
+#  and record their latency in a histogram.  The measurements can be
+#  exported in the Prometheus text format with prometheus_text().
+#
+#  The instrumentation is switched on with the environment variable
+#  CHORECHART_METRICS=1, or at run time with enable() or configure().  While
+#  it is off an instrumented call only costs a check of the switch.
+#  Every CHORECHART_PROFILE_EVERY-th call of an instrumented function can also
+#  be run under cProfile and handed to a hook (see set_profiler_hook()).
+#  CHORECHART_METRICS_FILE names the file export_snapshot() writes to.
+
+import cProfile
+import functools
+import os
+import time
+import warnings
+
+
+## Read a whole number from the environment, falling back to the default
+#  with a warning if the value is not a number.
+#
+def _environment_int(variable, default) :
+    value = os.environ.get(variable, "")
+    try :
+        return int(value) if value.strip() else default
+    except ValueError :
+        warnings.warn("{}={!r} is not a whole number, using {}".format(variable, value, default))
+        return default
+
+
+ENABLED = os.environ.get("CHORECHART_METRICS", "0") not in ("", "0")
+PROFILE_EVERY = _environment_int("CHORECHART_PROFILE_EVERY", 0)
+METRICS_FILE = os.environ.get("CHORECHART_METRICS_FILE", "")
+
+## Upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+
+class Metrics() :
+
+    ## Constructor for an empty set of measurements.
+    #  @param the_buckets the upper bounds of the latency histogram buckets
+    #
+    def __init__(self, the_buckets=LATENCY_BUCKETS) :
+        self.buckets = the_buckets
+        self.calls = {}         # name -> number of calls
+        self.errors = {}        # name -> number of calls that raised
+        self.histograms = {}    # name -> [bucket counts..., total seconds]
+
+    ## Record one call of an instrumented function.
+    #  @param name the name the function was instrumented with
+    #  @param seconds the time the call took
+    #  @param failed True if the call raised an exception
+    #
+    def record(self, name, seconds, failed=False) :
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if failed :
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+        histogram = self.histograms.get(name)
+        if histogram is None :
+            histogram = [0] * (len(self.buckets) + 1) + [0.0]
+            self.histograms[name] = histogram
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i] :
+            i = i + 1
+        histogram[i] += 1
+        histogram[-1] += seconds
+
+    ## Forget all the measurements.
+    #
+    def reset(self) :
+        self.calls.clear()
+        self.errors.clear()
+        self.histograms.clear()
+
+    ## Generate the measurements in the Prometheus text exposition format.
+    #
+    #  @return a string containing the counters and histograms
+    def prometheus_text(self) :
+        lines = ["# HELP chorechart_calls_total Calls of instrumented functions.",
+                 "# TYPE chorechart_calls_total counter"]
+        for (name, count) in sorted(self.calls.items()) :
+            lines.append('chorechart_calls_total{{function="{}"}} {}'.format(name, count))
+
+        lines.append("# HELP chorechart_errors_total Calls which raised an exception.")
+        lines.append("# TYPE chorechart_errors_total counter")
+        for (name, count) in sorted(self.errors.items()) :
+            lines.append('chorechart_errors_total{{function="{}"}} {}'.format(name, count))
+
+        lines.append("# HELP chorechart_latency_seconds Latency of instrumented functions.")
+        lines.append("# TYPE chorechart_latency_seconds histogram")
+        for (name, histogram) in sorted(self.histograms.items()) :
+            cumulative = 0
+            for (bound, count) in zip(self.buckets, histogram) :
+                cumulative += count
+                lines.append('chorechart_latency_seconds_bucket{{function="{}",le="{}"}} {}'
+                             .format(name, bound, cumulative))
+            cumulative += histogram[len(self.buckets)]
+            lines.append('chorechart_latency_seconds_bucket{{function="{}",le="+Inf"}} {}'
+                         .format(name, cumulative))
+            lines.append('chorechart_latency_seconds_sum{{function="{}"}} {}'
+                         .format(name, histogram[-1]))
+            lines.append('chorechart_latency_seconds_count{{function="{}"}} {}'
+                         .format(name, cumulative))
+        return "\n".join(lines) + "\n"
+
+
+## The measurements of the application.
+metrics = Metrics()
+
+_profiler_hook = None
+_profile_every = PROFILE_EVERY
+_call_number = 0
+_profiling = False      # True while a sampled call is being profiled
+
+
+## Set the function called with the profile of the sampled calls.
+#  @param hook a function called as hook(name, profile) with a finished
+#         cProfile.Profile, or None to stop profiling
+#  @param every profile one call in every this many instrumented calls
+#
+def set_profiler_hook(hook, every=PROFILE_EVERY or 1000) :
+    global _profiler_hook, _profile_every
+    if every < 1 :
+        raise ValueError("every must be a positive number of calls")
+    _profiler_hook = hook
+    _profile_every = every
+
+
+## Switch the instrumentation on or off and change its settings.
+#  @param enabled True to measure the instrumented calls, None to leave
+#         the switch as it is
+#  @param profile_every profile one call in every this many, None to leave
+#         it as it is
+#  @param metrics_file the file export_snapshot() writes to, None to leave
+#         it as it is
+#
+def configure(enabled=None, profile_every=None, metrics_file=None) :
+    global ENABLED, _profile_every, METRICS_FILE
+    if profile_every is not None :
+        if profile_every < 1 :
+            raise ValueError("profile_every must be a positive number of calls")
+        _profile_every = profile_every
+    if enabled is not None :
+        ENABLED = bool(enabled)
+    if metrics_file is not None :
+        METRICS_FILE = metrics_file
+
+
+## Switch the instrumentation on.
+#
+def enable() :
+    configure(enabled=True)
+
+
+## Switch the instrumentation off. The measurements are kept.
+#
+def disable() :
+    configure(enabled=False)
+
+
+## Decorator measuring the calls of a function.
+#  @param name the name the measurements are recorded under
+#  @return the decorator; the calls are only measured while the
+#          instrumentation is enabled
+#
+def instrument(name) :
+    def decorate(function) :
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) :
+            global _call_number, _profiling
+            if not ENABLED :
+                return function(*args, **kwargs)
+            _call_number += 1
+            profile = None
+            if _profiler_hook is not None and not _profiling \
+                    and _call_number % _profile_every == 0 :
+                _profiling = True
+                profile = cProfile.Profile()
+                profile.enable()
+            failed = True
+            start = time.perf_counter()
+            try :
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally :
+                metrics.record(name, time.perf_counter() - start, failed)
+                if profile is not None :
+                    profile.disable()
+                    _profiling = False
+                    _profiler_hook(name, profile)
+
+        return wrapper
+
+    return decorate
+
+
+## Write the measurements to a file in the Prometheus text format.
+#  @param path the file to write to, CHORECHART_METRICS_FILE by default
+#  @return True if the snapshot was written
+#
+def export_snapshot(path=None) :
+    path = path or METRICS_FILE
+    if not ENABLED or not path :
+        return False
+    with open(path, "w") as snapshot_file :
+        snapshot_file.write(metrics.prometheus_text())
+    return True
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    print("Test 1: Record some calls and export them")
+    try:
+        m = Metrics()
+        m.record("update_log", 0.00005)
+        m.record("update_log", 0.002)
+        m.record("update_log", 20.0, failed=True)
+        print(m.prometheus_text())
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("Test 2: Switch the instrumentation on at run time")
+    try:
+        @instrument("double")
+        def double(number) :
+            return 2 * number
+        was_enabled = ENABLED
+        enable()
+        double(1)
+        configure(enabled=was_enabled)
+        double(2)
+        print("\tVALID: ", metrics.calls.get("double"))
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("Test 3: Profile with an invalid sampling interval")
+    try:
+        set_profiler_hook(print, every=0)
+        print("\tVALID")
+    except Exception as err:
+        print("\tERROR: ", err)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+##
+#  This module load-tests the Chore Chart application end to end.
+#
+#  A script of answers is generated for a number of households and fed to
+#  chore_chart.main() in place of the keyboard, with the output sent to a
+#  sink instead of the terminal.  The time between two menu prompts is the
+#  latency of the menu action that was chosen, so the report gives the
+#  latency and the throughput of each action as the user sees them.
+#
+#  Running the same script at several sizes catches the actions whose cost
+#  per call grows faster than the number of households, such as listings
+#  which look every item up again.  Each size is run several times and the
+#  median latencies are compared, so a garbage collection or another
+#  process taking the CPU during a few calls does not fail the check.
+#
+#  Usage: python load_test_module.py [households...]
+
+import builtins
+import gc
+import importlib
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from unittest import mock
+
+import chore_chart
+
+
+MENU_PROMPT = "\nEnter an option: "
+
+SIZES = (1000, 2000, 4000)    # Numbers of households of the scaling check
+REPEATS = 3                   # Runs of the script at each size
+
+ACTIONS = {"A": "about", "C": "create household", "V": "view household",
+           "L": "log chores", "S": "show leaderboard", "Q": "quit"}
+
+
+class NullOutput() :
+
+    ## A file which throws away what is written to it.
+    #
+    def write(self, text) :
+        return len(text)
+
+    def flush(self) :
+        pass
+
+
+class ScriptedInput() :
+
+    ## Constructor for the replacement of input().
+    #  @param the_answers the lines typed, in order
+    #  @param clock a function returning the time in seconds
+    #
+    def __init__(self, the_answers, clock=time.perf_counter) :
+        self._answers = iter(the_answers)
+        self._clock = clock
+        self._action = None
+        self._started = None
+        self.latencies = {}     # action -> list of seconds
+
+    def __call__(self, prompt="") :
+        if prompt == MENU_PROMPT :
+            now = self._clock()
+            if self._action is not None :
+                self.latencies.setdefault(self._action, []).append(now - self._started)
+            answer = next(self._answers)
+            self._action = ACTIONS.get(answer[:1].upper())
+            self._started = self._clock()
+            return answer
+        try :
+            return next(self._answers)
+        except StopIteration :
+            raise RuntimeError("The script ended at the prompt {!r}".format(prompt))
+
+
+## Generate the answers creating households and using them.
+#  @param households the number of households created
+#  @param logs the number of times chores are logged
+#  @param views the number of times all the households are viewed
+#  @param leaderboards the number of times the leaderboard is shown
+#  @return a list of lines, ending with the answer quitting the application
+#
+def generate_script(households, logs=None, views=10, leaderboards=10) :
+    if logs is None :
+        logs = households
+    participants = ["personA", "personB", "personC"]
+    chores = [("wash up", "7"), ("hoovering", "2"), ("dusting", "1")]
+
+    answers = []
+    for i in range(households) :
+        answers += ["C", "Home{}".format(i)] + participants + [""]
+        for (chore, frequency) in chores :
+            answers += [chore, frequency]
+        answers.append("")
+    for i in range(logs) :
+        answers += ["L", "Home{}".format(i % households),
+                    str(i % len(participants)), str(i % len(chores)), "1"]
+        if views and i % max(1, logs // views) == 0 :
+            answers.append("V")
+        if leaderboards and i % max(1, logs // leaderboards) == 0 :
+            answers.append("S")
+    answers.append("Q")
+    return answers
+
+
+## Run chore_chart.main() on a script.
+#  The application is reloaded first, so every run starts without households.
+#  @param answers the lines typed, in order
+#  @param output the file receiving the output, thrown away by default
+#  @return a dictionary action -> list of latencies in seconds, and the
+#          total time in seconds
+#
+def run_script(answers, output=None) :
+    importlib.reload(chore_chart)
+    scripted_input = ScriptedInput(answers)
+    started = time.perf_counter()
+    with mock.patch.object(builtins, "input", scripted_input), \
+            redirect_stdout(output or NullOutput()) :
+        chore_chart.main()
+    return (scripted_input.latencies, time.perf_counter() - started)
+
+
+## Summarise the latencies of each action.
+#  @return a dictionary action -> (calls, mean, median, 95th percentile,
+#          maximum, calls per second)
+#
+def summarise(latencies) :
+    summary = {}
+    for (action, seconds) in latencies.items() :
+        seconds = sorted(seconds)
+        total = sum(seconds)
+        summary[action] = (len(seconds), total / len(seconds), statistics.median(seconds),
+                           seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))],
+                           seconds[-1], len(seconds) / total if total else float("inf"))
+    return summary
+
+
+## Print a summary as a table.
+#
+def print_summary(households, summary, elapsed) :
+    print("\n{} households, {:.2f} s".format(households, elapsed))
+    print("{:<18}{:>8}{:>12}{:>12}{:>12}{:>12}{:>12}".format(
+        "action", "calls", "mean ms", "median ms", "p95 ms", "max ms", "per s"))
+    for (action, (calls, mean, median, p95, maximum, rate)) in sorted(summary.items()) :
+        print("{:<18}{:>8}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.0f}".format(
+            action, calls, mean * 1000, median * 1000, p95 * 1000, maximum * 1000, rate))
+
+
+## Run the script at several sizes and find the actions whose median
+#  latency grows more than linearly with the number of households.
+#  @param sizes increasing numbers of households
+#  @param tolerance how much faster than linear the latency may grow
+#  @param repeats the number of times the script is run at each size; the
+#         latencies of all the runs are put together
+#  @return a list of (action, size, growth of the median, growth of the size)
+#
+def check_scaling(sizes=SIZES, tolerance=1.5, repeats=REPEATS, verbose=True) :
+    medians = {}
+    for households in sizes :
+        latencies = {}
+        elapsed = 0.0
+        for i in range(repeats) :
+            gc.collect()
+            (run_latencies, run_elapsed) = run_script(generate_script(households))
+            for (action, seconds) in run_latencies.items() :
+                latencies.setdefault(action, []).extend(seconds)
+            elapsed += run_elapsed
+        summary = summarise(latencies)
+        if verbose :
+            print_summary(households, summary, elapsed)
+        medians[households] = {action: row[2] for (action, row) in summary.items()}
+
+    regressions = []
+    for (smaller, larger) in zip(sizes, sizes[1:]) :
+        for (action, median) in medians[larger].items() :
+            before = medians[smaller].get(action)
+            if before and median / before > tolerance * larger / smaller :
+                regressions.append((action, larger, median / before, larger / smaller))
+    return regressions
+
+
+## main method
+#
+# Runs the load test and exits with status 1 if an action scales badly.
+#
+def main():
+    sizes = tuple(int(size) for size in sys.argv[1:]) or SIZES
+    regressions = check_scaling(sizes)
+    for (action, size, growth, size_growth) in regressions :
+        print("\nREGRESSION: {} at {} households is {:.1f}x slower for {:.1f}x the households"
+              .format(action, size, growth, size_growth))
+    if regressions :
+        sys.exit(1)
+    print("\nNo action scales worse than linearly.")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import weakref
+
+
 class Participants():
  
     ## Constants used for validation
@@ -11,6 +14,8 @@ class Participants():
     # @param the_participants a set containing the names
     #              
     def __init__(self, the_participants) :
+        self._owners = weakref.WeakSet()    # Objects whose string includes this one
+        self._string = None                 # Cached string, None when out of date
         self.participants = the_participants
 
     ## Return the participants' list.
@@ -35,17 +40,29 @@ class Participants():
         for participant  in the_participants:
             participants_list.append(participant)
         self._participants = participants_list
+        self._changed()
 
 
     def __str__(self):
+        if self._string is not None:
+            return self._string
         if len(self.participants) > 0:
             participants_string = str(self.participants)
         else:
             participants_string = "NOT COMPLETE"
             
+        self._string = participants_string
         return participants_string
 
 
+    ## Forget the cached string of this object and of its owners.
+    #
+    def _changed(self) :
+        self._string = None
+        for owner in list(self._owners) :
+            owner._changed()
+
+
     ## Check the set of participants.
     # Verifies that the set of partcipants is a valid length.
     # Verifies that each participants is valid.
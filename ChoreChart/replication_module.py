@@ -0,0 +1,585 @@
+##
+#  This module replicates the households to follower processes.
+#
+#  The leader follows the change feed of the application and turns every
+#  event into an operation with an offset: a household created, chores
+#  logged, a household renamed or its participants or chores changed.  The
+#  operations are kept in a bounded log and streamed to the followers over
+#  TCP sockets, one JSON object per line.  The leader applies the
+#  operations to its own copy of the households, so a snapshot always
+#  matches its offset.  That copy holds every household in memory, whatever
+#  the limits of the application's SQLite store or tiered store: a leader
+#  costs as much memory as keeping all the households loaded.
+#
+#  The leader sees every change because the change feed does not drop
+#  events; a batch the leader fails on stays in the feed's failures and
+#  its events are only replicated if it is redelivered.
+#
+#  A follower connects with the offset of the last operation it applied.
+#  If the leader still has the operations after it they are sent, otherwise
+#  the follower first receives a snapshot of all the households with its
+#  offset.  Followers apply the operations in order and acknowledge them,
+#  and the leader reports how far behind each follower is.  The leader
+#  sends a heartbeat with its offset when it has nothing to send, so the
+#  followers also know their lag.  A follower which cannot apply an
+#  operation stops at the offset before it and connects again asking for a
+#  snapshot, and one which receives a message it cannot read connects
+#  again from its offset.
+#
+#  A follower serves read-only queries, the household view and the
+#  leaderboard, on its own socket (see query()).
+#
+#  Usage: python replication_module.py follow LEADER_HOST LEADER_PORT QUERY_PORT
+#         python replication_module.py          runs a demonstration
+
+import itertools
+import json
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+from household_module import Household
+from chore_list_module import Chore
+import household_events_module as events
+import report_module
+
+
+class Replica() :
+
+    ## Constructor for an empty copy of the households.
+    #
+    def __init__(self) :
+        self.households = {}    # household name -> Household, in creation order
+        self.offset = 0         # Offset of the last operation applied
+        self.errors = 0         # Operations which could not be applied
+        self.lock = threading.RLock()
+
+    ## Replace the households by those of a snapshot.
+    #  @param snapshot a dictionary returned by snapshot()
+    #
+    def load(self, snapshot) :
+        households = {}
+        for record in snapshot["households"] :
+            households[record["household_name"]] = _replica_household(record)
+        with self.lock :
+            self.households = households
+            self.offset = snapshot["offset"]
+
+    ## Return the households and the offset as plain data.
+    #
+    def snapshot(self) :
+        with self.lock :
+            return {"offset": self.offset,
+                    "households": [household.to_record() for household in self.households.values()]}
+
+    ## Apply an operation. Operations already applied are ignored.
+    #  @return False if the operation could not be applied, the offset is
+    #          then left at the operation before it.
+    #
+    def apply(self, operation) :
+        with self.lock :
+            if operation["offset"] <= self.offset :
+                return True
+            try :
+                self._apply(operation)
+            except (KeyError, ValueError, TypeError) :
+                self.errors += 1
+                return False
+            self.offset = operation["offset"]
+            return True
+
+    def _apply(self, operation) :
+        kind = operation["op"]
+        if kind == "create" :
+            record = operation["record"]
+            self.households[record["household_name"]] = _replica_household(record)
+            return
+        if kind == "rename" :
+            self.households = {(operation["new"] if name == operation["old"] else name): household
+                               for (name, household) in self.households.items()}
+            self.households[operation["new"]].household_name = operation["new"]
+            return
+
+        household = self.households[operation["household"]]
+        if kind == "log" :
+            household.update_log(operation["participant"], operation["chore"],
+                                 operation["number"])
+        elif kind == events.MEMBERSHIP_PARTICIPANT_ADDED :
+            if operation["name"] not in household.participants.participants :
+                household.add_participant(operation["name"])
+        elif kind == events.MEMBERSHIP_PARTICIPANT_REMOVED :
+            if operation["name"] in household.participants.participants :
+                household.remove_participant(operation["name"])
+        elif kind == events.MEMBERSHIP_CHORE_ADDED :
+            if not household.chores.chore_exists(operation["name"]) :
+                household.add_chore(Chore(operation["name"], operation["frequency"]))
+        elif kind == events.MEMBERSHIP_CHORE_REMOVED :
+            if household.chores.chore_exists(operation["name"]) :
+                household.remove_chore(operation["name"])
+        elif kind == events.MEMBERSHIP_PARTICIPANTS_REPLACED :
+            household.participants = operation["participants"]
+        elif kind == events.MEMBERSHIP_CHORES_REPLACED :
+            household.chores = {Chore(name, frequency) for (name, frequency) in operation["chores"]}
+        else :
+            raise ValueError("Unknown operation: {}".format(kind))
+
+
+## Make a household of a replica. It publishes no events and its updates
+#  are not validated again.
+#
+def _replica_household(record) :
+    household = Household.from_record(record)
+    household.change_feed = None
+    household.log_validator = None
+    return household
+
+
+class ReplicationLeader() :
+
+    LOG_SIZE = 100000   # Operations kept for the followers catching up
+    HEARTBEAT = 1.0     # Seconds between heartbeats
+
+    ## Constructor for the leader. Starts listening for followers.
+    #  @param host the address to listen on
+    #  @param port the port to listen on, 0 for any free port
+    #  @param log_size the number of operations kept
+    #  @param heartbeat the number of seconds between heartbeats
+    #
+    def __init__(self, host="127.0.0.1", port=0, log_size=LOG_SIZE, heartbeat=HEARTBEAT) :
+        self.heartbeat = heartbeat
+        self._replica = Replica()
+        self._operations = deque(maxlen=log_size)  # (offset, line, time published)
+        self._condition = threading.Condition(self._replica.lock)
+        self._followers = {}        # follower number -> [address, offset acknowledged]
+        self._follower_numbers = itertools.count(1)
+        self._subscription = None
+        self._closed = False
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    ## Return the offset of the last operation.
+    #
+    @property
+    def offset(self) :
+        return self._replica.offset
+
+    ## Follow a change feed, replicating its events.
+    #  @param the_feed a ChangeFeed
+    #
+    def attach(self, the_feed) :
+        self._feed = the_feed
+        self._subscription = the_feed.subscribe(self.apply_events)
+
+    ## Turn a batch of events from a change feed into operations.
+    #
+    def apply_events(self, batch) :
+        for event in batch :
+            if isinstance(event, events.HouseholdCreated) :
+                self.publish(_create_operation(event.household, event.household_name,
+                                               event.snapshot))
+            elif isinstance(event, events.LogIncremented) :
+                self.publish({"op": "log", "household": event.household_name,
+                              "participant": event.participant, "chore": event.chore,
+                              "number": event.number_completed})
+            elif isinstance(event, events.HouseholdRenamed) :
+                self.publish({"op": "rename", "old": event.old_name, "new": event.household_name})
+            elif isinstance(event, events.MembershipChanged) :
+                self.publish(_membership_operation(event))
+
+    ## Replicate a household which already exists, such as one loaded at start.
+    #
+    def add_household(self, household) :
+        self.publish(_create_operation(household, household.household_name, household.snapshot()))
+
+    ## Give an operation the next offset and send it to the followers.
+    #  @param operation a dictionary
+    #
+    def publish(self, operation) :
+        with self._condition :
+            operation["offset"] = self._replica.offset + 1
+            operation["type"] = "op"
+            if not self._replica.apply(operation) :
+                # The operation is still sent: the followers which cannot
+                # apply it either will ask for a snapshot.
+                self._replica.offset = operation["offset"]
+            self._operations.append((operation["offset"], json.dumps(operation) + "\n",
+                                     time.monotonic()))
+            self._condition.notify_all()
+
+    ## Return how far behind each follower is.
+    #  @return a dictionary follower number -> (address, number of operations
+    #          not acknowledged, seconds since the oldest of them was published)
+    #
+    def lag(self) :
+        with self._condition :
+            now = time.monotonic()
+            lags = {}
+            for (number, (address, acknowledged)) in self._followers.items() :
+                behind = self._replica.offset - acknowledged
+                seconds = 0.0
+                if behind > 0 and self._operations :
+                    position = acknowledged + 1 - self._operations[0][0]
+                    published = self._operations[max(0, position)][2]
+                    seconds = now - published
+                lags[number] = (address, behind, seconds)
+            return lags
+
+    ## Stop following the change feed and close the connections.
+    #
+    def close(self) :
+        if self._subscription is not None :
+            self._feed.unsubscribe(self._subscription)
+            self._subscription = None
+        with self._condition :
+            self._closed = True
+            self._condition.notify_all()
+        self._server.close()
+
+    def _accept(self) :
+        while not self._closed :
+            try :
+                (connection, address) = self._server.accept()
+            except OSError :
+                return
+            threading.Thread(target=self._serve, args=(connection, address), daemon=True).start()
+
+    ## Send the operations to a follower and read its acknowledgements.
+    #
+    def _serve(self, connection, address) :
+        number = next(self._follower_numbers)
+        reader = connection.makefile("r", encoding="utf-8")
+        try :
+            hello = json.loads(reader.readline())
+            with self._condition :
+                self._followers[number] = [address, hello["offset"]]
+            threading.Thread(target=self._read_acknowledgements, args=(reader, number),
+                             daemon=True).start()
+            self._send(connection, hello["offset"], hello.get("snapshot", False))
+        except (OSError, ValueError, KeyError) :
+            pass
+        finally :
+            with self._condition :
+                self._followers.pop(number, None)
+            connection.close()
+
+    ## Send the operations after an offset to a follower, starting with a
+    #  snapshot if the operations are no longer in the log or if the
+    #  follower asked for one.
+    #
+    def _send(self, connection, position, send_snapshot=False) :
+        while True :
+            with self._condition :
+                if self._closed :
+                    return
+                if position == self._replica.offset and not send_snapshot :
+                    self._condition.wait(self.heartbeat)
+                lines = None if send_snapshot else self._lines_after(position)
+                send_snapshot = False
+                if lines is None :
+                    snapshot = self._replica.snapshot()
+                    snapshot["type"] = "snapshot"
+                    lines = [json.dumps(snapshot) + "\n"]
+                    position = snapshot["offset"]
+                elif lines :
+                    position += len(lines)
+                else :
+                    lines = [json.dumps({"type": "heartbeat", "offset": position}) + "\n"]
+            connection.sendall("".join(lines).encode("utf-8"))
+
+    ## Return the lines of the operations after an offset, None if some of
+    #  them are no longer in the log.
+    #
+    def _lines_after(self, position) :
+        if position > self._replica.offset :
+            return None
+        if position == self._replica.offset :
+            return []
+        if not self._operations or self._operations[0][0] > position + 1 :
+            return None
+        start = position + 1 - self._operations[0][0]
+        return [line for (offset, line, published)
+                in itertools.islice(self._operations, start, None)]
+
+    def _read_acknowledgements(self, reader, number) :
+        try :
+            for line in reader :
+                message = json.loads(line)
+                with self._condition :
+                    if number in self._followers :
+                        self._followers[number][1] = message["offset"]
+        except (OSError, ValueError, KeyError) :
+            pass
+
+
+def _create_operation(household, household_name, snapshot) :
+    record = household.to_record()
+    record["household_name"] = household_name
+    record["log"] = {name: dict(chores) for (name, chores) in snapshot.items()}
+    return {"op": "create", "record": record}
+
+
+def _membership_operation(event) :
+    household = event.household
+    operation = {"op": event.kind, "household": event.household_name, "name": event.name}
+    if event.kind == events.MEMBERSHIP_CHORE_ADDED :
+        frequencies = {chore.chore_name: chore.frequency for chore in household.chores.chores}
+        operation["frequency"] = frequencies.get(event.name, Chore.MINIMUM_CHORE_FREQUENCY)
+    elif event.kind == events.MEMBERSHIP_PARTICIPANTS_REPLACED :
+        operation["participants"] = list(household.participants.participants)
+    elif event.kind == events.MEMBERSHIP_CHORES_REPLACED :
+        operation["chores"] = [[chore.chore_name, chore.frequency]
+                               for chore in household.chores.chores]
+    return operation
+
+
+class ReplicationFollower() :
+
+    ACKNOWLEDGE_EVERY = 100     # Operations applied between acknowledgements
+    RETRY = 0.5                 # Seconds before connecting again
+
+    ## Constructor for a follower. Starts following the leader.
+    #  @param leader_address the (host, port) of the leader
+    #
+    def __init__(self, leader_address) :
+        self.leader_address = tuple(leader_address)
+        self.replica = Replica()
+        self.leader_offset = 0      # Latest offset the leader has told about
+        self.connected = False
+        self.reconnections = 0      # Connections lost or given up
+        self._needs_snapshot = False
+        self._closed = False
+        self._server = None
+        threading.Thread(target=self._follow, daemon=True).start()
+
+    ## Return the number of operations of the leader not applied yet.
+    #
+    def lag(self) :
+        return max(0, self.leader_offset - self.replica.offset)
+
+    ## Write the household view of the replicated households.
+    #  @param stream the text stream to write to, sys.stdout by default
+    #  @param report_format one of report_module.FORMATS
+    #
+    def view_household(self, stream=None, report_format=report_module.TEXT) :
+        with self.replica.lock :
+            report_module.write_view(list(self.replica.households.values()), stream, report_format)
+
+    ## Write the leaderboard of the replicated households.
+    #
+    def show_leaderboard(self, stream=None, report_format=report_module.TEXT) :
+        with self.replica.lock :
+            report_module.write_leaderboard(list(self.replica.households.values()), stream,
+                                            report_format)
+
+    ## Answer queries on a socket (see query()).
+    #  @return the (host, port) the queries are answered on
+    #
+    def serve(self, host="127.0.0.1", port=0) :
+        self._server = socket.create_server((host, port))
+        threading.Thread(target=self._accept_queries, daemon=True).start()
+        return self._server.getsockname()
+
+    def close(self) :
+        self._closed = True
+        if self._server is not None :
+            self._server.close()
+
+    ## Follow the leader, connecting again whenever the connection is lost,
+    #  a message cannot be read or an operation cannot be applied.
+    #
+    def _follow(self) :
+        while not self._closed :
+            try :
+                with socket.create_connection(self.leader_address) as connection :
+                    self.connected = True
+                    self._receive(connection)
+            except (OSError, ValueError, KeyError, TypeError) :
+                pass
+            finally :
+                self.connected = False
+            if not self._closed :
+                self.reconnections += 1
+                time.sleep(self.RETRY)
+
+    def _receive(self, connection) :
+        hello = {"offset": self.replica.offset}
+        if self._needs_snapshot :
+            hello["snapshot"] = True
+        connection.sendall((json.dumps(hello) + "\n").encode("utf-8"))
+        acknowledged = self.replica.offset
+        for line in connection.makefile("r", encoding="utf-8") :
+            if self._closed :
+                return
+            message = json.loads(line)
+            if message["type"] == "snapshot" :
+                self.replica.load(message)
+                self.leader_offset = message["offset"]
+                self._needs_snapshot = False
+            elif message["type"] == "op" :
+                if not self.replica.apply(message) :
+                    self._needs_snapshot = True
+                    return
+            self.leader_offset = max(self.leader_offset, message["offset"])
+            if message["type"] != "op" or \
+                    self.replica.offset - acknowledged >= self.ACKNOWLEDGE_EVERY :
+                acknowledged = self.replica.offset
+                connection.sendall((json.dumps({"offset": acknowledged}) + "\n").encode("utf-8"))
+
+    def _accept_queries(self) :
+        while not self._closed :
+            try :
+                (connection, address) = self._server.accept()
+            except OSError :
+                return
+            threading.Thread(target=self._answer, args=(connection,), daemon=True).start()
+
+    def _answer(self, connection) :
+        with connection, connection.makefile("rw", encoding="utf-8") as stream :
+            for line in stream :
+                try :
+                    request = json.loads(line)
+                    report = _StringWriter()
+                    if request.get("query") == "view" :
+                        self.view_household(report, request.get("format", report_module.TEXT))
+                    elif request.get("query") == "leaderboard" :
+                        self.show_leaderboard(report, request.get("format", report_module.TEXT))
+                    elif request.get("query") != "lag" :
+                        raise ValueError("A follower only answers view, leaderboard and lag queries")
+                    answer = {"offset": self.replica.offset, "lag": self.lag(),
+                              "report": "".join(report.parts)}
+                except ValueError as err :
+                    answer = {"error": str(err)}
+                stream.write(json.dumps(answer) + "\n")
+                stream.flush()
+
+
+class _StringWriter() :
+
+    def __init__(self) :
+        self.parts = []
+
+    def write(self, text) :
+        self.parts.append(text)
+        return len(text)
+
+
+## Ask a follower for a report.
+#  @param address the (host, port) returned by ReplicationFollower.serve()
+#  @param name "view", "leaderboard" or "lag"
+#  @return a dictionary with the follower's offset, its lag and the report
+#  @exception ValueError if the follower refused the query
+#
+def query(address, name, report_format=report_module.TEXT) :
+    with socket.create_connection(tuple(address)) as connection, \
+            connection.makefile("rw", encoding="utf-8") as stream :
+        stream.write(json.dumps({"query": name, "format": report_format}) + "\n")
+        stream.flush()
+        answer = json.loads(stream.readline())
+    if "error" in answer :
+        raise ValueError(answer["error"])
+    return answer
+
+
+## Run a follower until the process is stopped.
+#
+def follow(leader_address, query_address) :
+    follower = ReplicationFollower(leader_address)
+    follower.serve(*query_address)
+    while True :
+        time.sleep(3600)
+
+
+## main method
+#
+# Runs a leader in this process and followers in other processes.
+#
+def main():
+    import multiprocessing
+
+    if sys.argv[1:2] == ["follow"] :
+        follow((sys.argv[2], int(sys.argv[3])), ("127.0.0.1", int(sys.argv[4])))
+        return
+
+    feed = events.ChangeFeed(batch_size=10)
+    Household.change_feed = feed
+    leader = ReplicationLeader(log_size=20, heartbeat=0.2)
+    leader.attach(feed)
+
+    def start_follower() :
+        with socket.create_server(("127.0.0.1", 0)) as probe :
+            query_address = probe.getsockname()
+        process = multiprocessing.Process(target=follow, args=(leader.address, query_address),
+                                          daemon=True)
+        process.start()
+        return (process, query_address)
+
+    def wait_for(query_address) :
+        for i in range(100) :
+            try :
+                answer = query(query_address, "lag")
+                if answer["offset"] == leader.offset :
+                    return answer
+            except OSError :
+                pass
+            time.sleep(0.05)
+        raise RuntimeError("The follower did not catch up")
+
+    followers = [start_follower() for i in range(2)]
+
+    print("Test 1: Replicate households and logged chores to two followers")
+    chores = {Chore("wash up", 4), Chore("dusting", 1)}
+    for i in range(50) :
+        household = Household("House{}".format(i), {"personA", "personB"}, chores)
+        feed.publish(events.household_created(household))
+        household.update_log("personA", "wash up", i % 5 + 1)
+    household.add_participant("personC")
+    household.update_log("personC", "dusting", 3)
+    household.household_name = "Flat49"
+    feed.flush()
+    for (process, query_address) in followers :
+        print("\tVALID: ", wait_for(query_address)["offset"], "==", leader.offset)
+    print("\tVALID: ", query(followers[0][1], "leaderboard", report_module.JSON_LINES)
+          ["report"].splitlines()[-1])
+    time.sleep(0.5)
+    print("\tVALID: ", leader.lag())
+
+    print("\nTest 2: A late follower catches up from a snapshot")
+    household.update_log("personB", "dusting", 1)
+    feed.flush()
+    late = start_follower()
+    print("\tVALID: ", wait_for(late[1])["offset"], "==", leader.offset)
+
+    print("\nTest 3: A follower which cannot apply an operation asks for a snapshot")
+    follower = ReplicationFollower(leader.address)
+    for i in range(100) :
+        if follower.replica.offset == leader.offset :
+            break
+        time.sleep(0.05)
+    with follower.replica.lock :
+        del follower.replica.households["Flat49"]
+    household.update_log("personA", "dusting", 1)
+    feed.flush()
+    for i in range(100) :
+        if follower.replica.offset == leader.offset :
+            break
+        time.sleep(0.05)
+    print("\tVALID: ", follower.replica.offset, "==", leader.offset, follower.replica.errors,
+          follower.reconnections, "Flat49" in follower.replica.households)
+    follower.close()
+
+    print("\nTest 4: Write to a follower")
+    try:
+        query(late[1], "log")
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    for (process, query_address) in followers + [late] :
+        process.terminate()
+    leader.close()
+    Household.change_feed = None
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+##
+#  This module renders households as reports.
+#
+#  Two reports are available: the household view (name, participants and
+#  chores) and the leaderboard (the chore log of every household, or the
+#  ranking of the participants computed by a store).  Each can
+#  be written as text, in the layout used by the Chore Chart menus, as CSV or
+#  as JSON Lines (one JSON object per household).  The report is collected
+#  in a buffer and written to the output in large blocks, so writing many
+#  households to a file or a pipe costs few write calls.
+
+import csv
+import json
+import sys
+
+TEXT = "text"
+CSV = "csv"
+JSON_LINES = "jsonl"
+FORMATS = [TEXT, CSV, JSON_LINES]
+
+BLOCK_SIZE = 1 << 16    # Characters collected before they are written
+
+
+class BufferedReportWriter() :
+
+    ## Constructor for a writer collecting text for a stream.
+    #  @param the_stream a text stream, such as sys.stdout or an open file
+    #  @param block_size the number of characters collected before writing
+    #
+    def __init__(self, the_stream, block_size=BLOCK_SIZE) :
+        self.stream = the_stream
+        self.block_size = block_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text) :
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.block_size :
+            self.flush()
+        return len(text)
+
+    def flush(self) :
+        if self._parts :
+            self.stream.write("".join(self._parts))
+            self._parts = []
+            self._size = 0
+
+
+## Write the household view of households.
+#  @param all_households a list of household objects
+#  @param stream the text stream to write to
+#  @param report_format one of FORMATS
+#
+def write_view(all_households, stream=None, report_format=TEXT) :
+    out = _start(stream, report_format)
+    if report_format == TEXT :
+        for household in all_households :
+            out.write("View Household:\n" + household.household_name + "\nParticipants:\n")
+            for participant in household.participants.participants :
+                out.write("\t " + participant + "\n")
+            out.write("weekly chroes:\n\t " + str(household.chores) + "\n")
+    elif report_format == CSV :
+        rows = csv.writer(out)
+        rows.writerow(["household", "participant", "chore", "frequency"])
+        for household in all_households :
+            chores = household.chores.chores
+            for participant in household.participants.participants :
+                rows.writerows([household.household_name, participant,
+                                chore.chore_name, chore.frequency] for chore in chores)
+    else :
+        for household in all_households :
+            out.write(json.dumps({
+                "household": household.household_name,
+                "participants": list(household.participants.participants),
+                "chores": {chore.chore_name: chore.frequency
+                           for chore in household.chores.chores}}) + "\n")
+    out.flush()
+
+
+## Write the leaderboard of households, read from a snapshot of each chore log.
+#  @param all_households a list of household objects
+#  @param stream the text stream to write to
+#  @param report_format one of FORMATS
+#
+def write_leaderboard(all_households, stream=None, report_format=TEXT) :
+    out = _start(stream, report_format)
+    if report_format == TEXT :
+        out.write("Leaderboard:\n\n")
+        for household in all_households :
+            out.write(household.household_name + " : \n\n")
+            for (participant, chores) in household.snapshot().items() :
+                out.write("\t " + participant + "  :\n")
+                for (chore, number) in chores.items() :
+                    out.write("\t\t " + chore + "    ( " + str(number) + " )\n")
+    elif report_format == CSV :
+        rows = csv.writer(out)
+        rows.writerow(["household", "participant", "chore", "completed"])
+        for household in all_households :
+            name = household.household_name
+            for (participant, chores) in household.snapshot().items() :
+                rows.writerows([name, participant, chore, number]
+                               for (chore, number) in chores.items())
+    else :
+        for household in all_households :
+            snapshot = household.snapshot()
+            out.write(json.dumps({
+                "household": household.household_name,
+                "version": snapshot.version,
+                "log": {participant: dict(chores)
+                        for (participant, chores) in snapshot.items()}}) + "\n")
+    out.flush()
+
+
+## Write a leaderboard ranking the participants by the chores they have done.
+#  @param rows (household name, participant, total completed) tuples, best
+#         first, such as those of SQLiteHouseholdStore.leaderboard()
+#  @param stream the text stream to write to
+#  @param report_format one of FORMATS
+#
+def write_ranking(rows, stream=None, report_format=TEXT) :
+    out = _start(stream, report_format)
+    if report_format == TEXT :
+        out.write("Leaderboard:\n\n")
+        for (household_name, participant, total) in rows :
+            out.write("\t " + household_name + " : " + participant + "    ( " + str(total) + " )\n")
+    elif report_format == CSV :
+        rows_out = csv.writer(out)
+        rows_out.writerow(["household", "participant", "completed"])
+        rows_out.writerows(rows)
+    else :
+        for (household_name, participant, total) in rows :
+            out.write(json.dumps({"household": household_name, "participant": participant,
+                                  "completed": total}) + "\n")
+    out.flush()
+
+
+def _start(stream, report_format) :
+    if report_format not in FORMATS :
+        raise ValueError("Report format must be one of {}".format(", ".join(FORMATS)))
+    return BufferedReportWriter(sys.stdout if stream is None else stream)
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    from household_module import Household
+    from chore_list_module import Chore
+
+    h = Household("House1", {"personA","personB"}, {Chore("wash up", 4), Chore("dusting",1)})
+    h.update_log("personA", "wash up", 3)
+
+    for report_format in FORMATS :
+        print("\nTest: Write the view and the leaderboard as {}".format(report_format))
+        write_view([h], report_format=report_format)
+        write_leaderboard([h], report_format=report_format)
+        write_ranking([("House1", "personA", 3), ("House1", "personB", 0)],
+                      report_format=report_format)
+
+    print("\nTest: Write an invalid format")
+    try:
+        write_view([h], report_format="xml")
+    except Exception as err:
+        print("\tERROR: ", err)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+##
+#  This module finds households, participants and chores by name.
+#
+#  The names are kept in prefix tries, so the cost of a type-ahead lookup
+#  depends on the length of what was typed and the number of results
+#  wanted, not on the number of households.  Misspelt names are found by a
+#  fuzzy search which walks the trie computing the edit distance to the
+#  query one row at a time and abandons a branch as soon as every entry of
+#  the row is over the allowed distance.
+#
+#  The search index follows a change feed, so it is kept up to date as
+#  households are created, renamed or change their participants and chores.
+#  Lookups ignore case.
+
+import household_events_module as events
+
+
+class TrieNode() :
+
+    __slots__ = ("children", "entries")
+
+    def __init__(self) :
+        self.children = {}  # character -> TrieNode
+        self.entries = {}   # original key -> set of values
+
+
+class Trie() :
+
+    def __init__(self) :
+        self.root = TrieNode()
+        self.size = 0       # Number of (key, value) pairs
+
+    ## Add a value under a key.
+    #
+    def insert(self, key, value) :
+        node = self.root
+        for character in key.lower() :
+            child = node.children.get(character)
+            if child is None :
+                child = TrieNode()
+                node.children[character] = child
+            node = child
+        values = node.entries.setdefault(key, set())
+        if value not in values :
+            values.add(value)
+            self.size += 1
+
+    ## Remove a value from a key, pruning the nodes left empty.
+    #  @return True if the value was under the key
+    #
+    def remove(self, key, value) :
+        path = [self.root]
+        for character in key.lower() :
+            node = path[-1].children.get(character)
+            if node is None :
+                return False
+            path.append(node)
+
+        values = path[-1].entries.get(key)
+        if values is None or value not in values :
+            return False
+        values.discard(value)
+        self.size -= 1
+        if not values :
+            del path[-1].entries[key]
+
+        lowered = key.lower()
+        for i in range(len(lowered), 0, -1) :
+            node = path[i]
+            if node.children or node.entries :
+                break
+            del path[i - 1].children[lowered[i - 1]]
+        return True
+
+    ## Find the keys starting with a prefix, the prefix itself first.
+    #  The subtree is walked depth first and the walk stops as soon as
+    #  `limit` keys have been found.
+    #  @param prefix the start of the keys
+    #  @param limit the maximum number of keys returned
+    #  @return a list of (key, set of values)
+    #
+    def prefix(self, prefix, limit=10) :
+        node = self.root
+        for character in prefix.lower() :
+            node = node.children.get(character)
+            if node is None :
+                return []
+
+        results = []
+        stack = [node]
+        while stack and len(results) < limit :
+            node = stack.pop()
+            for (key, values) in node.entries.items() :
+                results.append((key, set(values)))
+            stack.extend(reversed(node.children.values()))
+        return results[:limit]
+
+    ## Find the keys within an edit distance of a query, closest first.
+    #  @param query the misspelt key
+    #  @param max_distance the maximum number of inserted, deleted or
+    #         replaced characters
+    #  @param limit the maximum number of keys returned
+    #  @return a list of (key, distance, set of values)
+    #
+    def fuzzy(self, query, max_distance=2, limit=10) :
+        query = query.lower()
+        results = []
+        first_row = list(range(len(query) + 1))
+        for (character, child) in self.root.children.items() :
+            self._fuzzy(child, character, query, first_row, max_distance, results)
+        results.sort(key=lambda result: (result[1], result[0]))
+        return results[:limit]
+
+    def _fuzzy(self, node, character, query, previous_row, max_distance, results) :
+        row = [previous_row[0] + 1]
+        for i in range(1, len(query) + 1) :
+            cost = 0 if query[i - 1] == character else 1
+            row.append(min(row[i - 1] + 1, previous_row[i] + 1, previous_row[i - 1] + cost))
+
+        if row[-1] <= max_distance :
+            for (key, values) in node.entries.items() :
+                results.append((key, row[-1], set(values)))
+        if min(row) <= max_distance :
+            for (next_character, child) in node.children.items() :
+                self._fuzzy(child, next_character, query, row, max_distance, results)
+
+
+class SearchIndex() :
+
+    HOUSEHOLDS = "households"
+    PARTICIPANTS = "participants"
+    CHORES = "chores"
+
+    ## Constructor for an empty index.
+    #  The households are found by name, the participants and chores give
+    #  the names of the households they belong to.  Each household name is
+    #  also given the position of the household in the order the households
+    #  were added, which is its position in the application's list.
+    #
+    def __init__(self) :
+        self.tries = {SearchIndex.HOUSEHOLDS: Trie(),
+                      SearchIndex.PARTICIPANTS: Trie(),
+                      SearchIndex.CHORES: Trie()}
+        self._members = {}      # household name -> (participant names, chore names)
+        self._positions = {}    # household name -> position
+        self._next_position = 0
+
+    ## Follow a change feed.
+    #  @param the_feed a ChangeFeed
+    #
+    def attach(self, the_feed) :
+        return the_feed.subscribe(self.apply_events, (events.HouseholdCreated,
+                                                      events.HouseholdRenamed,
+                                                      events.MembershipChanged))
+
+    ## Apply a batch of events from a change feed.
+    #
+    def apply_events(self, batch) :
+        for event in batch :
+            if isinstance(event, events.HouseholdCreated) :
+                self.add_household(event.household, event.household_name)
+            elif isinstance(event, events.HouseholdRenamed) :
+                self._remove_names(event.old_name)
+                if event.old_name in self._positions :
+                    self._positions[event.household_name] = self._positions.pop(event.old_name)
+                self.add_household(event.household, event.household_name)
+            elif isinstance(event, events.MembershipChanged) :
+                self.add_household(event.household, event.household_name)
+
+    ## Add the names of a household.
+    #  @param household the Household object
+    #  @param household_name the name to index it under, its name by default
+    #
+    def add_household(self, household, household_name=None) :
+        name = household_name or household.household_name
+        self._remove_names(name)
+        if name not in self._positions :
+            self._positions[name] = self._next_position
+            self._next_position += 1
+        participants = list(household.participants.participants)
+        chores = household.chore_names()
+        self.tries[SearchIndex.HOUSEHOLDS].insert(name, name)
+        for participant in participants :
+            self.tries[SearchIndex.PARTICIPANTS].insert(participant, name)
+        for chore in chores :
+            self.tries[SearchIndex.CHORES].insert(chore, name)
+        self._members[name] = (participants, chores)
+
+    ## Return the position of a household, None if it is not indexed.
+    #
+    def position(self, household_name) :
+        return self._positions.get(household_name)
+
+    ## Remove the names of a household.
+    #
+    def remove_household(self, household_name) :
+        self._remove_names(household_name)
+        self._positions.pop(household_name, None)
+
+    def _remove_names(self, household_name) :
+        members = self._members.pop(household_name, None)
+        if members is None :
+            return
+        self.tries[SearchIndex.HOUSEHOLDS].remove(household_name, household_name)
+        for participant in members[0] :
+            self.tries[SearchIndex.PARTICIPANTS].remove(participant, household_name)
+        for chore in members[1] :
+            self.tries[SearchIndex.CHORES].remove(chore, household_name)
+
+    ## Find names by prefix, falling back on a fuzzy search.
+    #  @param kind HOUSEHOLDS, PARTICIPANTS or CHORES
+    #  @param query what was typed
+    #  @param limit the maximum number of names returned
+    #  @param max_distance the edit distance allowed by the fuzzy search
+    #  @return a list of (name, set of household names)
+    #
+    def search(self, kind, query, limit=10, max_distance=2) :
+        trie = self.tries[kind]
+        results = trie.prefix(query, limit)
+        if not results :
+            results = [(key, values) for (key, distance, values)
+                       in trie.fuzzy(query, max_distance, limit)]
+        return results
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    index = SearchIndex()
+    for name in ["House1", "House2", "Flat", "Houseboat"] :
+        index.tries[SearchIndex.HOUSEHOLDS].insert(name, name)
+
+    print("Test 1: Find the households starting with 'hou'")
+    print("\tVALID: ", index.search(SearchIndex.HOUSEHOLDS, "hou"))
+
+    print("\nTest 2: Find the misspelt household 'Falt'")
+    print("\tVALID: ", index.search(SearchIndex.HOUSEHOLDS, "Falt"))
+
+    print("\nTest 3: Remove 'House1' and search again")
+    index.tries[SearchIndex.HOUSEHOLDS].remove("House1", "House1")
+    print("\tVALID: ", index.search(SearchIndex.HOUSEHOLDS, "House"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+##
+#  This module spreads the households over several worker processes.
+#
+#  Each household belongs to one worker, chosen by consistent hashing of
+#  its name: every worker owns many points on a hash ring and a household
+#  goes to the worker owning the first point after the hash of its name.
+#  When a worker is added it takes over only the households whose names
+#  fall just before its points, about 1/N of them, and the other workers
+#  keep theirs.
+#
+#  ShardedHouseholds is the router: it forwards each operation to the
+#  worker owning the household, sends batches of updates to all the workers
+#  at once so they are applied in parallel, and merges the leaderboards of
+#  the workers.
+#
+#  The workers' households publish no events and are not validated: a
+#  forked worker starts with a copy of the parent's Household.change_feed
+#  and Household.log_validator, whose subscribers' connections and state
+#  belong to the parent, so the worker clears them.
+
+import hashlib
+import heapq
+import multiprocessing
+from bisect import bisect_right
+
+from household_module import Household
+from chore_list_module import Chore
+
+
+## Return a 64 bit hash of a string, the same in every process.
+#
+def stable_hash(key) :
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing() :
+
+    REPLICAS = 100  # Points on the ring for each node
+
+    ## Constructor for a ring.
+    #  @param the_nodes the node identifiers
+    #  @param replicas the number of points of each node
+    #
+    def __init__(self, the_nodes=(), replicas=REPLICAS) :
+        self.replicas = replicas
+        self._points = []   # sorted hashes
+        self._owners = []   # node owning each point
+        for node in the_nodes :
+            self.add(node)
+
+    def add(self, node) :
+        for i in range(self.replicas) :
+            point = stable_hash("{}#{}".format(node, i))
+            position = bisect_right(self._points, point)
+            self._points.insert(position, point)
+            self._owners.insert(position, node)
+
+    def remove(self, node) :
+        kept = [(point, owner) for (point, owner) in zip(self._points, self._owners)
+                if owner != node]
+        self._points = [point for (point, owner) in kept]
+        self._owners = [owner for (point, owner) in kept]
+
+    ## Return the node owning a key.
+    #
+    def node_for(self, key) :
+        if not self._points :
+            raise LookupError("The hash ring has no nodes")
+        position = bisect_right(self._points, stable_hash(key)) % len(self._points)
+        return self._owners[position]
+
+
+## Main loop of a worker process: apply the requests received on the
+#  connection to the worker's households and send back the results.
+#
+def _worker_main(connection) :
+    Household.change_feed = None
+    Household.log_validator = None
+    households = {}
+    while True :
+        (operation, arguments) = connection.recv()
+        if operation == "stop" :
+            connection.close()
+            return
+        try :
+            result = _WORKER_OPERATIONS[operation](households, *arguments)
+            connection.send((True, result))
+        except Exception as err :
+            connection.send((False, err))
+
+
+def _create(households, record) :
+    name = record["household_name"]
+    if name in households :
+        raise ValueError("Household {} already exists".format(name))
+    households[name] = Household.from_record(record)
+    return households[name].to_record()
+
+
+def _log(households, updates) :
+    applied = 0
+    for (name, participant, chore, number_completed) in updates :
+        if households[name].update_log(participant, chore, number_completed) :
+            applied += 1
+    return applied
+
+
+def _view(households, name) :
+    household = households.get(name)
+    return None if household is None else household.to_record()
+
+
+def _leaderboard(households, limit) :
+    totals = ((sum(chores.values()), name, participant)
+              for (name, household) in households.items()
+              for (participant, chores) in household.snapshot().items())
+    return heapq.nlargest(limit, totals)
+
+
+def _names(households) :
+    return list(households)
+
+
+def _export(households, names) :
+    return [households.pop(name).to_record() for name in names]
+
+
+def _import(households, records) :
+    for record in records :
+        households[record["household_name"]] = Household.from_record(record)
+    return len(records)
+
+
+_WORKER_OPERATIONS = {"create": _create, "log": _log, "view": _view,
+                      "leaderboard": _leaderboard, "names": _names,
+                      "export": _export, "import": _import}
+
+
+class ShardedHouseholds() :
+
+    WORKERS = 4
+
+    ## Constructor for the router. Starts the worker processes.
+    #  @param workers the number of worker processes
+    #
+    def __init__(self, workers=WORKERS) :
+        self._connections = {}  # worker id -> connection
+        self._processes = {}
+        self._next_id = 0
+        self.ring = HashRing()
+        for i in range(workers) :
+            self._start_worker()
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) :
+        self.close()
+        return False
+
+    ## Create a household on the worker owning its name.
+    #  @return the household as a record (see Household.to_record())
+    #
+    def create_household(self, household_name, the_participants, the_chores) :
+        Household.is_valid_name(household_name)
+        record = {"household_name": household_name,
+                  "participants": list(the_participants),
+                  "chores": [[chore.chore_name, chore.frequency] for chore in the_chores],
+                  "lazy_log": False, "log": {}}
+        return self._call(self.ring.node_for(household_name), "create", record)
+
+    ## Update the chore log of a household.
+    #
+    def update_log(self, household_name, name, chore, number_completed) :
+        self._call(self.ring.node_for(household_name), "log",
+                   [(household_name, name, chore, number_completed)])
+
+    ## Apply many updates, the workers applying their share in parallel.
+    #  @param updates a list of (household name, participant, chore, number)
+    #
+    def update_logs(self, updates) :
+        by_worker = {}
+        for update in updates :
+            by_worker.setdefault(self.ring.node_for(update[0]), []).append(update)
+        self._call_all({worker: ("log", (batch,)) for (worker, batch) in by_worker.items()})
+
+    ## Return a household as a record, None if there is no such household.
+    #
+    def view_household(self, household_name) :
+        return self._call(self.ring.node_for(household_name), "view", household_name)
+
+    ## Return the participants with the most chores done in all the households.
+    #  @param limit the number of participants
+    #  @return a list of (total completed, household name, participant)
+    #
+    def leaderboard(self, limit=10) :
+        results = self._call_all({worker: ("leaderboard", (limit,))
+                                  for worker in self._connections})
+        return heapq.nlargest(limit, [row for rows in results.values() for row in rows])
+
+    ## Return the number of households of each worker.
+    #
+    def distribution(self) :
+        results = self._call_all({worker: ("names", ()) for worker in self._connections})
+        return {worker: len(names) for (worker, names) in results.items()}
+
+    ## Start a worker and move to it the households it now owns.
+    #  @return the number of households moved
+    #
+    def add_worker(self) :
+        new_worker = self._start_worker()
+        results = self._call_all({worker: ("names", ()) for worker in self._connections
+                                  if worker != new_worker})
+        moved = 0
+        for (worker, names) in results.items() :
+            leaving = [name for name in names if self.ring.node_for(name) == new_worker]
+            if leaving :
+                records = self._call(worker, "export", leaving)
+                moved += self._call(new_worker, "import", records)
+        return moved
+
+    ## Stop a worker, moving its households to the other workers.
+    #  @return the number of households moved
+    #
+    def remove_worker(self, worker) :
+        if len(self._connections) == 1 :
+            raise ValueError("The last worker cannot be removed")
+        records = self._call(worker, "export", self._call(worker, "names"))
+        self.ring.remove(worker)
+        self._stop_worker(worker)
+        by_worker = {}
+        for record in records :
+            by_worker.setdefault(self.ring.node_for(record["household_name"]), []).append(record)
+        self._call_all({owner: ("import", (batch,)) for (owner, batch) in by_worker.items()})
+        return len(records)
+
+    ## Stop all the workers.
+    #
+    def close(self) :
+        for worker in list(self._connections) :
+            self._stop_worker(worker)
+
+    def _start_worker(self) :
+        worker = self._next_id
+        self._next_id += 1
+        (router_end, worker_end) = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_main, args=(worker_end,), daemon=True)
+        process.start()
+        worker_end.close()
+        self._connections[worker] = router_end
+        self._processes[worker] = process
+        self.ring.add(worker)
+        return worker
+
+    def _stop_worker(self, worker) :
+        connection = self._connections.pop(worker)
+        connection.send(("stop", ()))
+        connection.close()
+        self._processes.pop(worker).join()
+
+    def _call(self, worker, operation, *arguments) :
+        connection = self._connections[worker]
+        connection.send((operation, arguments))
+        return self._result(connection)
+
+    ## Send requests to several workers, then wait for all the results.
+    #  @param requests a dictionary worker -> (operation, arguments)
+    #  @return a dictionary worker -> result
+    #
+    def _call_all(self, requests) :
+        for (worker, request) in requests.items() :
+            self._connections[worker].send(request)
+        results = {}
+        error = None
+        for worker in requests :
+            try :
+                results[worker] = self._result(self._connections[worker])
+            except Exception as err :
+                error = err
+        if error is not None :
+            raise error
+        return results
+
+    def _result(self, connection) :
+        (ok, result) = connection.recv()
+        if not ok :
+            raise result
+        return result
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    chores = {Chore("wash up", 4), Chore("dusting", 1)}
+    with ShardedHouseholds(workers=4) as fleet :
+        print("Test 1: Create 1000 households over 4 workers")
+        for i in range(1000) :
+            fleet.create_household("House{}".format(i), {"personA", "personB"}, chores)
+        print("\tVALID: ", fleet.distribution())
+
+        print("\nTest 2: Log chores and show the fleet leaderboard")
+        fleet.update_logs([("House{}".format(i), "personA", "wash up", i % 7)
+                           for i in range(1000)])
+        fleet.update_log("House5", "personB", "dusting", 20)
+        print("\tVALID: ", fleet.leaderboard(3))
+
+        print("\nTest 3: Add a worker")
+        print("\tVALID: moved", fleet.add_worker(), fleet.distribution())
+        print("\tVALID: ", fleet.view_household("House5")["log"])
+
+        print("\nTest 4: Log chores for an unknown household")
+        try:
+            fleet.update_log("Nowhere", "personA", "wash up", 1)
+        except Exception as err:
+            print("\tERROR: ", repr(err))
+
+if __name__ == "__main__":
+    main()
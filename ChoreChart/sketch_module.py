@@ -0,0 +1,435 @@
+##
+#  This module keeps approximate statistics over the logged chores.
+#
+#  The statistics are computed from the LogIncremented events of a change
+#  feed instead of the chore logs, with sketches whose size does not depend
+#  on the number of households or events:
+#    - a Count-Min sketch counts the chores done and finds the most
+#      frequent chores (the heavy hitters);
+#    - HyperLogLog sketches count the distinct participants active on each
+#      chore and in each period;
+#    - t-digests give percentiles of the numbers of chores logged, for each
+#      household and for the whole fleet.
+#
+#  The sketches per chore and per household are kept for at most
+#  MAXIMUM_CHORES chores and MAXIMUM_HOUSEHOLDS households, the least
+#  recently updated being dropped, so the memory used is bounded whatever
+#  the number of names.  The fleet-wide sketches still count every event.
+#
+#  Sketches with the same parameters can be merged, so statistics computed
+#  by several processes (see sharding_module) can be added up.
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+import household_events_module as events
+
+
+## Return a 64 bit hash of a string, the same in every process.
+#
+def hash64(key) :
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class CountMinSketch() :
+
+    WIDTH = 2048    # Counters per row; the error is about total / WIDTH
+    DEPTH = 4       # Rows; the error is exceeded with probability e^-DEPTH
+    TOP = 32        # Heavy hitter candidates kept
+
+    ## Constructor for an empty sketch.
+    #  @param width the number of counters of each row
+    #  @param depth the number of rows
+    #  @param top the number of heavy hitter candidates kept
+    #
+    def __init__(self, width=WIDTH, depth=DEPTH, top=TOP) :
+        if width < 1 or depth < 1 or top < 1 :
+            raise ValueError("width, depth and top must be positive")
+        self.width = width
+        self.depth = depth
+        self.top = top
+        self.total = 0
+        self._rows = [[0] * width for i in range(depth)]
+        self._candidates = {}   # key -> estimate when last counted
+        self._floor = 0         # smallest candidate estimate when the candidates are full
+
+    def _columns(self, key) :
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.width for i in range(self.depth)]
+
+    ## Count a key.
+    #  @param count the number of times it was seen, not negative
+    #
+    def add(self, key, count=1) :
+        if count < 0 :
+            raise ValueError("A Count-Min sketch cannot count down")
+        estimate = None
+        for (row, column) in zip(self._rows, self._columns(key)) :
+            row[column] += count
+            estimate = row[column] if estimate is None else min(estimate, row[column])
+        self.total += count
+        self._offer(key, estimate)
+
+    ## Return an estimate of the count of a key, never below the true count.
+    #
+    def estimate(self, key) :
+        return min(row[column] for (row, column) in zip(self._rows, self._columns(key)))
+
+    ## Return the most frequent keys.
+    #  @return a list of (estimated count, key), largest first
+    #
+    def heavy_hitters(self, limit=10) :
+        return sorted(((count, key) for (key, count) in self._candidates.items()),
+                      reverse=True)[:limit]
+
+    ## Add the counts of another sketch with the same width and depth.
+    #
+    def merge(self, other) :
+        if (self.width, self.depth) != (other.width, other.depth) :
+            raise ValueError("Only sketches of the same size can be merged")
+        for (row, other_row) in zip(self._rows, other._rows) :
+            for column in range(self.width) :
+                row[column] += other_row[column]
+        self.total += other.total
+        keys = set(self._candidates) | set(other._candidates)
+        self._candidates = {}
+        self._floor = 0
+        for key in keys :
+            self._offer(key, self.estimate(key))
+
+    def _offer(self, key, estimate) :
+        if key in self._candidates or len(self._candidates) < self.top :
+            self._candidates[key] = estimate
+        elif estimate > self._floor :
+            smallest = min(self._candidates, key=self._candidates.get)
+            del self._candidates[smallest]
+            self._candidates[key] = estimate
+        else :
+            return
+        if len(self._candidates) == self.top :
+            self._floor = min(self._candidates.values())
+
+
+class HyperLogLog() :
+
+    PRECISION = 12  # 2^PRECISION registers; the error is about 1.04 / sqrt(registers)
+
+    def __init__(self, precision=PRECISION) :
+        if not 4 <= precision <= 16 :
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, key) :
+        value = hash64(key)
+        register = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self._registers[register] :
+            self._registers[register] = rank
+
+    ## Return an estimate of the number of distinct keys added.
+    #
+    def count(self) :
+        registers = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / registers)
+        estimate = alpha * registers * registers / sum(2.0 ** -rank for rank in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * registers and zeros :
+            estimate = registers * math.log(registers / zeros)
+        return round(estimate)
+
+    ## Add the keys of another sketch with the same precision.
+    #
+    def merge(self, other) :
+        if self.precision != other.precision :
+            raise ValueError("Only sketches of the same precision can be merged")
+        self._registers = bytearray(map(max, self._registers, other._registers))
+
+
+class TDigest() :
+
+    COMPRESSION = 100   # Larger keeps more centroids and is more accurate
+    BUFFER = 5          # Values buffered per unit of compression
+
+    ## Constructor for an empty digest.
+    #  @param compression bounds the number of centroids to about compression
+    #
+    def __init__(self, compression=COMPRESSION) :
+        if compression < 1 :
+            raise ValueError("compression must be positive")
+        self.compression = compression
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self._centroids = []    # sorted [mean, weight]
+        self._buffer = []
+
+    def add(self, value, weight=1) :
+        self._buffer.append([value, weight])
+        self.count += weight
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        if len(self._buffer) >= self.BUFFER * self.compression :
+            self._compress()
+
+    ## Return an estimate of a quantile.
+    #  @param q a number between 0 and 1
+    #  @exception ValueError if the digest is empty
+    #
+    def quantile(self, q) :
+        if not 0 <= q <= 1 :
+            raise ValueError("q must be between 0 and 1")
+        if self.count == 0 :
+            raise ValueError("The digest is empty")
+        self._compress()
+        target = q * self.count
+        (previous_centre, previous_mean) = (0, self.minimum)
+        cumulative = 0
+        for (mean, weight) in self._centroids :
+            centre = cumulative + weight / 2
+            if target < centre :
+                return _interpolate(target, previous_centre, previous_mean, centre, mean)
+            (previous_centre, previous_mean) = (centre, mean)
+            cumulative += weight
+        return _interpolate(target, previous_centre, previous_mean, self.count, self.maximum)
+
+    def merge(self, other) :
+        self._buffer.extend([mean, weight] for (mean, weight) in other._centroids + other._buffer)
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._compress()
+
+    def centroids(self) :
+        self._compress()
+        return len(self._centroids)
+
+    ## Merge the buffered values into the centroids. A centroid may grow
+    #  while it spans less than one unit of the scale function, which keeps
+    #  the centroids near the tails small.
+    #
+    def _compress(self) :
+        if not self._buffer :
+            return
+        points = sorted(self._centroids + self._buffer)
+        self._buffer = []
+        merged = [points[0]]
+        so_far = 0
+        limit = self._scale(0) + 1
+        for (mean, weight) in points[1:] :
+            current = merged[-1]
+            if self._scale((so_far + current[1] + weight) / self.count) <= limit :
+                total = current[1] + weight
+                current[0] += (mean - current[0]) * weight / total
+                current[1] = total
+            else :
+                so_far += current[1]
+                limit = self._scale(so_far / self.count) + 1
+                merged.append([mean, weight])
+        self._centroids = merged
+
+    def _scale(self, q) :
+        return self.compression / (2 * math.pi) * math.asin(2 * min(q, 1) - 1)
+
+
+def _interpolate(x, x0, y0, x1, y1) :
+    if x1 == x0 :
+        return y1
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+
+class ChoreStatistics() :
+
+    PERIOD = 24 * 3600          # Seconds in a period of activity
+    PERIODS = 30                # Periods kept
+    MAXIMUM_CHORES = 1000       # Chores whose participants are counted
+    MAXIMUM_HOUSEHOLDS = 1000   # Households with their own percentiles
+    HOUSEHOLD_COMPRESSION = 25  # Compression of the t-digest of a household
+
+    ## Constructor for empty statistics.
+    #  @param period the length in seconds of the activity periods
+    #  @param periods the number of periods kept
+    #  @param clock a function returning the time in seconds
+    #  @param max_chores the number of chores whose participants are counted
+    #  @param max_households the number of households with their own digest
+    #
+    def __init__(self, period=PERIOD, periods=PERIODS, clock=time.time,
+                 max_chores=MAXIMUM_CHORES, max_households=MAXIMUM_HOUSEHOLDS) :
+        self.period = period
+        self.periods = periods
+        self.max_chores = max_chores
+        self.max_households = max_households
+        self._clock = clock
+        self.chores = CountMinSketch()
+        self.fleet_digest = TDigest()
+        self._chore_participants = OrderedDict()    # chore name -> HyperLogLog
+        self._period_participants = OrderedDict()   # period number -> HyperLogLog
+        self._household_digests = OrderedDict()     # household name -> TDigest
+
+    ## Follow a change feed.
+    #  @param the_feed a ChangeFeed
+    #
+    def attach(self, the_feed) :
+        return the_feed.subscribe(self.apply_events, (events.LogIncremented,))
+
+    ## Apply a batch of events from a change feed.
+    #
+    def apply_events(self, batch) :
+        for event in batch :
+            if isinstance(event, events.LogIncremented) :
+                self.record(event.household_name, event.participant, event.chore,
+                            event.number_completed)
+
+    ## Record one chore log update.
+    #
+    def record(self, household_name, participant, chore, number_completed) :
+        self.fleet_digest.add(number_completed)
+        self._household_digest(household_name).add(number_completed)
+        if number_completed <= 0 :
+            return
+
+        self.chores.add(chore, number_completed)
+        # The same participant name in two households is two participants.
+        participant_key = household_name + "\0" + participant
+        self._chore_sketch(chore).add(participant_key)
+        period = int(self._clock() // self.period)
+        self._period_sketch(period).add(participant_key)
+        for old in [p for p in self._period_participants if p <= period - self.periods] :
+            del self._period_participants[old]
+
+    ## Return the chores done most often in all the households.
+    #  @return a list of (estimated count, chore name)
+    #
+    def top_chores(self, limit=10) :
+        return self.chores.heavy_hitters(limit)
+
+    ## Return an estimate of the number of times a chore was done.
+    #
+    def chore_count(self, chore) :
+        return self.chores.estimate(chore)
+
+    ## Return an estimate of the number of participants who did a chore,
+    #  0 if the chore is not one of the max_chores most recently done.
+    #
+    def active_participants(self, chore) :
+        sketch = self._chore_participants.get(chore)
+        return 0 if sketch is None else sketch.count()
+
+    ## Return an estimate of the number of participants active in a period.
+    #  @param periods_ago 0 for the current period, 1 for the one before...
+    #
+    def active_in_period(self, periods_ago=0) :
+        period = int(self._clock() // self.period) - periods_ago
+        sketch = self._period_participants.get(period)
+        return 0 if sketch is None else sketch.count()
+
+    ## Return a percentile of the numbers of chores logged at once.
+    #  @param q a number between 0 and 1
+    #  @param household_name a household, None for the whole fleet
+    #  @exception KeyError if the household is not one of the max_households
+    #             most recently active
+    #
+    def percentile(self, q, household_name=None) :
+        if household_name is None :
+            return self.fleet_digest.quantile(q)
+        digest = self._household_digests.get(household_name)
+        if digest is None :
+            raise KeyError(household_name)
+        return digest.quantile(q)
+
+    ## Add the statistics of another ChoreStatistics object.
+    #
+    def merge(self, other) :
+        self.chores.merge(other.chores)
+        self.fleet_digest.merge(other.fleet_digest)
+        for (chore, sketch) in other._chore_participants.items() :
+            self._chore_sketch(chore).merge(sketch)
+        for (period, sketch) in other._period_participants.items() :
+            self._period_sketch(period).merge(sketch)
+        for (name, digest) in other._household_digests.items() :
+            self._household_digest(name).merge(digest)
+
+    def _chore_sketch(self, chore) :
+        return _tracked(self._chore_participants, chore, self.max_chores, HyperLogLog)
+
+    def _period_sketch(self, period) :
+        return _tracked(self._period_participants, period, self.periods, HyperLogLog)
+
+    def _household_digest(self, household_name) :
+        return _tracked(self._household_digests, household_name, self.max_households,
+                        lambda: TDigest(self.HOUSEHOLD_COMPRESSION))
+
+
+## Return the sketch of a key, making it if needed. At most `limit`
+#  sketches are kept, the least recently used is dropped.
+#  @param sketches an OrderedDict key -> sketch
+#  @param make a function returning a new sketch
+#
+def _tracked(sketches, key, limit, make) :
+    sketch = sketches.get(key)
+    if sketch is None :
+        sketch = sketches[key] = make()
+        if len(sketches) > limit :
+            sketches.popitem(last=False)
+    else :
+        sketches.move_to_end(key)
+    return sketch
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    import itertools
+    import random
+
+    random.seed(1)
+    chores = ["chore{}".format(i) for i in range(200)]
+    weights = list(itertools.accumulate(1 / (i + 1) for i in range(200)))
+    first = ChoreStatistics()
+    second = ChoreStatistics()
+    exact = {}
+    participants = set()
+    for i in range(100000) :
+        household = "House{}".format(i % 500)
+        participant = "person{}".format(random.randrange(20))
+        chore = random.choices(chores, cum_weights=weights)[0]
+        number = random.randint(1, 10)
+        (first if i % 2 else second).record(household, participant, chore, number)
+        exact[chore] = exact.get(chore, 0) + number
+        if chore == "chore0" :
+            participants.add((household, participant))
+    first.merge(second)
+
+    print("Test 1: Find the most frequent chores")
+    print("\tVALID: ", first.top_chores(3))
+    print("\tEXACT: ", sorted(((n, c) for (c, n) in exact.items()), reverse=True)[:3])
+
+    print("\nTest 2: Count the participants who did chore0")
+    print("\tVALID: ", first.active_participants("chore0"), "exact", len(participants))
+
+    print("\nTest 3: Percentiles of the numbers logged")
+    print("\tVALID: ", [round(first.percentile(q), 2) for q in [0.1, 0.5, 0.9]],
+          round(first.percentile(0.5, "House7"), 2))
+
+    print("\nTest 4: Keep the sketches of the 10 most recent households")
+    bounded = ChoreStatistics(max_chores=5, max_households=10)
+    for i in range(10000) :
+        bounded.record("House{}".format(i), "personA", "chore{}".format(i), 1)
+    print("\tVALID: ", len(bounded._household_digests), len(bounded._chore_participants),
+          bounded.fleet_digest.count)
+
+    print("\nTest 5: Percentile of an unknown household")
+    try:
+        print("\tVALID: ", first.percentile(0.5, "Nowhere"))
+    except Exception as err:
+        print("\tERROR: ", repr(err))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,552 @@
+##
+#  This module stores households in an SQLite database.
+#
+#  The store follows a change feed (see household_events_module): new
+#  households are saved when they are created and the batches of logged
+#  chores are written with executemany, so the households keep their usual
+#  API.  A batch which cannot be written is kept and written again before
+#  the next one.  Households can be loaded back one at a time, through a
+#  StoredHouseholds list, and the leaderboard and the chore totals are
+#  computed in SQL, so the database can hold more households than fit in
+#  memory.
+#
+#  The connections are shared by the threads through a small pool.
+
+import queue
+import sqlite3
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+from household_module import Household
+from chore_list_module import Chore
+import household_events_module as events
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS households (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    lazy_log INTEGER NOT NULL DEFAULT 0,
+    position INTEGER            -- 0, 1, 2... in the order the households were stored
+);
+CREATE TABLE IF NOT EXISTS participants (
+    household_id INTEGER NOT NULL REFERENCES households (id),
+    name TEXT NOT NULL,
+    PRIMARY KEY (household_id, name)
+);
+CREATE TABLE IF NOT EXISTS chores (
+    household_id INTEGER NOT NULL REFERENCES households (id),
+    name TEXT NOT NULL,
+    frequency INTEGER NOT NULL,
+    PRIMARY KEY (household_id, name)
+);
+CREATE TABLE IF NOT EXISTS chore_log (
+    household_id INTEGER NOT NULL REFERENCES households (id),
+    participant TEXT NOT NULL,
+    chore TEXT NOT NULL,
+    completed INTEGER NOT NULL,
+    PRIMARY KEY (household_id, participant, chore)
+);
+CREATE INDEX IF NOT EXISTS chore_log_participant ON chore_log (participant);
+"""
+
+HOUSEHOLD_ID = "(SELECT id FROM households WHERE name = ?)"
+
+NEXT_POSITION = "(SELECT COALESCE(MAX(position), -1) + 1 FROM households)"
+
+ADD_TO_LOG = ("INSERT INTO chore_log (household_id, participant, chore, completed) "
+              "VALUES (" + HOUSEHOLD_ID + ", ?, ?, ?) "
+              "ON CONFLICT (household_id, participant, chore) "
+              "DO UPDATE SET completed = completed + excluded.completed")
+
+
+class ConnectionPool() :
+
+    POOL_SIZE = 4
+
+    ## Constructor for a pool of connections to one database.
+    #  @param the_path the database file, or a "file:...?mode=memory&cache=shared"
+    #         URI for a shared in-memory database
+    #  @param size the number of connections
+    #
+    def __init__(self, the_path, size=POOL_SIZE) :
+        self._connections = queue.Queue()
+        for i in range(size) :
+            connection = sqlite3.connect(the_path, timeout=30, check_same_thread=False,
+                                         uri=the_path.startswith("file:"))
+            connection.execute("PRAGMA foreign_keys = ON")
+            self._connections.put(connection)
+        self.size = size
+
+    ## Borrow a connection for a with block; the block is one transaction.
+    #
+    @contextmanager
+    def connection(self) :
+        connection = self._connections.get()
+        try :
+            with connection :
+                yield connection
+        finally :
+            self._connections.put(connection)
+
+    ## Close all the connections, waiting for the borrowed ones.
+    #
+    def close(self) :
+        for i in range(self.size) :
+            self._connections.get().close()
+
+
+class SQLiteHouseholdStore() :
+
+    ## Constructor for the store. Creates the tables if needed.
+    #  @param the_path the database file
+    #  @param pool_size the number of pooled connections
+    #
+    def __init__(self, the_path, pool_size=ConnectionPool.POOL_SIZE) :
+        self.pool = ConnectionPool(the_path, pool_size)
+        with self.pool.connection() as connection :
+            if not the_path.startswith("file:") :
+                connection.execute("PRAGMA journal_mode = WAL")
+            connection.executescript(SCHEMA)
+            self._add_positions(connection)
+        self._subscription = None
+        self._feed = None
+        self._failed = deque()  # Batches of events waiting to be written
+        self._versions = {}     # household name -> log version written when it was
+                                # saved without a HouseholdCreated event
+        self.errors = 0         # Number of times a batch could not be written
+        self.last_error = None
+
+    ## Follow a change feed, writing every batch of events to the database.
+    #  @param the_feed a ChangeFeed
+    #
+    def attach(self, the_feed) :
+        self._subscription = the_feed.subscribe(self.apply_events)
+        self._feed = the_feed
+
+    ## Stop following the change feed and close the connections.
+    #
+    def close(self) :
+        if self._subscription is not None :
+            self._feed.flush()
+            self._feed.unsubscribe(self._subscription)
+            self._subscription = None
+        self.retry()
+        self.pool.close()
+
+    ## Write the events waiting on the change feed and the batches which
+    #  could not be written, so the database is up to date.
+    #  @return True if everything was written
+    #
+    def sync(self) :
+        if self._feed is not None :
+            self._feed.flush()
+        return self.retry()
+
+    ## Write a batch of events from a change feed in one transaction.
+    #  A batch which fails is kept, with the later ones, until retry() or
+    #  the next batch manages to write it.
+    #  @param batch a list of events
+    #  @return True if the batch and those waiting before it were written
+    #
+    def apply_events(self, batch) :
+        self._failed.append(batch)
+        return self.retry()
+
+    ## Write the batches waiting, oldest first.
+    #  @return True if they were all written
+    #
+    def retry(self) :
+        while self._failed :
+            try :
+                with self.pool.connection() as connection :
+                    versions = self._write(connection, self._failed[0])
+            except sqlite3.Error as err :
+                self.errors += 1
+                self.last_error = err
+                return False
+            self._versions = versions
+            self._failed.popleft()
+        return True
+
+    ## Write a batch of events. Consecutive LogIncremented events are
+    #  written with one executemany.  A household which was never announced
+    #  by a HouseholdCreated event is saved as it is now when it is first
+    #  seen, and the increments already in that log are skipped.
+    #  @return the new value of _versions, kept if the transaction commits
+    #
+    def _write(self, connection, batch) :
+        versions = dict(self._versions)
+        stored = {}     # household name -> True if it is in the database
+        increments = []
+        for event in batch :
+            if isinstance(event, events.HouseholdCreated) :
+                if increments :
+                    connection.executemany(ADD_TO_LOG, increments)
+                    increments = []
+                self._insert(connection, event.household, event.snapshot, event.household_name)
+                stored[event.household_name] = True
+                continue
+
+            name = event.old_name if isinstance(event, events.HouseholdRenamed) \
+                else event.household_name
+            if name not in stored :
+                stored[name] = self._stored(connection, name)
+            if not stored[name] :
+                snapshot = event.household.snapshot()
+                self._insert(connection, event.household, snapshot, name)
+                stored[name] = True
+                versions[name] = snapshot.version
+
+            if isinstance(event, events.LogIncremented) :
+                if name in versions :
+                    if event.version <= versions[name] :
+                        continue
+                    del versions[name]
+                increments.append((name, event.participant, event.chore,
+                                   event.number_completed))
+                continue
+            if increments :
+                connection.executemany(ADD_TO_LOG, increments)
+                increments = []
+            if isinstance(event, events.HouseholdRenamed) :
+                connection.execute("UPDATE households SET name = ? WHERE name = ?",
+                                   (event.household_name, name))
+                stored[event.household_name] = True
+                if name in versions :
+                    versions[event.household_name] = versions.pop(name)
+            elif isinstance(event, events.MembershipChanged) :
+                self._update_membership(connection, event.household, name)
+        if increments :
+            connection.executemany(ADD_TO_LOG, increments)
+        return versions
+
+    def _stored(self, connection, household_name) :
+        return connection.execute("SELECT 1 FROM households WHERE name = ?",
+                                  (household_name,)).fetchone() is not None
+
+    ## Give the households of a database made before the position column
+    #  their positions, in the order of their ids, and index the column.
+    #
+    def _add_positions(self, connection) :
+        columns = [column[1] for column in connection.execute("PRAGMA table_info(households)")]
+        if "position" not in columns :
+            connection.execute("ALTER TABLE households ADD COLUMN position INTEGER")
+            ids = [row[0] for row in connection.execute("SELECT id FROM households ORDER BY id")]
+            connection.executemany("UPDATE households SET position = ? WHERE id = ?",
+                                   enumerate(ids))
+        connection.execute("CREATE INDEX IF NOT EXISTS households_position "
+                           "ON households (position)")
+
+    def _position(self, connection, household_name) :
+        row = connection.execute("SELECT position FROM households WHERE name = ?",
+                                 (household_name,)).fetchone()
+        return None if row is None else row[0]
+
+    ## Save a household, replacing any stored household with the same name
+    #  and keeping its position.
+    #
+    def save_household(self, household) :
+        with self.pool.connection() as connection :
+            position = self._position(connection, household.household_name)
+            self._delete(connection, household.household_name)
+            self._insert(connection, household, position=position)
+
+    ## Delete a household, moving the households stored after it up one
+    #  position.
+    #  @return True if the household was stored.
+    #
+    def delete_household(self, household_name) :
+        with self.pool.connection() as connection :
+            position = self._position(connection, household_name)
+            if not self._delete(connection, household_name) :
+                return False
+            connection.execute("UPDATE households SET position = position - 1 "
+                               "WHERE position > ?", (position,))
+            return True
+
+    ## Load a household.
+    #  @param household_name the household name
+    #  @return a Household object, or None if there is no such household.
+    #
+    def load_household(self, household_name) :
+        with self.pool.connection() as connection :
+            row = connection.execute("SELECT id, lazy_log FROM households WHERE name = ?",
+                                     (household_name,)).fetchone()
+            if row is None :
+                return None
+            (household_id, lazy_log) = row
+            participants = [name for (name,) in connection.execute(
+                "SELECT name FROM participants WHERE household_id = ? ORDER BY rowid",
+                (household_id,))]
+            chores = {Chore(name, frequency) for (name, frequency) in connection.execute(
+                "SELECT name, frequency FROM chores WHERE household_id = ?", (household_id,))}
+            counts = connection.execute(
+                "SELECT participant, chore, completed FROM chore_log WHERE household_id = ?",
+                (household_id,)).fetchall()
+
+        household = Household(household_name, participants, chores, lazy_log=bool(lazy_log))
+        if lazy_log :
+            household_log = {}
+        else :
+            household_log = Household.initialise_log(participants, chores)
+        for (participant, chore, completed) in counts :
+            household_log.setdefault(participant, {})[chore] = completed
+        if household_log :
+            household.chore_log = household_log
+        return household
+
+    ## Load every household. Only for databases which fit in memory, use
+    #  StoredHouseholds otherwise.
+    #
+    def load_all(self) :
+        return [self.load_household(name) for name in self.household_names()]
+
+    ## Return the names of the stored households, in alphabetical order.
+    #
+    def household_names(self) :
+        with self.pool.connection() as connection :
+            return [name for (name,) in connection.execute(
+                "SELECT name FROM households ORDER BY name")]
+
+    ## Generate the names of the stored households in the order they were
+    #  stored, reading them a page at a time.
+    #
+    def iter_household_names(self, page_size=1000) :
+        last_position = -1
+        while True :
+            with self.pool.connection() as connection :
+                page = connection.execute(
+                    "SELECT position, name FROM households WHERE position > ? "
+                    "ORDER BY position LIMIT ?", (last_position, page_size)).fetchall()
+            for (last_position, name) in page :
+                yield name
+            if len(page) < page_size :
+                return
+
+    ## Return the number of stored households.
+    #
+    def household_count(self) :
+        with self.pool.connection() as connection :
+            # The positions are dense, so this reads the end of their index
+            return connection.execute("SELECT " + NEXT_POSITION).fetchone()[0]
+
+    ## Return the name of a household by its position in the order the
+    #  households were stored, None if there is no such position.
+    #
+    def household_name_at(self, position) :
+        with self.pool.connection() as connection :
+            row = connection.execute("SELECT name FROM households WHERE position = ?",
+                                     (position,)).fetchone()
+        return None if row is None else row[0]
+
+    ## Return the position of a household in the order the households were
+    #  stored, None if it is not stored.
+    #
+    def household_position(self, household_name) :
+        with self.pool.connection() as connection :
+            return self._position(connection, household_name)
+
+    ## Check whether a household is stored.
+    #
+    def household_exists(self, household_name) :
+        with self.pool.connection() as connection :
+            return self._stored(connection, household_name)
+
+    ## Return the participants with the most chores done.
+    #  @param household_name only this household, None for all of them
+    #  @param limit the maximum number of rows, None for all
+    #  @return a list of (household name, participant, total completed)
+    #
+    def leaderboard(self, household_name=None, limit=None) :
+        sql = ("SELECT h.name, l.participant, SUM(l.completed) AS total "
+               "FROM chore_log l JOIN households h ON h.id = l.household_id ")
+        parameters = []
+        if household_name is not None :
+            sql += "WHERE h.name = ? "
+            parameters.append(household_name)
+        sql += "GROUP BY l.household_id, l.participant ORDER BY total DESC, h.name, l.participant"
+        if limit is not None :
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        with self.pool.connection() as connection :
+            return connection.execute(sql, parameters).fetchall()
+
+    ## Return the number of times each chore of a household was done.
+    #  @return a dictionary chore name -> total completed
+    #
+    def chore_totals(self, household_name) :
+        with self.pool.connection() as connection :
+            return dict(connection.execute(
+                "SELECT chore, SUM(completed) FROM chore_log "
+                "WHERE household_id = " + HOUSEHOLD_ID + " GROUP BY chore",
+                (household_name,)))
+
+    ## Insert a household with the counts of a snapshot of its log.
+    #  @param position the position of the household, after the others by
+    #         default
+    #
+    def _insert(self, connection, household, snapshot=None, name=None, position=None) :
+        name = name or household.household_name
+        if snapshot is None :
+            snapshot = household.snapshot()
+        connection.execute("INSERT INTO households (name, lazy_log, position) "
+                           "VALUES (?, ?, COALESCE(?, " + NEXT_POSITION + "))",
+                           (name, int(household.is_lazy_log()), position))
+        self._insert_membership(connection, household, name)
+        connection.executemany(ADD_TO_LOG, [
+            (name, participant, chore, completed)
+            for (participant, chores) in snapshot.items()
+            for (chore, completed) in chores.items() if completed != 0])
+
+    def _insert_membership(self, connection, household, name) :
+        connection.executemany(
+            "INSERT INTO participants (household_id, name) VALUES (" + HOUSEHOLD_ID + ", ?)",
+            [(name, participant) for participant in household.participants.participants])
+        connection.executemany(
+            "INSERT INTO chores (household_id, name, frequency) VALUES (" + HOUSEHOLD_ID + ", ?, ?)",
+            [(name, chore.chore_name, chore.frequency) for chore in household.chores.chores])
+
+    ## Replace the participants and chores, dropping the counts of the
+    #  participants and chores which were removed.
+    #
+    def _update_membership(self, connection, household, name) :
+        for table in ["participants", "chores"] :
+            connection.execute("DELETE FROM " + table + " WHERE household_id = " + HOUSEHOLD_ID,
+                               (name,))
+        self._insert_membership(connection, household, name)
+        connection.execute(
+            "DELETE FROM chore_log WHERE household_id = " + HOUSEHOLD_ID +
+            " AND (participant NOT IN (SELECT name FROM participants WHERE household_id = "
+            + HOUSEHOLD_ID + ") OR chore NOT IN (SELECT name FROM chores WHERE household_id = "
+            + HOUSEHOLD_ID + "))", (name, name, name))
+
+    def _delete(self, connection, household_name) :
+        for table in ["chore_log", "participants", "chores"] :
+            connection.execute("DELETE FROM " + table + " WHERE household_id = " + HOUSEHOLD_ID,
+                               (household_name,))
+        return connection.execute("DELETE FROM households WHERE name = ?",
+                                  (household_name,)).rowcount > 0
+
+
+class StoredHouseholds() :
+
+    ## Constructor for a list of the households of a store, in the order
+    #  they were stored, which loads each household when it is asked for.
+    #  It can stand in for the list of households of the Chore Chart
+    #  application without loading them all into memory.  A household is
+    #  loaded once while it is in use, and its changes reach the database
+    #  through the change feed the store follows.
+    #  @param the_store an SQLiteHouseholdStore attached to the change feed
+    #
+    def __init__(self, the_store) :
+        self.store = the_store
+        self._live = weakref.WeakValueDictionary()  # household name -> Household in use
+
+    ## Add a new household. It is saved by its HouseholdCreated event.
+    #
+    def append(self, household) :
+        self._live[household.household_name] = household
+
+    ## Return a household by name, None if there is no such household.
+    #
+    def get(self, household_name) :
+        household = self._live.get(household_name)
+        if household is not None and household.household_name == household_name :
+            return household
+        self.store.sync()
+        household = self.store.load_household(household_name)
+        if household is not None :
+            self._live[household_name] = household
+        return household
+
+    ## Return the position of a household.
+    #  @exception ValueError if the household is not stored
+    #
+    def index(self, household) :
+        self.store.sync()
+        position = self.store.household_position(household.household_name)
+        if position is None :
+            raise ValueError("{} is not in the store".format(household.household_name))
+        return position
+
+    def __len__(self) :
+        self.store.sync()
+        return self.store.household_count()
+
+    def __getitem__(self, position) :
+        if position < 0 :
+            position += len(self)
+        name = None
+        if position >= 0 :
+            self.store.sync()
+            name = self.store.household_name_at(position)
+        if name is None :
+            raise IndexError("household position out of range")
+        return self.get(name)
+
+    ## Iterate over the households, loading one at a time.
+    #
+    def __iter__(self) :
+        self.store.sync()
+        for name in self.store.iter_household_names() :
+            household = self.get(name)
+            if household is not None :
+                yield household
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    feed = events.ChangeFeed(batch_size=10)
+    Household.change_feed = feed
+    store = SQLiteHouseholdStore("file:chorechart?mode=memory&cache=shared")
+    store.attach(feed)
+
+    print("Test 1: Store a household and log chores through the change feed")
+    try:
+        h = Household("House1", {"personA","personB"}, {Chore("wash up", 4), Chore("dusting",1)})
+        feed.publish(events.household_created(h))
+        for i in range(25) :
+            h.update_log("personA", "wash up", 1)
+        h.update_log("personB", "dusting", 3)
+        h.add_participant("personC")
+        h.update_log("personC", "dusting", 1)
+        feed.flush()
+        print("\tVALID: ", store.leaderboard(), store.chore_totals("House1"))
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 2: Load the household back")
+    try:
+        print("\tVALID: ", store.load_household("House1").chore_log_string())
+        print("\tVALID: ", store.load_household("House2"))
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 3: Log chores for a household which was never announced")
+    try:
+        h = Household("House2", {"personA","personB"}, {Chore("wash up", 4), Chore("dusting",1)})
+        h.update_log("personA", "dusting", 2)
+        h.update_log("personB", "dusting", 1)
+        feed.flush()
+        print("\tVALID: ", store.chore_totals("House2"), store.errors)
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 4: Find the households through a StoredHouseholds list")
+    try:
+        all_households = StoredHouseholds(store)
+        print("\tVALID: ", len(all_households), all_households[1].household_name,
+              [household.household_name for household in all_households])
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    store.close()
+    Household.change_feed = None
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+##
+#  This module keeps the idle households on disk.
+#
+#  A TieredHouseholdStore holds at most `capacity` households as Household
+#  objects (the hot tier).  When it is full the household chosen by the
+#  eviction policy, least recently or least frequently used, is written to
+#  a dbm file as compressed JSON (the cold tier) and dropped from memory.
+#  Asking for a cold household reads it back, so the store can stand in for
+#  the list of households of the Chore Chart application: it can be
+#  indexed, iterated and appended to like a list.
+#
+#  A household is only written to the cold tier if it has changed since it
+#  was last read or written (see Household.revision()), so evicting the
+#  households which were only read costs nothing.  An evicted household
+#  which is still used elsewhere stays reachable through a weak reference:
+#  asking for it again returns the same object rather than a second copy,
+#  the change feed the store follows tells it when the household changes,
+#  so it is written back, and flush() writes it back too.
+
+import dbm
+import json
+import weakref
+import zlib
+from collections import OrderedDict
+
+from household_module import Household
+import household_events_module as events
+
+
+class LRUPolicy() :
+
+    ## Evicts the household used least recently.
+    #
+    def __init__(self) :
+        self._keys = OrderedDict()
+
+    def add(self, key) :
+        self._keys[key] = None
+
+    def touch(self, key) :
+        self._keys.move_to_end(key)
+
+    def remove(self, key) :
+        del self._keys[key]
+
+    def victim(self) :
+        return next(iter(self._keys))
+
+
+class LFUPolicy() :
+
+    ## Evicts the household used least often since it was loaded, the least
+    #  recently used of them if there are several.
+    #
+    def __init__(self) :
+        self._counts = {}       # key -> number of uses
+        self._buckets = {}      # number of uses -> OrderedDict of keys
+        self._smallest = 0
+
+    def add(self, key) :
+        self._counts[key] = 1
+        self._buckets.setdefault(1, OrderedDict())[key] = None
+        self._smallest = 1
+
+    def touch(self, key) :
+        count = self._counts[key]
+        self._take(key, count)
+        if count == self._smallest and count not in self._buckets :
+            self._smallest = count + 1
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, OrderedDict())[key] = None
+
+    def remove(self, key) :
+        count = self._counts.pop(key)
+        self._take(key, count)
+        if count == self._smallest and count not in self._buckets :
+            self._smallest = min(self._buckets, default=0)
+
+    def victim(self) :
+        return next(iter(self._buckets[self._smallest]))
+
+    def _take(self, key, count) :
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket :
+            del self._buckets[count]
+
+
+POLICIES = {"lru": LRUPolicy, "lfu": LFUPolicy}
+
+
+class TieredHouseholdStore() :
+
+    CAPACITY = 10000    # Households kept in memory
+
+    ## Constructor for the store.
+    #  @param the_path the dbm file of the cold tier, None to keep the cold
+    #         tier in memory (compressed)
+    #  @param capacity the number of households kept in memory
+    #  @param policy "lru" or "lfu"
+    #
+    def __init__(self, the_path=None, capacity=CAPACITY, policy="lru") :
+        if capacity < 1 :
+            raise ValueError("capacity must be positive")
+        if policy not in POLICIES :
+            raise ValueError("policy must be one of {}".format(", ".join(POLICIES)))
+        self.capacity = capacity
+        self._policy = POLICIES[policy]()
+        self._cold = {} if the_path is None else dbm.open(the_path, "c")
+        self._hot = {}                      # key -> Household
+        self._released = weakref.WeakValueDictionary()  # key -> evicted Household in use
+        self._written = {}                  # key -> revision of the household when it
+                                            # was last read or written, None if never
+        self._keys = []                     # keys in the order the households were added
+        self._positions = {}                # key -> position in _keys
+        self._names = {}                    # household name -> key
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self._subscription = None
+        for key in sorted(self._cold.keys(), key=int) :
+            self._add_key(int(key), self._decode(self._cold[key])["household_name"])
+
+    ## Follow a change feed, so renamed households can still be found by name
+    #  and the evicted households changed by their users are written back.
+    #  @param the_feed a ChangeFeed
+    #
+    def attach(self, the_feed) :
+        self._feed = the_feed
+        self._subscription = the_feed.subscribe(self.apply_events, (events.HouseholdRenamed,
+                                                                    events.LogIncremented,
+                                                                    events.MembershipChanged))
+
+    def apply_events(self, batch) :
+        changed = {}    # key -> evicted Household
+        for event in batch :
+            if isinstance(event, events.HouseholdRenamed) :
+                key = self._names.pop(event.old_name, None)
+                if key is not None :
+                    self._names[event.household_name] = key
+            key = self._names.get(event.household_name)
+            if key is not None and self._released.get(key) is event.household :
+                changed[key] = event.household
+        for (key, household) in changed.items() :
+            self._write(key, household)
+
+    ## Add a household to the hot tier.
+    #
+    def append(self, household) :
+        key = len(self._keys)
+        self._add_key(key, household.household_name)
+        self._admit(key, household)
+
+    ## Return a household by name, None if there is no such household.
+    #
+    def get(self, household_name) :
+        key = self._names.get(household_name)
+        return None if key is None else self._load(key)
+
+    ## Return the position of a household.
+    #  @exception ValueError if the household is not in the store
+    #
+    def index(self, household) :
+        key = self._names.get(household.household_name)
+        if key is None :
+            raise ValueError("{} is not in the store".format(household.household_name))
+        return self._positions[key]
+
+    def __len__(self) :
+        return len(self._keys)
+
+    def __getitem__(self, position) :
+        return self._load(self._keys[position])
+
+    ## Iterate over all the households, loading the cold ones.
+    #
+    def __iter__(self) :
+        for key in list(self._keys) :
+            yield self._load(key)
+
+    ## Write the households which have changed to the cold tier, keeping
+    #  them in memory.
+    #
+    def flush(self) :
+        for (key, household) in list(self._hot.items()) + list(self._released.items()) :
+            self._write(key, household)
+
+    ## Write the hot households and close the dbm file.
+    #
+    def close(self) :
+        if self._subscription is not None :
+            self._feed.unsubscribe(self._subscription)
+            self._subscription = None
+        self.flush()
+        if hasattr(self._cold, "close") :
+            self._cold.close()
+
+    ## Return the counters of the store.
+    #
+    def stats(self) :
+        requests = self.hits + self.misses
+        return {"hot": len(self._hot), "households": len(self._keys), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions, "writes": self.writes,
+                "released": len(self._released),
+                "hit_rate": self.hits / requests if requests else 0.0}
+
+    def _add_key(self, key, household_name) :
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+        self._names[household_name] = key
+
+    def _load(self, key) :
+        household = self._hot.get(key)
+        if household is not None :
+            self.hits += 1
+            self._policy.touch(key)
+            return household
+        self.misses += 1
+        household = self._released.pop(key, None)     # the evicted object still in use
+        if household is None :
+            household = Household.from_record(self._decode(self._cold[str(key)]))
+            self._written[key] = household.revision()
+        self._admit(key, household)
+        return household
+
+    def _admit(self, key, household) :
+        while len(self._hot) >= self.capacity :
+            self._evict(self._policy.victim())
+        self._hot[key] = household
+        self._policy.add(key)
+
+    def _evict(self, key) :
+        household = self._hot.pop(key)
+        self._policy.remove(key)
+        self.evictions += 1
+        self._write(key, household)
+        self._released[key] = household
+
+    ## Write a household to the cold tier if it has changed.
+    #
+    def _write(self, key, household) :
+        revision = household.revision()
+        if self._written.get(key) != revision :
+            self._cold[str(key)] = self._encode(household)
+            self._written[key] = revision
+            self.writes += 1
+
+    def _encode(self, household) :
+        return zlib.compress(json.dumps(household.to_record(), separators=(",", ":")).encode())
+
+    def _decode(self, data) :
+        return json.loads(zlib.decompress(data))
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    import random
+    from chore_list_module import Chore
+
+    chores = {Chore("wash up", 4), Chore("dusting", 1)}
+    for policy in POLICIES :
+        print("Test: 2000 households, 100 in memory, {} policy".format(policy))
+        store = TieredHouseholdStore(capacity=100, policy=policy)
+        for i in range(2000) :
+            store.append(Household("House{}".format(i), {"personA", "personB"}, chores))
+        random.seed(1)
+        for i in range(20000) :
+            # A few busy households and a long tail of idle ones
+            number = int(random.paretovariate(1.2)) % 2000
+            store.get("House{}".format(number)).update_log("personA", "wash up", 1)
+        print("\tVALID: ", store.stats())
+        print("\tVALID: ", store[1].chore_log_string(), store.index(store[1999]))
+
+    print("Test: Change a household after it has been evicted")
+    feed = events.ChangeFeed()
+    Household.change_feed = feed
+    store = TieredHouseholdStore(capacity=2)
+    store.attach(feed)
+    for i in range(5) :
+        store.append(Household("House{}".format(i), {"personA", "personB"}, chores))
+    kept = store[0]
+    for household in store :
+        pass
+    kept.update_log("personA", "dusting", 3)
+    feed.flush()
+    Household.change_feed = None
+    del kept, household
+    for household in store :
+        pass
+    writes = store.stats()["writes"]
+    for household in store :
+        pass
+    print("\tVALID: ", store[0].chore_log_string(), writes, store.stats()["writes"])
+
+if __name__ == "__main__":
+    main()
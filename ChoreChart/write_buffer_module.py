@@ -0,0 +1,243 @@
+##
+#  This module coalesces frequent chore log updates.
+#
+#  A CoalescingLogBuffer takes the place of Household.update_log for callers
+#  which log the same chores many times a second.  The increments are added
+#  up per (household, participant, chore) in memory and applied to the
+#  households in one batch when enough pairs are waiting or when the flush
+#  interval has passed, so the households, their change feed and any storage
+#  following it see one update per pair instead of one per call.
+#
+#  chore_log() returns a view of a household's log which includes the
+#  increments still waiting, so callers always read their own writes.
+#
+#  Each increment is checked by Household.log_validator when the buffer
+#  takes it, so the validator judges the submissions one at a time rather
+#  than their total; the flush does not check them again.
+#
+#  An increment whose participant or chore has been removed from the
+#  household by the time it is flushed is dropped and counted in dropped.
+
+import time
+from collections.abc import Mapping
+
+
+class CoalescingLogBuffer() :
+
+    MAXIMUM_PENDING = 1000      # Pairs waiting before the buffer is flushed
+    FLUSH_INTERVAL = 1.0        # Seconds between flushes
+
+    ## Constructor for the buffer.
+    #  @param max_pending the number of pairs waiting which triggers a flush
+    #  @param flush_interval the number of seconds after which the next
+    #         update triggers a flush
+    #  @param clock a function returning the time in seconds
+    #
+    def __init__(self, max_pending=MAXIMUM_PENDING, flush_interval=FLUSH_INTERVAL,
+                 clock=time.monotonic) :
+        if max_pending < 1 or flush_interval < 0 :
+            raise ValueError("max_pending must be positive and flush_interval not negative")
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._pending = {}      # household -> {(participant, chore): number}
+        self._pending_pairs = 0
+        self._last_flush = clock()
+        self.received = 0       # Number of update_log calls
+        self.held_back = 0      # Number of increments the log validator held back
+        self.applied = 0        # Number of Household.update_log calls made
+        self.dropped = 0        # Increments whose participant or chore was removed
+
+    ## Add to the chore log of a household, possibly later.
+    #  @param household the Household object
+    #  @param name a string containing the name of the participant.
+    #  @param chore  a string containing the name of the chore.
+    #  @param number_completed the number to add on to the existing total.
+    #  @return False if the log validator held the increment back, True if
+    #          it was taken.
+    #  @exception KeyError if the household has no such participant or chore.
+    #
+    def update_log(self, household, name, chore, number_completed) :
+        if name not in household.participants.participants :
+            raise KeyError(name)
+        if not household.chores.chore_exists(chore) :
+            raise KeyError(chore)
+
+        self.received += 1
+        validator = household.log_validator
+        if validator is not None and \
+                not validator.admit(household, name, chore, number_completed) :
+            self.held_back += 1
+            return False
+        pending = self._pending.setdefault(household, {})
+        key = (name, chore)
+        if key not in pending :
+            pending[key] = 0
+            self._pending_pairs += 1
+        pending[key] += number_completed
+
+        # The increment is taken: a flush failing on waiting increments is
+        # retried by the next flush rather than reported to this caller.
+        if self._pending_pairs >= self.max_pending :
+            self.flush(raise_errors=False)
+        else :
+            self.flush_if_due(raise_errors=False)
+        return True
+
+    ## Flush the buffer if the flush interval has passed since the last flush.
+    #  Call this periodically when no updates arrive.
+    #  @param raise_errors see flush()
+    #
+    def flush_if_due(self, raise_errors=True) :
+        if self._clock() - self._last_flush >= self.flush_interval :
+            self.flush(raise_errors)
+
+    ## Apply every waiting increment to its household.
+    #  An increment whose participant or chore no longer exists is dropped.
+    #  Any other increment is only removed from the buffer once it has been
+    #  applied: if Household.update_log raises, the increment stays waiting
+    #  for the next flush and the others are still applied.
+    #  @param raise_errors True to raise the first exception at the end
+    #  @return the number of Household.update_log calls made
+    #
+    def flush(self, raise_errors=True) :
+        self._last_flush = self._clock()
+        calls = 0
+        error = None
+        for household in list(self._pending) :
+            increments = self._pending[household]
+            for ((name, chore), number_completed) in list(increments.items()) :
+                if name not in household.participants.participants or \
+                        not household.chores.chore_exists(chore) :
+                    self.dropped += 1
+                elif number_completed != 0 :
+                    try :
+                        if household.update_log(name, chore, number_completed,
+                                                validate=False) :
+                            calls += 1
+                        else :
+                            self.held_back += 1
+                    except Exception as err :
+                        error = error or err
+                        continue
+                del increments[(name, chore)]
+                self._pending_pairs -= 1
+            if not increments :
+                del self._pending[household]
+        self.applied += calls
+        if error is not None and raise_errors :
+            raise error
+        return calls
+
+    ## Return the number of pairs waiting.
+    #
+    def pending(self) :
+        return self._pending_pairs
+
+    ## Return the chore log of a household, including the waiting increments.
+    #  @param household the Household object
+    #
+    def chore_log(self, household) :
+        pending = self._pending.get(household)
+        if not pending :
+            return household.chore_log
+        return BufferedChoreLog(household.chore_log, pending)
+
+
+class BufferedChoreLog(Mapping) :
+
+    ## Constructor for a view adding waiting increments to a chore log.
+    #  @param the_log the household's chore log
+    #  @param the_pending a dictionary (participant, chore) -> number
+    #
+    def __init__(self, the_log, the_pending) :
+        self._log = the_log
+        self._pending = the_pending
+
+    def __getitem__(self, name) :
+        return BufferedChoreRow(self._log[name], name, self._pending)
+
+    def __iter__(self) :
+        return iter(self._log)
+
+    def __len__(self) :
+        return len(self._log)
+
+    def __str__(self) :
+        return str({name: dict(chores) for (name, chores) in self.items()})
+
+
+class BufferedChoreRow(Mapping) :
+
+    def __init__(self, the_row, the_name, the_pending) :
+        self._row = the_row
+        self._name = the_name
+        self._pending = the_pending
+
+    def __getitem__(self, chore) :
+        return self._row[chore] + self._pending.get((self._name, chore), 0)
+
+    def __iter__(self) :
+        return iter(self._row)
+
+    def __len__(self) :
+        return len(self._row)
+
+
+## main method
+#
+# Contains some simple tests
+#
+def main():
+    from household_module import Household
+    from chore_list_module import Chore
+
+    print("Test 1: Coalesce 1000 updates of two pairs")
+    try:
+        h = Household("House1", {"personA","personB"}, {Chore("wash up", 4), Chore("dusting",1)})
+        buffer = CoalescingLogBuffer(max_pending=10, flush_interval=60)
+        for i in range(500) :
+            buffer.update_log(h, "personA", "wash up", 1)
+            buffer.update_log(h, "personB", "dusting", 2)
+        print("\tVALID: ", buffer.chore_log(h), h.chore_log_string())
+        buffer.flush()
+        print("\tVALID: ", h.chore_log_string(), buffer.received, buffer.applied)
+    except Exception as err:
+        print("\tERROR: ", err)
+
+    print("\nTest 2: Drop the increments of a removed participant")
+    try:
+        h.add_participant("personC")
+        buffer.update_log(h, "personC", "dusting", 1)
+        buffer.update_log(h, "personA", "dusting", 1)
+        h.remove_participant("personC")
+        buffer.flush()
+        print("\tVALID: ", buffer.pending(), buffer.dropped, h.chore_log_string())
+    except Exception as err:
+        print("\tERROR: ", repr(err))
+
+    print("\nTest 3: Check each increment with the anomaly detector")
+    try:
+        from anomaly_module import AnomalyDetector
+        Household.log_validator = AnomalyDetector()
+        h = Household("House2", {"personA","personB"}, {Chore("wash up", 7), Chore("dusting",1)})
+        buffer = CoalescingLogBuffer(max_pending=10, flush_interval=60)
+        for i in range(200) :
+            buffer.update_log(h, "personA", "wash up", 1)
+        buffer.update_log(h, "personB", "wash up", -3)
+        buffer.flush()
+        print("\tVALID: ", h.chore_log_string(), buffer.applied, buffer.held_back)
+    except Exception as err:
+        print("\tERROR: ", err)
+    finally:
+        Household.log_validator = None
+
+    print("\nTest 4: Update an unknown participant")
+    try:
+        buffer.update_log(h, "personC", "dusting", 1)
+        print("\tVALID")
+    except Exception as err:
+        print("\tERROR: ", repr(err))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+###  This module defines an index over Employee objects.
+#
+#  The index finds an employee by name in constant time and keeps the
+#  salaries sorted, so salary ranges, percentiles and medians are found by
+#  binary search.  It listens to the salary of every employee it holds, so
+#  promote(), demote(), raise_salary_by(), fire() and hire() keep it up to
+#  date.  The names of the indexed employees must not be changed.
+
+from bisect import bisect_left, bisect_right, insort
+import math
+
+
+## Compares greater than anything, used to bound a salary range.
+#
+class _Highest:
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+_HIGHEST = _Highest()
+
+
+## An employee index has the employees by name and sorted by salary.
+#
+class EmployeeIndex:
+
+    ## Constructs an index.
+    #  @param employees the Employee objects to index.
+    #
+    def __init__(self, employees=()):
+        self._by_name = {}
+        self._recorded = {}         # name -> (salary, hired) as indexed
+        self._salaries = []         # sorted (salary, name) of every employee
+        self._hired_salaries = []   # sorted (salary, name) of the hired employees
+        for employee in employees:
+            self.add(employee)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __contains__(self, employee_name):
+        return employee_name in self._by_name
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    ## Adds an employee to the index.
+    #  @exception ValueError if an employee with the same name is indexed.
+    #
+    def add(self, employee):
+        if employee.name in self._by_name:
+            raise ValueError("Duplicate name: " + employee.name)
+        self._by_name[employee.name] = employee
+        self._insert(employee)
+        employee.add_salary_listener(self._salary_changed)
+
+    ## Removes an employee from the index.
+    #  @param employee_name the name of the employee.
+    #  @return the Employee object.
+    #
+    def remove(self, employee_name):
+        employee = self._by_name.pop(employee_name)
+        employee.remove_salary_listener(self._salary_changed)
+        self._delete(employee_name)
+        return employee
+
+    ## Returns the employee with the given name.
+    #  @exception KeyError if there is no such employee.
+    #
+    def get(self, employee_name):
+        return self._by_name[employee_name]
+
+    ## Returns the employees earning between two amounts, lowest salary first.
+    #  @param low the lowest salary, included.
+    #  @param high the highest salary, included.
+    #  @param hired_only True to leave out the fired employees.
+    #
+    def salary_range(self, low, high, hired_only=False):
+        salaries = self._hired_salaries if hired_only else self._salaries
+        first = bisect_left(salaries, (low,))
+        last = bisect_right(salaries, (high, _HIGHEST))
+        return [self._by_name[name] for (salary, name) in salaries[first:last]]
+
+    ## Returns the salary at a percentile, using the nearest rank.
+    #  @param percent a number between 0 and 100.
+    #  @param hired_only True to leave out the fired employees.
+    #  @exception ValueError if the percent is out of range or there are no salaries.
+    #
+    def percentile(self, percent, hired_only=False):
+        salaries = self._hired_salaries if hired_only else self._salaries
+        if not 0 <= percent <= 100:
+            raise ValueError("Invalid percentile: " + str(percent))
+        if len(salaries) == 0:
+            raise ValueError("No salaries in the index")
+        rank = max(math.ceil(percent / 100 * len(salaries)), 1)
+        return salaries[rank - 1][0]
+
+    ## Returns the median salary.
+    #  @param hired_only True to leave out the fired employees.
+    #  @exception ValueError if there are no salaries.
+    #
+    def median(self, hired_only=False):
+        salaries = self._hired_salaries if hired_only else self._salaries
+        if len(salaries) == 0:
+            raise ValueError("No salaries in the index")
+        middle = len(salaries) // 2
+        if len(salaries) % 2 == 1:
+            return salaries[middle][0]
+        return (salaries[middle - 1][0] + salaries[middle][0]) / 2
+
+    ## Listener registered on every indexed employee.
+    #
+    def _salary_changed(self, employee, old_salary, new_salary):
+        self._delete(employee.name)
+        self._insert(employee)
+
+    def _insert(self, employee):
+        key = (employee.salary, employee.name)
+        insort(self._salaries, key)
+        if employee.isHired:
+            insort(self._hired_salaries, key)
+        self._recorded[employee.name] = (employee.salary, employee.isHired)
+
+    def _delete(self, employee_name):
+        (salary, hired) = self._recorded.pop(employee_name)
+        key = (salary, employee_name)
+        del self._salaries[bisect_left(self._salaries, key)]
+        if hired:
+            del self._hired_salaries[bisect_left(self._hired_salaries, key)]
+
+
+if __name__ == '__main__':
+    from employee_modulepy2 import Employee
+
+    staff = [Employee(name) for name in ['Bellick', 'Biff', 'Scofield', 'Burrows']]
+    index = EmployeeIndex(staff)
+    index.get('Bellick').promote()
+    index.get('Biff').fire()
+    index.get('Scofield').raise_salary_by(5000)
+    print([str(employee) for employee in index.salary_range(10000, 12000)])
+    print(index.median(), index.median(hired_only=True), index.percentile(90))
+    print(len({staff[0], staff[0]}))
@@ -79,16 +79,20 @@ class Employee:
         
     ## Determines if this employee is equal to another employee.
     #  @param rhsValue the right-hand side employee.
-    #  @return True if the names and the salaries are equal.
-    #  @exception TypeError if the objects being compared are not
-    #             the same type.
+    #  @return True if the names and the salaries are equal, NotImplemented
+    #          if the other object is not an Employee.
     #            
     def __eq__(self, rhsValue) :
         if isinstance(rhsValue, Employee) :
             return (self.name == rhsValue.name and
               self.salary == rhsValue.salary)
         else:
-            raise TypeError("Argument must be an Employee object.")
+            return NotImplemented
+
+    ## Hashes on the name, so equal employees have equal hashes.
+    #
+    def __hash__(self):
+        return hash(self.name)
 
 
     ## isHired()
@@ -8,6 +8,8 @@ class Employee:
     DEFAULT_STARTING_SALARY = 10000
     INCREMENT = 1000
 
+    _salary_listeners = ()
+
     ## Constructs an Employee with a name and starting salary.
     #  @param employee_name the name of the employee.
     #
@@ -38,7 +40,7 @@ class Employee:
 
     ## salary property allows get/set access to Employee's salary.
     #  salary will be set to zero if there is an attempt to reduce
-    #  it below zero.
+    #  it below zero. The salary listeners are called after every change.
     #
     @property
     def salary(self):
@@ -46,10 +48,26 @@ class Employee:
 
     @salary.setter
     def salary(self, salaryAmount):
+        oldSalary = getattr(self, '_salary', None)
         if salaryAmount >= 0:
             self._salary = salaryAmount
         else:
             self._salary = 0
+        for listener in self._salary_listeners:
+            listener(self, oldSalary, self._salary)
+
+    ## Registers a function called when the salary is set.
+    #  @param listener a function called as listener(employee, old_salary, new_salary).
+    #
+    def add_salary_listener(self, listener):
+        self._salary_listeners = self._salary_listeners + (listener,)
+
+    ## Removes a function registered with add_salary_listener().
+    #
+    def remove_salary_listener(self, listener):
+        listeners = list(self._salary_listeners)
+        listeners.remove(listener)
+        self._salary_listeners = tuple(listeners)
 
     ## Promotes the employee by increasing the salary by INCREMENT.
     #
@@ -75,16 +93,20 @@ class Employee:
 
     ## Determines if this employee is equal to another employee.
     #  @param rhsValue the right-hand side employee.
-    #  @return True if the names and the salaries are equal.
-    #  @exception TypeError if the objects being compared are not
-    #             the same type.
+    #  @return True if the names and the salaries are equal, NotImplemented
+    #          if the other object is not an Employee.
     #
     def __eq__(self, rhsValue):
         if isinstance(rhsValue, Employee):
             return (self.name == rhsValue.name and
                     self.salary == rhsValue.salary)
         else:
-            raise TypeError("Argument must be an Employee object.")
+            return NotImplemented
+
+    ## Hashes on the name, so equal employees have equal hashes.
+    #
+    def __hash__(self):
+        return hash(self.name)
 
     def getIsHired(self):
         return self.isHired
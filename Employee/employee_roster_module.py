@@ -0,0 +1,210 @@
+###  This module defines a class that models a roster of employees.
+#
+#  The roster keeps the names, salaries and hired flags of its employees in
+#  parallel arrays, so payroll operations over many employees are done in
+#  one pass over the arrays instead of one Employee object at a time, and
+#  an operation on a few named employees only touches their positions.
+#  The operations follow the rules of the Employee class: a salary is never
+#  set below zero, only hired employees can be promoted or demoted, firing
+#  sets the salary to zero and hiring sets it to DEFAULT_STARTING_SALARY.
+
+from employee_modulepy2 import Employee
+
+
+## An employee roster has the names, salaries and hired flags of employees.
+#
+class EmployeeRoster:
+
+    ## Constructs a roster of newly hired employees.
+    #  @param employee_names the names of the employees.
+    #
+    def __init__(self, employee_names=()):
+        self._names = []
+        self._salaries = []
+        self._hired = bytearray()
+        self._index = {}    # name -> position in the arrays
+        for name in employee_names:
+            self.add(name)
+
+    ## Builds a roster from Employee objects.
+    #  @param employees the Employee objects.
+    #  @return the roster.
+    #
+    @staticmethod
+    def from_employees(employees):
+        roster = EmployeeRoster()
+        for employee in employees:
+            roster.add(employee.name, employee.salary, employee.isHired)
+        return roster
+
+    ##
+    # @return the number of employees in the roster.
+    #
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, employee_name):
+        return employee_name in self._index
+
+    ##
+    # @return string representation of the roster.
+    #
+    def __str__(self):
+        return "\n".join("Name: " + name + ", salary: " + str(salary)
+                         for (name, salary) in zip(self._names, self._salaries))
+
+    ## Adds an employee to the roster.
+    #  @param employee_name the name of the employee.
+    #  @param salary the salary, DEFAULT_STARTING_SALARY by default.
+    #  @param is_hired whether the employee is hired.
+    #  @exception ValueError if the name is blank or already in the roster.
+    #
+    def add(self, employee_name, salary=Employee.DEFAULT_STARTING_SALARY, is_hired=True):
+        if len(employee_name.strip()) == 0:
+            raise ValueError("Invalid name: " + employee_name)
+        if employee_name in self._index:
+            raise ValueError("Duplicate name: " + employee_name)
+        self._index[employee_name] = len(self._names)
+        self._names.append(employee_name)
+        self._salaries.append(salary if salary >= 0 else 0)
+        self._hired.append(1 if is_hired else 0)
+
+    ## Returns the details of one employee as an Employee object.
+    #  @param employee_name the name of the employee.
+    #  @return a new Employee with the same name, salary and hired state.
+    #
+    def employee(self, employee_name):
+        i = self._index[employee_name]
+        employee = Employee(employee_name)
+        employee.isHired = bool(self._hired[i])
+        employee.salary = self._salaries[i]
+        return employee
+
+    ## Returns the salary of one employee.
+    #
+    def salary(self, employee_name):
+        return self._salaries[self._index[employee_name]]
+
+    ## Returns whether one employee is hired.
+    #
+    def is_hired(self, employee_name):
+        return bool(self._hired[self._index[employee_name]])
+
+    ## Returns the total of the salaries.
+    #
+    def total_payroll(self):
+        return sum(self._salaries)
+
+    ## Returns copies of the salaries and the hired flags, in the order the
+    #  employees were added.
+    #
+    def payroll_state(self):
+        return (list(self._salaries), bytes(self._hired))
+
+    ## Promotes the hired employees by increasing their salary by INCREMENT.
+    #  @param employee_names the employees to promote, None for everyone.
+    #  @return the number of employees promoted.
+    #
+    def promote(self, employee_names=None):
+        return self._add_to_hired(Employee.INCREMENT, employee_names)
+
+    ## Demotes the hired employees by decreasing their salary by INCREMENT.
+    #  @param employee_names the employees to demote, None for everyone.
+    #  @return the number of employees demoted.
+    #
+    def demote(self, employee_names=None):
+        return self._add_to_hired(-Employee.INCREMENT, employee_names)
+
+    ## Raises the salaries of the employees by the amount passed as a parameter.
+    #  @param pay_rise the amount by which the salaries should be raised.
+    #  @param employee_names the employees to raise, None for everyone.
+    #  @return the number of salaries raised.
+    #
+    def raise_salary_by(self, pay_rise, employee_names=None):
+        return self._add_to(pay_rise, self._selection(employee_names))
+
+    ## Raises every salary below a threshold by the amount passed as a parameter.
+    #  @param threshold the salaries strictly below this amount are raised.
+    #  @param pay_rise the amount by which the salaries should be raised.
+    #  @param hired_only True to leave the salaries of fired employees alone.
+    #  @return the number of salaries raised.
+    #
+    def raise_salaries_below(self, threshold, pay_rise, hired_only=True):
+        selected = [i for (i, (salary, hired)) in enumerate(zip(self._salaries, self._hired))
+                    if salary < threshold and (hired or not hired_only)]
+        return self._add_to(pay_rise, selected)
+
+    ## Fires the employees: their salary is set to zero.
+    #  @param employee_names the employees to fire, None for everyone.
+    #  @return the number of employees fired.
+    #
+    def fire(self, employee_names=None):
+        return self._set_hired(False, self._selection(employee_names))
+
+    ## Fires the employees for which the predicate is true.
+    #  @param predicate a function called as predicate(name, salary, is_hired).
+    #  @return the number of employees fired.
+    #
+    def fire_where(self, predicate):
+        selected = [i for (i, (name, salary, hired))
+                    in enumerate(zip(self._names, self._salaries, self._hired))
+                    if predicate(name, salary, bool(hired))]
+        return self._set_hired(False, selected)
+
+    ## Hires the employees: their salary is set to DEFAULT_STARTING_SALARY.
+    #  @param employee_names the employees to hire, None for everyone.
+    #  @return the number of employees hired.
+    #
+    def hire(self, employee_names=None):
+        return self._set_hired(True, self._selection(employee_names))
+
+    ## Returns the positions of the selected employees.
+    #  @param employee_names the names to select, None for everyone.
+    #  @exception KeyError if a name is not in the roster.
+    #
+    def _selection(self, employee_names):
+        if employee_names is None:
+            return range(len(self._names))
+        return sorted({self._index[name] for name in employee_names})
+
+    ## Adds an amount to the salaries of the selected hired employees,
+    #  clamping them at zero.
+    #
+    def _add_to_hired(self, amount, employee_names):
+        hired = self._hired
+        if employee_names is None:
+            selected = [i for (i, flag) in enumerate(hired) if flag]
+        else:
+            selected = [i for i in self._selection(employee_names) if hired[i]]
+        return self._add_to(amount, selected)
+
+    ## Adds an amount to the salaries at the selected positions, clamping
+    #  them at zero.
+    #
+    def _add_to(self, amount, selected):
+        salaries = self._salaries
+        for i in selected:
+            salary = salaries[i] + amount
+            salaries[i] = salary if salary >= 0 else 0
+        return len(selected)
+
+    ## Sets the hired flag and the matching salary of the selected employees.
+    #
+    def _set_hired(self, is_hired, selected):
+        new_salary = Employee.DEFAULT_STARTING_SALARY if is_hired else 0
+        flag = 1 if is_hired else 0
+        for i in selected:
+            self._hired[i] = flag
+            self._salaries[i] = new_salary
+        return len(selected)
+
+
+if __name__ == '__main__':
+    roster = EmployeeRoster(['Bellick', 'Biff', 'Scofield'])
+    roster.promote({'Bellick'})
+    roster.fire_where(lambda name, salary, is_hired: name == 'Biff')
+    roster.raise_salaries_below(11000, 500)
+    roster.demote()
+    print(roster)
+    print(roster.total_payroll())
+    print(roster.employee('Biff'))
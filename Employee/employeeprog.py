@@ -3,14 +3,103 @@
 # Description:
 # This program uses the Employee class to manage an Employee.
 #
+# Run with --batch [file] to apply a file of commands (standard input if
+# no file is given) to many employees without prompting.  Each line is
+#
+#     <employee name> <p|d|f|h|v>
+#     <employee name> r <amount>
+#
+# An employee is created the first time their name is seen.  The output of
+# the commands goes through a file buffer of OUTPUT_BLOCK_SIZE bytes, so it is
+# written in large blocks.
+#
 # Author: Chenzhikang
 # 
 # Date: Match 2019
 #
 
+import contextlib
+import sys
+
 from employee_modulepy2 import Employee
 
+BATCH_COMMANDS = ['p', 'd', 'r', 'f', 'h', 'v']
+OUTPUT_BLOCK_SIZE = 1 << 16     # Characters collected before writing the output
+
+## Applies one line of the batch mode.
+#  @param line the command line.
+#  @param employees a dictionary of the employees by name.
+#  @param out where the result of 'v' is written.
+#  @exception ValueError if the line is not a valid command.
+#
+def run_command(line, employees, out):
+    words = line.split()
+    if len(words) >= 3 and words[-2] == 'r':
+        name = " ".join(words[:-2])
+        selection = 'r'
+        rise = int(words[-1])
+    elif len(words) >= 2 and words[-1] in BATCH_COMMANDS and words[-1] != 'r':
+        name = " ".join(words[:-1])
+        selection = words[-1]
+    else:
+        raise ValueError("invalid command: " + line.strip())
+
+    employee = employees.get(name)
+    if employee is None:
+        employee = Employee(name)
+        employees[name] = employee
+
+    if selection == 'p':
+        employee.promote()
+    elif selection == 'd':
+        employee.demote()
+    elif selection == 'r':
+        employee.raise_salary_by(rise)
+    elif selection == 'v':
+        out.write(employee.__str__() + "\n")
+    elif selection == 'f':
+        employee.fire()
+    elif selection == 'h':
+        employee.hire()
+
+## Applies a stream of commands to many employees.
+#  @param lines the command lines.
+#  @param out where the output is written, flushed even if a command fails.
+#  @return a dictionary of the employees by name.
+#
+def run_batch(lines, out):
+    employees = {}
+    try:
+        with contextlib.redirect_stdout(out):
+            for (number, line) in enumerate(lines, 1):
+                if len(line.strip()) == 0:
+                    continue
+                try:
+                    run_command(line, employees, out)
+                except ValueError as err:
+                    out.write("line {}: {}\n".format(number, err))
+    finally:
+        out.flush()
+    return employees
+
+## Opens the standard output with a buffer of OUTPUT_BLOCK_SIZE bytes.
+#  Closing it flushes the buffer but leaves the standard output open.
+#
+def open_block_output():
+    sys.stdout.flush()
+    return open(sys.stdout.fileno(), "w", buffering=OUTPUT_BLOCK_SIZE, closefd=False)
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        with open_block_output() as out:
+            if len(sys.argv) > 2 and sys.argv[2] != '-':
+                with open(sys.argv[2], buffering=OUTPUT_BLOCK_SIZE) as commands:
+                    run_batch(commands, out)
+            else:
+                run_batch(sys.stdin, out)
+        return
+
+
     name = input("\n\tEnter the employee's name: ")
     employee = Employee(name)
     emp2 = Employee("Biff")
@@ -26,7 +115,7 @@ def main():
         print("\t\tf - to fire")
         print("\t\th - to hire\n")
 
-        selection = input("\tEnter selection: ")[0]
+        selection = input("\tEnter selection: ")[:1]
         if selection == 'p':
             employee.promote()
         elif selection == 'd':
@@ -0,0 +1,167 @@
+###  This module defines the organisation hierarchy of the employees.
+#
+#  Employees are attached to the units (departments, teams) of a tree.
+#  Every unit keeps the payroll, headcount and number of hired employees of
+#  its whole subtree.  The tree listens to the salary of every attached
+#  employee and adds the change to the unit and each of its ancestors, so
+#  the totals of a unit are read in constant time and an update costs the
+#  depth of the tree.  Moving a subtree only updates the ancestors of its
+#  old and new position.
+
+
+## An organisation unit has a name, a parent, child units, employees and
+#  the totals of its subtree.
+#
+class OrgUnit:
+
+    def __init__(self, unit_name, parent=None):
+        self.name = unit_name
+        self.parent = parent
+        self.children = {}
+        self.employees = {}
+        self.payroll = 0
+        self.headcount = 0
+        self.hired_count = 0
+
+    ##
+    # @return string representation of object.
+    #
+    def __str__(self):
+        return ("Unit: " + self.name + ", payroll: " + str(self.payroll) +
+                ", headcount: " + str(self.headcount) + ", hired: " + str(self.hired_count))
+
+    ## Adds amounts to the totals of this unit and all its ancestors.
+    #
+    def _propagate(self, payroll, headcount, hired_count):
+        unit = self
+        while unit is not None:
+            unit.payroll += payroll
+            unit.headcount += headcount
+            unit.hired_count += hired_count
+            unit = unit.parent
+
+
+## An organisation tree has the units by name and where each employee is.
+#
+class OrgTree:
+
+    ## Constructs a tree with a root unit.
+    #  @param root_name the name of the root unit.
+    #
+    def __init__(self, root_name):
+        self.root = OrgUnit(root_name)
+        self._units = {root_name: self.root}
+        self._placement = {}    # employee name -> unit
+        self._recorded = {}     # employee name -> (salary, hired) in the totals
+
+    ## Returns a unit.
+    #  @exception KeyError if there is no unit with that name.
+    #
+    def unit(self, unit_name):
+        return self._units[unit_name]
+
+    ## Returns the unit an employee is attached to.
+    #
+    def unit_of(self, employee_name):
+        return self._placement[employee_name]
+
+    ## Adds a unit to the tree.
+    #  @param unit_name the name of the new unit, unique in the tree.
+    #  @param parent_name the name of the parent unit.
+    #  @return the new unit.
+    #
+    def add_unit(self, unit_name, parent_name):
+        if unit_name in self._units:
+            raise ValueError("Duplicate unit: " + unit_name)
+        parent = self._units[parent_name]
+        unit = OrgUnit(unit_name, parent)
+        parent.children[unit_name] = unit
+        self._units[unit_name] = unit
+        return unit
+
+    ## Removes an empty unit.
+    #  @exception ValueError if the unit is the root or is not empty.
+    #
+    def remove_unit(self, unit_name):
+        unit = self._units[unit_name]
+        if unit.parent is None or unit.children or unit.employees:
+            raise ValueError("Only an empty unit below the root can be removed: " + unit_name)
+        del unit.parent.children[unit_name]
+        del self._units[unit_name]
+
+    ## Moves a unit and its whole subtree under another parent.
+    #  @exception ValueError if the new parent is in the subtree.
+    #
+    def move_unit(self, unit_name, parent_name):
+        unit = self._units[unit_name]
+        parent = self._units[parent_name]
+        if unit.parent is None:
+            raise ValueError("The root unit cannot be moved")
+        ancestor = parent
+        while ancestor is not None:
+            if ancestor is unit:
+                raise ValueError("Cannot move " + unit_name + " below itself")
+            ancestor = ancestor.parent
+
+        unit.parent._propagate(-unit.payroll, -unit.headcount, -unit.hired_count)
+        del unit.parent.children[unit_name]
+        unit.parent = parent
+        parent.children[unit_name] = unit
+        parent._propagate(unit.payroll, unit.headcount, unit.hired_count)
+
+    ## Attaches an employee to a unit.
+    #  @exception ValueError if an employee with the same name is attached.
+    #
+    def attach(self, employee, unit_name):
+        if employee.name in self._placement:
+            raise ValueError("Duplicate name: " + employee.name)
+        unit = self._units[unit_name]
+        unit.employees[employee.name] = employee
+        self._placement[employee.name] = unit
+        self._recorded[employee.name] = (employee.salary, employee.isHired)
+        unit._propagate(employee.salary, 1, 1 if employee.isHired else 0)
+        employee.add_salary_listener(self._salary_changed)
+
+    ## Detaches an employee from the tree.
+    #
+    def detach(self, employee_name):
+        unit = self._placement.pop(employee_name)
+        employee = unit.employees.pop(employee_name)
+        (salary, hired) = self._recorded.pop(employee_name)
+        unit._propagate(-salary, -1, -1 if hired else 0)
+        employee.remove_salary_listener(self._salary_changed)
+        return employee
+
+    ## Moves an employee to another unit.
+    #
+    def move_employee(self, employee_name, unit_name):
+        employee = self.detach(employee_name)
+        self.attach(employee, unit_name)
+
+    ## Listener registered on every attached employee.
+    #
+    def _salary_changed(self, employee, old_salary, new_salary):
+        (salary, hired) = self._recorded[employee.name]
+        self._recorded[employee.name] = (new_salary, employee.isHired)
+        self._placement[employee.name]._propagate(
+            new_salary - salary, 0, int(employee.isHired) - int(hired))
+
+
+if __name__ == '__main__':
+    from employee_modulepy2 import Employee
+
+    tree = OrgTree('Company')
+    tree.add_unit('Sales', 'Company')
+    tree.add_unit('Europe', 'Sales')
+    tree.add_unit('IT', 'Company')
+    staff = [Employee(name) for name in ['Bellick', 'Biff', 'Scofield']]
+    tree.attach(staff[0], 'Europe')
+    tree.attach(staff[1], 'Europe')
+    tree.attach(staff[2], 'IT')
+    staff[0].promote()
+    staff[1].fire()
+    print(tree.unit('Sales'))
+    tree.move_unit('Europe', 'IT')
+    print(tree.unit('Sales'))
+    print(tree.unit('IT'))
+    print(tree.root)
@@ -0,0 +1,185 @@
+###  This module applies batches of payroll changes atomically.
+#
+#  A transaction collects promote, demote, raise, fire and hire operations
+#  on any number of employees.  When it is committed the engine locks the
+#  employees involved, in name order so that two transactions can never
+#  wait for each other, works out the new salaries and hired states on
+#  scratch copies and only then writes them back.  Either every operation
+#  of the transaction is applied or none is, and transactions on different
+#  employees run at the same time.
+#
+#  Run this module to benchmark the engine under contention.
+
+import threading
+
+from employee_modulepy2 import Employee
+
+
+## A payroll engine holds the employees and their locks.
+#
+class PayrollEngine:
+
+    ## Constructs an engine.
+    #  @param employees the Employee objects, with unique names.
+    #
+    def __init__(self, employees=()):
+        self._employees = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        for employee in employees:
+            self.add(employee)
+
+    def __len__(self):
+        return len(self._employees)
+
+    ## Adds an employee to the engine.
+    #  @exception ValueError if an employee with the same name was added.
+    #
+    def add(self, employee):
+        with self._registry_lock:
+            if employee.name in self._employees:
+                raise ValueError("Duplicate name: " + employee.name)
+            self._employees[employee.name] = employee
+            self._locks[employee.name] = threading.Lock()
+
+    ## Starts a transaction. Use it in a with statement to commit it at the
+    #  end of the block, or call commit().
+    #
+    def transaction(self):
+        return Transaction(self)
+
+    ## Returns the salary and hired state of an employee, read under its lock.
+    #
+    def read(self, employee_name):
+        employee = self._employees[employee_name]
+        with self._locks[employee_name]:
+            return (employee.salary, employee.isHired)
+
+    ## Returns the total of the salaries, read with every employee locked.
+    #
+    def total_payroll(self):
+        names = sorted(self._employees)
+        self._acquire(names)
+        try:
+            return sum(self._employees[name].salary for name in names)
+        finally:
+            self._release(names)
+
+    ## Applies the operations of a transaction atomically.
+    #  @param operations a list of (name, method name, arguments).
+    #  @exception KeyError if an employee is unknown, nothing is applied.
+    #
+    def _apply(self, operations):
+        names = sorted({name for (name, method, arguments) in operations})
+        for name in names:
+            if name not in self._employees:
+                raise KeyError(name)
+
+        self._acquire(names)
+        try:
+            scratch = {}
+            for name in names:
+                employee = self._employees[name]
+                copy = Employee(name)
+                copy.isHired = employee.isHired
+                copy.salary = employee.salary
+                scratch[name] = copy
+
+            for (name, method, arguments) in operations:
+                getattr(scratch[name], method)(*arguments)
+
+            for name in names:
+                employee = self._employees[name]
+                employee.isHired = scratch[name].isHired
+                employee.salary = scratch[name].salary
+        finally:
+            self._release(names)
+
+    def _acquire(self, names):
+        for name in names:
+            self._locks[name].acquire()
+
+    def _release(self, names):
+        for name in reversed(names):
+            self._locks[name].release()
+
+
+## A transaction is a batch of operations applied together by an engine.
+#
+class Transaction:
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def promote(self, employee_name):
+        self._operations.append((employee_name, 'promote', ()))
+
+    def demote(self, employee_name):
+        self._operations.append((employee_name, 'demote', ()))
+
+    def raise_salary_by(self, employee_name, pay_rise):
+        self._operations.append((employee_name, 'raise_salary_by', (pay_rise,)))
+
+    def fire(self, employee_name):
+        self._operations.append((employee_name, 'fire', ()))
+
+    def hire(self, employee_name):
+        self._operations.append((employee_name, 'hire', ()))
+
+    ## Applies the operations. The transaction is empty afterwards.
+    #
+    def commit(self):
+        operations = self._operations
+        self._operations = []
+        if operations:
+            self._engine._apply(operations)
+
+
+## Runs transactions promoting two random employees of a hot set from
+#  several threads and checks that no promotion was lost.
+#  @return the number of transactions per second.
+#
+def benchmark(threads, transactions, hot_set):
+    import random
+    import time
+
+    engine = PayrollEngine(Employee("emp" + str(i)) for i in range(hot_set))
+    names = ["emp" + str(i) for i in range(hot_set)]
+
+    def worker(seed):
+        generator = random.Random(seed)
+        for i in range(transactions):
+            with engine.transaction() as transaction:
+                for name in generator.sample(names, 2):
+                    transaction.promote(name)
+
+    pool = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    expected = (hot_set * Employee.DEFAULT_STARTING_SALARY
+                + threads * transactions * 2 * Employee.INCREMENT)
+    if engine.total_payroll() != expected:
+        raise AssertionError("Lost updates: {} != {}".format(engine.total_payroll(), expected))
+    return threads * transactions / elapsed
+
+
+if __name__ == '__main__':
+    for hot_set in [2, 16, 1024]:
+        for threads in [1, 4, 16]:
+            rate = benchmark(threads, 2000, hot_set)
+            print("hot set {:5d}, threads {:3d}: {:10.0f} transactions/s"
+                  .format(hot_set, threads, rate))
@@ -0,0 +1,181 @@
+###  This module keeps the salary history of employees.
+#
+#  Every change of a tracked employee's salary is appended to an event log
+#  as the change in salary.  Every CHECKPOINT_INTERVAL events a checkpoint
+#  of the running total is kept, so the salary at a given time is found by a
+#  binary search for the last checkpoint before it and a replay of at most
+#  CHECKPOINT_INTERVAL events.  The total payroll is kept the same way.
+
+from bisect import bisect_right
+import time
+
+
+CHECKPOINT_INTERVAL = 32
+
+
+## A timeline is an append-only log of changes to a running total.
+#
+class Timeline:
+
+    ## Constructs an empty timeline.
+    #  @param checkpoint_interval the number of events between checkpoints.
+    #
+    def __init__(self, checkpoint_interval=CHECKPOINT_INTERVAL):
+        if checkpoint_interval < 1:
+            raise ValueError("Invalid checkpoint interval: " + str(checkpoint_interval))
+        self._interval = checkpoint_interval
+        self._times = []
+        self._changes = []
+        self._checkpoints = []   # total after event i * interval
+        self._total = 0
+
+    def __len__(self):
+        return len(self._times)
+
+    ## Appends a change to the running total.
+    #  @param when the time of the change, not before the previous change.
+    #  @param change the amount added to the total.
+    #  @exception ValueError if the time is before the previous change.
+    #
+    def append(self, when, change):
+        if self._times and when < self._times[-1]:
+            raise ValueError("Events must be appended in time order")
+        self._times.append(when)
+        self._changes.append(change)
+        self._total += change
+        if (len(self._times) - 1) % self._interval == 0:
+            self._checkpoints.append(self._total)
+
+    ## Returns the position of the last event at or before a time, -1 if none.
+    #
+    def position_at(self, when):
+        return bisect_right(self._times, when) - 1
+
+    ## Returns the running total at a time, 0 before the first event.
+    #
+    def total_at(self, when):
+        i = self.position_at(when)
+        if i < 0:
+            return 0
+        checkpoint = i // self._interval
+        total = self._checkpoints[checkpoint]
+        for change in self._changes[checkpoint * self._interval + 1:i + 1]:
+            total += change
+        return total
+
+    ## Returns the running total after the last event.
+    #
+    def total(self):
+        return self._total
+
+    ## Returns the (time, change) events.
+    #
+    def events(self):
+        return list(zip(self._times, self._changes))
+
+
+## A salary ledger records the salary history of the employees it tracks.
+#
+class SalaryLedger:
+
+    ## Constructs an empty ledger.
+    #  @param clock a function returning the current time, time.time by default.
+    #         If it goes backwards, the changes are recorded at the time of
+    #         the previous change instead.
+    #  @param checkpoint_interval the number of events between checkpoints.
+    #
+    def __init__(self, clock=time.time, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self._clock = clock
+        self._interval = checkpoint_interval
+        self._salaries = {}     # name -> Timeline of the salary
+        self._hired = {}        # name -> list of the hired state after each event
+        self._payroll = Timeline(checkpoint_interval)
+        self._last_time = None  # time of the last change recorded
+
+    ## Starts recording the salary of an employee.
+    #  The current salary is recorded as the first event.
+    #  @exception ValueError if an employee with the same name is tracked.
+    #
+    def track(self, employee):
+        if employee.name in self._salaries:
+            raise ValueError("Duplicate name: " + employee.name)
+        self._salaries[employee.name] = Timeline(self._interval)
+        self._hired[employee.name] = []
+        self._record(employee, employee.salary)
+        employee.add_salary_listener(self._salary_changed)
+
+    ## Stops recording the salary of an employee. The history is kept.
+    #
+    def untrack(self, employee):
+        employee.remove_salary_listener(self._salary_changed)
+
+    ## Returns the salary of an employee at a time, None before it was tracked.
+    #  @exception KeyError if the employee has never been tracked.
+    #
+    def salary_at(self, employee_name, when):
+        salaries = self._salaries[employee_name]
+        if salaries.position_at(when) < 0:
+            return None
+        return salaries.total_at(when)
+
+    ## Returns whether an employee was hired at a time, None before it was tracked.
+    #  @exception KeyError if the employee has never been tracked.
+    #
+    def hired_at(self, employee_name, when):
+        i = self._salaries[employee_name].position_at(when)
+        if i < 0:
+            return None
+        return self._hired[employee_name][i]
+
+    ## Returns the total of the salaries of the tracked employees at a time.
+    #
+    def payroll_at(self, when):
+        return self._payroll.total_at(when)
+
+    ## Returns the (time, salary) history of an employee.
+    #
+    def history(self, employee_name):
+        salary = 0
+        history = []
+        for (when, change) in self._salaries[employee_name].events():
+            salary += change
+            history.append((when, salary))
+        return history
+
+    ## Listener registered on every tracked employee.
+    #
+    def _salary_changed(self, employee, old_salary, new_salary):
+        self._record(employee, new_salary - old_salary)
+
+    ## Records a change. Called from the salary listener, after the salary
+    #  has changed, so it must not raise: a clock going backwards is clamped.
+    #
+    def _record(self, employee, change):
+        when = self._clock()
+        if self._last_time is not None and when < self._last_time:
+            when = self._last_time
+        self._last_time = when
+        self._salaries[employee.name].append(when, change)
+        self._hired[employee.name].append(employee.isHired)
+        self._payroll.append(when, change)
+
+
+if __name__ == '__main__':
+    from employee_modulepy2 import Employee
+
+    day = [0]
+    ledger = SalaryLedger(clock=lambda: day[0], checkpoint_interval=4)
+    staff = [Employee(name) for name in ['Bellick', 'Biff']]
+    for employee in staff:
+        ledger.track(employee)
+    for day[0] in range(1, 100):
+        staff[day[0] % 2].promote()
+    day[0] = 100
+    staff[1].fire()
+    print(ledger.salary_at('Bellick', 50), ledger.salary_at('Biff', 50))
+    print(ledger.hired_at('Biff', 99), ledger.hired_at('Biff', 100))
+    print(ledger.payroll_at(0), ledger.payroll_at(50), ledger.payroll_at(100))
+
+    day[0] = 90     # the clock goes backwards
+    staff[0].promote()
+    print(staff[0].salary, ledger.salary_at('Bellick', 100), ledger.history('Bellick')[-1])
@@ -0,0 +1,176 @@
+###  This module projects the payroll of a group of employees.
+#
+#  Every year each hired employee may leave, be promoted or be demoted, and
+#  each employee who has left may be hired again, with the probabilities of
+#  a ProjectionRules object.  The changes follow the Employee rules: a
+#  promotion or a demotion moves the salary by INCREMENT, a salary never
+#  goes below zero, leaving sets it to zero and hiring sets it to
+#  DEFAULT_STARTING_SALARY.
+#
+#  The years are simulated for all the scenarios and employees at once, as
+#  NumPy array operations, and the scenarios are split into chunks which
+#  run in separate processes.  Each chunk draws its random numbers from its
+#  own child of one SeedSequence, so a projection gives the same result
+#  for the same seed whatever the number of processes.
+#
+#  Requires Python 3.8 or later and NumPy 1.17 or later, for
+#  numpy.random.default_rng and numpy.random.SeedSequence (see
+#  requirements.txt).
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from employee_modulepy2 import Employee
+
+
+## The yearly probabilities of the changes of an employee.
+#
+class ProjectionRules:
+
+    ## Constructs the rules.
+    #  @param promote the probability a hired employee is promoted.
+    #  @param demote the probability a hired employee is demoted.
+    #  @param leave the probability a hired employee leaves (is fired).
+    #  @param rehire the probability an employee who has left is hired again.
+    #  @exception ValueError if a probability is not between 0 and 1 or the
+    #             probabilities of a hired employee add up to more than 1.
+    #
+    def __init__(self, promote=0.1, demote=0.02, leave=0.05, rehire=0.0,
+                 increment=Employee.INCREMENT,
+                 starting_salary=Employee.DEFAULT_STARTING_SALARY):
+        for probability in (promote, demote, leave, rehire):
+            if not 0 <= probability <= 1:
+                raise ValueError("Probabilities must be between 0 and 1")
+        if promote + demote + leave > 1:
+            raise ValueError("promote + demote + leave must not be more than 1")
+        self.promote = promote
+        self.demote = demote
+        self.leave = leave
+        self.rehire = rehire
+        self.increment = increment
+        self.starting_salary = starting_salary
+
+
+## Returns the salaries and hired flags of employees as arrays.
+#  @param employees Employee objects or an EmployeeRoster.
+#
+def initial_state(employees):
+    if hasattr(employees, "payroll_state"):
+        (salaries, hired) = employees.payroll_state()
+    else:
+        employees = list(employees)
+        salaries = [employee.salary for employee in employees]
+        hired = [employee.isHired for employee in employees]
+    return (numpy.array(salaries, dtype=numpy.int64), numpy.array(list(hired), dtype=bool))
+
+
+## Simulates scenarios in this process.
+#  @param salaries the starting salaries, one per employee.
+#  @param hired the starting hired flags, one per employee.
+#  @param years the number of years.
+#  @param scenarios the number of scenarios.
+#  @param rules a ProjectionRules object.
+#  @param seed a numpy.random.SeedSequence or an integer.
+#  @return an array of the total payroll at the end of each year, with one
+#          row per year and one column per scenario.
+#
+def simulate(salaries, hired, years, scenarios, rules, seed=None):
+    generator = numpy.random.default_rng(seed)
+    salary = numpy.tile(numpy.asarray(salaries, dtype=numpy.int64), (scenarios, 1))
+    is_hired = numpy.tile(numpy.asarray(hired, dtype=bool), (scenarios, 1))
+    payrolls = numpy.empty((years, scenarios), dtype=numpy.int64)
+
+    promote_below = rules.leave + rules.promote
+    demote_below = promote_below + rules.demote
+    for year in range(years):
+        draw = generator.random(salary.shape)
+        leaving = is_hired & (draw < rules.leave)
+        promoted = is_hired & (draw >= rules.leave) & (draw < promote_below)
+        demoted = is_hired & (draw >= promote_below) & (draw < demote_below)
+        rehired = ~is_hired & (draw < rules.rehire)
+
+        salary += rules.increment * promoted
+        salary -= rules.increment * demoted
+        numpy.maximum(salary, 0, out=salary)
+        salary[leaving] = 0
+        salary[rehired] = rules.starting_salary
+        is_hired = (is_hired & ~leaving) | rehired
+        payrolls[year] = salary.sum(axis=1)
+    return payrolls
+
+
+## Projects the payroll, running chunks of scenarios in several processes.
+#  @param employees Employee objects or an EmployeeRoster.
+#  @param years the number of years.
+#  @param scenarios the number of scenarios.
+#  @param rules a ProjectionRules object, the default rules if None.
+#  @param seed an integer making the projection repeatable, None for a
+#         random projection.
+#  @param workers the number of processes, the number of CPUs if None and
+#         1 to run in this process.
+#  @param chunk_size the number of scenario × employee trajectories
+#         simulated at once by a process.
+#  @return an array of the total payroll at the end of each year, with one
+#          row per year and one column per scenario.
+#
+def project(employees, years, scenarios, rules=None, seed=None, workers=None,
+            chunk_size=1000000):
+    if rules is None:
+        rules = ProjectionRules()
+    (salaries, hired) = initial_state(employees)
+    per_chunk = max(1, chunk_size // max(1, len(salaries)))
+    sizes = [min(per_chunk, scenarios - start) for start in range(0, scenarios, per_chunk)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(salaries, hired, years, size, rules, child) for (size, child) in zip(sizes, seeds)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) == 1:
+        results = [simulate(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = list(executor.map(_simulate, jobs))
+    return numpy.concatenate(results, axis=1) if results \
+        else numpy.empty((years, 0), dtype=numpy.int64)
+
+
+def _simulate(job):
+    return simulate(*job)
+
+
+## Summarises the payroll of each year.
+#  @param payrolls the array returned by project().
+#  @param percentiles the percentiles wanted.
+#  @return a list of dictionaries, one per year, with the mean and the
+#          percentiles of the payroll.
+#
+def summarise(payrolls, percentiles=(5, 50, 95)):
+    summary = []
+    for year in payrolls:
+        row = {"mean": float(year.mean())}
+        for (percentile, value) in zip(percentiles, numpy.percentile(year, percentiles)):
+            row["p" + str(percentile)] = float(value)
+        summary.append(row)
+    return summary
+
+
+if __name__ == '__main__':
+    import time
+
+    staff = [Employee("emp" + str(i)) for i in range(100)]
+    staff[0].setIsHired(False)
+    rules = ProjectionRules(promote=0.15, demote=0.05, leave=0.08, rehire=0.3)
+
+    start = time.perf_counter()
+    payrolls = project(staff, 10, 10000, rules, seed=42)
+    elapsed = time.perf_counter() - start
+    print("{} scenarios x {} employees x {} years in {:.2f} s"
+          .format(payrolls.shape[1], len(staff), payrolls.shape[0], elapsed))
+    for (year, row) in enumerate(summarise(payrolls), 1):
+        print("year {:2d}: mean {:10.0f}  p5 {:10.0f}  p50 {:10.0f}  p95 {:10.0f}"
+              .format(year, row["mean"], row["p5"], row["p50"], row["p95"]))
+
+    same = project(staff, 10, 10000, rules, seed=42, workers=1)
+    print("Same result in one process:", bool((same == payrolls).all()))